@@ -2,6 +2,10 @@
 ASGI config for hackathon_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve through it (e.g. ``uvicorn hackathon_backend.asgi:application``) when
+coordinators keep the live gate-stats stream open: under ASGI each stream waits
+on the event loop instead of occupying a worker thread. Set ASYNC_GATE_VIEWS=1
+as well to serve the scanner endpoints with the async views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'invitations.metrics.MetricsMiddleware', # request timing and SQL counts, see /api/admin/metrics/
     'corsheaders.middleware.CorsMiddleware', # CORS middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -80,13 +82,138 @@ WSGI_APPLICATION = 'hackathon_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=sqlite (default) or postgres; compare them under concurrent scans with 'manage.py bench_db'.
+
+# SQLite: IMMEDIATE takes the write lock at BEGIN (a deferred transaction that upgrades
+# to a write fails at once with "database is locked" instead of waiting), and writers
+# queue for up to 'timeout' seconds.
+SQLITE_OPTIONS = {
+    'timeout': int(os.environ.get('SQLITE_TIMEOUT', 20)),
+    'transaction_mode': 'IMMEDIATE',
+}
+# SQLITE_WAL=1 also switches to WAL, which lets scans read while another request writes;
+# synchronous=NORMAL is durable across crashes of the app in WAL mode, a power cut may lose
+# the last commits. Opt-in because journal_mode=WAL is persistent: it rewrites the database
+# file header and adds -wal/-shm files next to it, so a copied db.sqlite3 then needs those
+# files too. Use it on a deployed database, not the development one checked into the repo.
+SQLITE_WAL_INIT_COMMAND = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL'
+if os.environ.get('SQLITE_WAL') == '1':
+    SQLITE_OPTIONS['init_command'] = SQLITE_WAL_INIT_COMMAND
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'hackathon'),
+            'USER': os.environ.get('POSTGRES_USER', 'hackathon'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Keep connections open between requests instead of reconnecting for every scan
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # psycopg 3 connection pool shared by the threads of a worker; replaces persistent connections
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+            'timeout': 10,
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_OPTIONS,
+        }
+    }
+
+
+# Cache
+# Local memory is per process. With several workers point this at a shared backend
+# (e.g. 'django.core.cache.backends.redis.RedisCache') so pass invalidations reach every worker.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # The default of 300 entries culls verify_qr responses as soon as more passes are scanned
+        'OPTIONS': {'MAX_ENTRIES': 20000},
     }
 }
 
+# verify_qr response cache (see invitations/pass_cache.py)
+PASS_CACHE_ALIAS = 'default'
+PASS_CACHE_TIMEOUT = 30  # seconds; also bounds staleness across workers on a local-memory cache
+# Scans check suspensions against an in-memory set, reloaded this often per worker (see invitations/suspensions.py)
+SUSPENSION_REFRESH_SECONDS = 5
+# Lift expired timed suspensions on a background thread in each web process at this interval;
+# leave unset when 'manage.py expire_suspensions' runs from cron instead
+SUSPENSION_SWEEP_SECONDS = int(os.environ['SUSPENSION_SWEEP_SECONDS']) if os.environ.get('SUSPENSION_SWEEP_SECONDS') else None
+
+
+# Signed pass tokens (see invitations/tokens.py). Gate devices that validate passes
+# offline need the same key, so set a dedicated one rather than reusing SECRET_KEY.
+PASS_SIGNING_KEY = os.environ.get('PASS_SIGNING_KEY') or SECRET_KEY
+PASS_TOKEN_GRACE_HOURS = 24  # dated, non-persistent events: passes expire this long after the event date
+PASS_CHANGES_PAGE_SIZE = 1000
+# Delta cursors stop short of changes younger than this, which a slower transaction could
+# still commit below (see invitations/offline_sync.py); keep it above the longest write
+PASS_CHANGES_SETTLE_SECONDS = 30
+
+# Gate entry log (see invitations/entry_log.py). Scans are buffered in-process and
+# bulk-inserted once ENTRY_LOG_BATCH_SIZE are pending or the oldest is ENTRY_LOG_FLUSH_SECONDS old.
+ENTRY_LOG_BATCH_SIZE = 200
+ENTRY_LOG_FLUSH_SECONDS = 2.0
+ENTRY_LOG_MAX_BUFFER = 100000  # entries kept while the database is unreachable; newer ones are dropped
+ENTRY_UPLOAD_MAX = 5000  # entries per /api/admin/entries/upload/ request from offline gate devices
+
+# Bulk user import (manage.py import_users, /api/admin/import-users/; see invitations/user_import.py)
+USER_IMPORT_BATCH_SIZE = 500  # rows per insert transaction
+USER_IMPORT_PROCESSES = None  # password hashing processes; defaults to the CPU count
+USER_IMPORT_MAX_PHOTO_BYTES = 10 * 1024 * 1024
+
+EXPORT_CHUNK_SIZE = 2000  # rows fetched and sent per block by /api/admin/export/ downloads
+
+# Refuse a second entry to the same event within this many seconds (0 = off). Per process.
+ANTI_PASSBACK_SECONDS = int(os.environ.get('ANTI_PASSBACK_SECONDS', 0))
+
+# Live gate counters (see invitations/gate_stats.py), per process.
+# /api/admin/gate-stats/stream/ pushes them as server-sent events; serve it through asgi.py.
+GATE_STATS_WINDOW_SECONDS = 60  # scans_per_minute is averaged over this window
+GATE_STATS_LATENCY_SAMPLES = 500  # recent verification timings kept per method
+GATE_STATS_PUSH_SECONDS = 1.0  # at most one push per stream this often
+GATE_STATS_KEEPALIVE_SECONDS = 15
+GATE_STATS_STREAM_SECONDS = 300  # streams are closed after this long; EventSource reconnects
+
+# Serve verify-qr, face-recognize and my-qr with the async views in invitations/async_views.py.
+# Only worth it under ASGI (asgi.py); leave off when serving through wsgi.py.
+ASYNC_GATE_VIEWS = os.environ.get('ASYNC_GATE_VIEWS') == '1'
+ASYNC_FACE_THREADS = None  # inference threads for the async face view; defaults to min(32, CPUs + 4)
+
+
+# Request metrics (see invitations/metrics.py). Set METRICS_SLOW_REQUEST_SECONDS to log
+# the SQL and profile of sampled requests slower than that.
+METRICS_SLOW_REQUEST_SECONDS = float(os.environ['METRICS_SLOW_REQUEST_SECONDS']) if os.environ.get('METRICS_SLOW_REQUEST_SECONDS') else None
+METRICS_SLOW_SAMPLE_RATE = 0.01  # share of requests sampled (SQL kept, run under cProfile)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'invitations': {'handlers': ['console'], 'level': os.environ.get('APP_LOG_LEVEL', 'INFO')},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -126,6 +253,30 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Face recognition
+# Set FACE_WARMUP=1 on web workers to load the face model at startup instead of on the first scan
+FACE_WARMUP = os.environ.get('FACE_WARMUP') == '1'
+# How often a worker checks the FaceEmbedding table for enrollments made by other workers
+FACE_INDEX_REFRESH_SECONDS = 5
+# Index used for face lookups. Switch to 'invitations.ann.IVFIndex' for approximate
+# search at large scale, e.g. FACE_INDEX_OPTIONS = {'nprobe': 8, 'path': MEDIA_ROOT / 'face_index'}
+FACE_INDEX_BACKEND = 'invitations.face_index.FaceIndex'
+FACE_INDEX_OPTIONS = {}
+# Optional out-of-process inference service ('manage.py face_worker'): "host:port" or a
+# unix socket path. Unset = run inference in the request thread.
+FACE_WORKER_ADDRESS = os.environ.get('FACE_WORKER_ADDRESS')
+FACE_WORKER_TIMEOUT = 10  # seconds a request may wait for an embedding, queueing included
+FACE_WORKER_PROCESSES = None  # defaults to the CPU count
+FACE_WORKER_QUEUE_SIZE = 64  # requests beyond this are rejected with 503
+FACE_WORKER_BATCH_SIZE = 8
+FACE_WORKER_BATCH_WAIT_MS = 10
+# Maximum cosine distance accepted as a match for VGG-Face
+FACE_MATCH_THRESHOLD = 0.68
+# Uploads are decoded in memory and downscaled so their longest side is at most this before detection
+FACE_DETECT_MAX_SIDE = 640
+# Upper bound on frames accepted by /api/admin/face-recognize-group/
+FACE_GROUP_MAX_FRAMES = 8
+
 # Custom User Model
 # AUTH_USER_MODEL = 'invitations.CustomUser'
 
@@ -137,14 +288,31 @@ CORS_ALLOWED_ORIGINS = [
 
 # Email Backend (SMTP)
 # For Gmail: Use App Password, not real password.
+# For local testing point EMAIL_HOST/EMAIL_PORT at a stand-in such as
+# `python -m aiosmtpd -n -l localhost:1025` with EMAIL_USE_TLS=0 and empty EMAIL_HOST_USER.
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_HOST = 'smtp.gmail.com'
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '1') == '1'
 # Replace with your actual email and app password
 # Recommended: Use os.environ.get('EMAIL_USER') and os.environ.get('EMAIL_PASS')
-EMAIL_HOST_USER = 'rishith292@gmail.com' 
-EMAIL_HOST_PASSWORD = 'kufdwrptcabegkyq'
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', 'rishith292@gmail.com')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', 'kufdwrptcabegkyq')
+
+# Pooled SMTP connections shared by single and bulk invites (see invitations/mail_pool.py)
+MAIL_POOL_SIZE = 2  # connections kept open per process
+MAIL_POOL_MAX_MESSAGES = 100  # reconnect after this many messages on one session
+MAIL_POOL_IDLE_CHECK_SECONDS = 30  # NOOP-probe a connection idle for longer than this before reusing it
+
+# Bulk invite email queue, delivered by 'manage.py send_invites' (see invitations/invites.py)
+INVITE_EMAIL_RATE = 5  # messages per second per worker; keep under the mail provider's limit
+INVITE_EMAIL_BATCH_SIZE = 50  # emails claimed per round
+INVITE_EMAIL_MAX_ATTEMPTS = 5
+INVITE_EMAIL_RETRY_SECONDS = 60  # first retry delay, doubled on each further failure
+INVITE_EMAIL_LEASE_SECONDS = 300  # a claimed email is retried by another worker after this long
+# Fix the QR mask pattern (0-7) for ~6x faster pass image rendering, e.g. while a large bulk
+# invite run renders its images; unset keeps qrcode's search for the most scanner-friendly mask
+QR_MASK_PATTERN = int(os.environ['QR_MASK_PATTERN']) if os.environ.get('QR_MASK_PATTERN') else None
 
 # DRF Configuration
 REST_FRAMEWORK = {
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+from django.utils.dateparse import parse_datetime
+
+from .face_index import FaceIndex, normalize, top_k
+
+logger = logging.getLogger(__name__)
+
+
+def default_nlist(n):
+    # ~4*sqrt(n) clusters, keeping at least ~39 training points per centroid
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def assign(matrix, centroids, chunk_size=8192):
+    """Nearest centroid (by cosine similarity) for every row, computed in chunks."""
+    if centroids is None or len(matrix) == 0:
+        return np.zeros(len(matrix), dtype=np.int32)
+    out = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), chunk_size):
+        out[start:start + chunk_size] = np.argmax(matrix[start:start + chunk_size] @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(matrix, nlist, sample_size=20000, iters=10, seed=0):
+    """Spherical k-means on a sample of the (already normalised) embeddings."""
+    rng = np.random.default_rng(seed)
+    if len(matrix) > sample_size:
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+    else:
+        sample = np.asarray(matrix)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = assign(sample, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=nlist)
+        present = np.flatnonzero(counts)
+        offsets = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+        sums = np.add.reduceat(sample[order], offsets, axis=0)
+        centroids[present] = normalize(sums)
+        # Re-seed empty clusters from random points so every list stays useful
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+def group(assignments, nlist):
+    """CSR-style inverted lists: row positions sorted by cluster plus per-cluster offsets."""
+    order = np.argsort(assignments, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+    return order, offsets
+
+
+class IVFIndex(FaceIndex):
+    """
+    Inverted-file (IVF) approximate index. Embeddings are clustered around
+    ``nlist`` k-means centroids; a query is compared with the centroids and
+    then only with the faces in the ``nprobe`` closest clusters, so cost grows
+    with nprobe/nlist of the enrolled set instead of all of it.
+
+    Knobs: ``nprobe`` trades recall for latency (nprobe == nlist is an exact
+    scan); ``nlist`` defaults to ~4*sqrt(n). Below ``min_train_size`` faces
+    the index stays untrained and searches exhaustively.
+
+    With ``path`` set the trained index is persisted as plain .npy files that
+    are memory-mapped on startup, then topped up from the FaceEmbedding table.
+    """
+
+    def __init__(self, ids=None, vectors=None, nlist=None, nprobe=8, min_train_size=1000,
+                 train_sample=20000, train_iters=10, seed=0, path=None):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.train_sample = train_sample
+        self.train_iters = train_iters
+        self.seed = seed
+        self.path = str(path) if path else None
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.order, self.offsets = group(self.assignments, 1)
+        # Searches only take the snapshot lock; writers are serialised here
+        self._write_lock = threading.RLock()
+        super().__init__(ids, vectors)
+
+    @classmethod
+    def load(cls, **options):
+        index = cls(**options)
+        if index.path and os.path.exists(os.path.join(index.path, 'meta.json')):
+            try:
+                index.restore(index.path)
+                index.sync_from_db()
+                return index
+            except Exception as e:
+                logger.warning("Rebuilding face index; could not load %s: %s", index.path, e)
+        index.reload_from_db()
+        if index.path:
+            index.save(index.path)
+        return index
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self):
+        """(Re)cluster the current embeddings and rebuild the inverted lists."""
+        with self._write_lock:
+            with self._lock:
+                matrix = self.matrix
+            if len(matrix) < max(self.min_train_size, 1):
+                return
+            nlist = min(self.nlist or default_nlist(len(matrix)), len(matrix))
+            centroids = train_centroids(matrix, nlist, self.train_sample, self.train_iters, self.seed)
+            self._publish(self.ids, matrix, centroids, assign(matrix, centroids))
+
+    def _publish(self, ids, matrix, centroids, assignments):
+        order, offsets = group(assignments, len(centroids) if centroids is not None else 1)
+        with self._lock:
+            self.ids, self.matrix = ids, matrix
+            self.centroids, self.assignments = centroids, assignments
+            self.order, self.offsets = order, offsets
+
+    def replace(self, ids, vectors):
+        with self._write_lock:
+            ids = np.asarray(ids, dtype=np.int64)
+            if vectors is None or len(ids) == 0:
+                matrix = np.empty((0, 0), dtype=np.float32)
+            else:
+                matrix = np.ascontiguousarray(normalize(vectors))
+            centroids = getattr(self, 'centroids', None)
+            if centroids is not None and matrix.shape[1:] != centroids.shape[1:]:
+                centroids = None
+            self._publish(ids, matrix, centroids, assign(matrix, centroids))
+            if centroids is None and len(ids) >= self.min_train_size:
+                self.train()
+
+    def upsert(self, profile_id, vector):
+        with self._write_lock:
+            vector = normalize(vector)
+            with self._lock:
+                ids, matrix, centroids, assignments = self.ids, self.matrix, self.centroids, self.assignments
+            keep = ids != profile_id
+            label = assign(vector[None, :], centroids)
+            matrix = self._append_row(matrix if keep.all() else matrix[keep], vector)
+            self._publish(np.append(ids[keep], np.int64(profile_id)), matrix, centroids,
+                          np.append(assignments[keep], label).astype(np.int32))
+            if centroids is None and len(matrix) >= self.min_train_size:
+                self.train()
+
+    def remove(self, profile_id):
+        with self._write_lock:
+            with self._lock:
+                ids, matrix, centroids, assignments = self.ids, self.matrix, self.centroids, self.assignments
+            keep = ids != profile_id
+            if keep.all():
+                return
+            self._publish(ids[keep], np.ascontiguousarray(matrix[keep]), centroids, assignments[keep])
+
+    def search(self, embedding, k=1, nprobe=None):
+        with self._lock:
+            ids, matrix, centroids = self.ids, self.matrix, self.centroids
+            order, offsets = self.order, self.offsets
+        if len(ids) == 0:
+            return []
+        query = normalize(embedding)
+        nprobe = nprobe or self.nprobe
+        if centroids is None or nprobe >= len(centroids):
+            return top_k(ids, 1.0 - matrix @ query, k)
+
+        probes = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes])
+        if len(rows) == 0:
+            return []
+        return top_k(ids, 1.0 - matrix[rows] @ query, k, rows=rows)
+
+    def search_batch(self, embeddings):
+        with self._lock:
+            centroids = self.centroids
+        if centroids is None or self.nprobe >= len(centroids):
+            return super().search_batch(embeddings)
+        results = []
+        for embedding in embeddings:
+            hits = self.search(embedding, k=1)
+            results.append(hits[0] if hits else None)
+        return results
+
+    def save(self, path):
+        """Write the index as .npy files; meta.json is written last so partial saves are ignored."""
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            ids, matrix, centroids, assignments = self.ids, self.matrix, self.centroids, self.assignments
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        np.save(os.path.join(path, 'ids.npy'), ids)
+        np.save(os.path.join(path, 'matrix.npy'), matrix)
+        np.save(os.path.join(path, 'assignments.npy'), assignments)
+        if centroids is not None:
+            np.save(os.path.join(path, 'centroids.npy'), centroids)
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'count': int(len(ids)),
+                'trained': centroids is not None,
+                'synced_to': self.synced_to.isoformat() if self.synced_to else None,
+            }, f)
+
+    def restore(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        ids = np.load(os.path.join(path, 'ids.npy'))
+        # Memory-mapped so startup doesn't wait on reading every vector
+        matrix = np.load(os.path.join(path, 'matrix.npy'), mmap_mode='r')
+        assignments = np.load(os.path.join(path, 'assignments.npy'))
+        centroids = np.load(os.path.join(path, 'centroids.npy')) if meta['trained'] else None
+        if len(ids) != meta['count']:
+            raise ValueError("index files are inconsistent")
+        self._publish(ids, matrix, centroids, assignments)
+        self.synced_to = parse_datetime(meta['synced_to']) if meta['synced_to'] else None
@@ -1,5 +1,23 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class InvitationsConfig(AppConfig):
     name = 'invitations'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Opt-in (FACE_WARMUP=1 on web workers only): build the face model before
+        # traffic arrives. The index needs the database, so it loads on first use
+        # or via 'manage.py warm_face_model'.
+        if getattr(settings, 'FACE_WARMUP', False):
+            from .face_index import warm_up
+            try:
+                warm_up(load_index=False)
+            except Exception as e:
+                logger.warning("Face model warm-up failed: %s", e)
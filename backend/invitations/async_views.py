@@ -0,0 +1,192 @@
+"""
+Async versions of the scanner-facing endpoints, used when ASYNC_GATE_VIEWS is on.
+
+verify_qr, face_recognize and my-qr are hit by every gate device and app
+at once. Served through asgi.py these views wait on the cache, the database
+(async ORM) and face inference without holding a worker thread, so one
+process can keep hundreds of scanner connections open. Inference runs in a
+dedicated thread pool (ASYNC_FACE_THREADS) so it never blocks the event loop.
+
+They answer exactly like their DRF counterparts in views.py: both hand the
+decision to scans.py and differ only in how they fetch. DRF views are
+sync-only, so authentication (token header, or session plus CSRF) is done
+here. Under WSGI they still work, but gain nothing; keep the setting off
+there. Compare both with 'manage.py bench_gate_concurrency'.
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import CSRFCheck
+from rest_framework.authtoken.models import Token
+
+from . import gate_stats, metrics, pass_cache, scans, suspensions
+from .face_index import get_index
+from .face_worker import FaceWorkerError, embed_image
+from .models import Pass, UserProfile
+from .serializers import PassSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def respond(data, status=200, headers=None):
+    return JsonResponse(data, status=status, headers=headers, encoder=DjangoJSONEncoder, safe=False)
+
+
+async def authenticate(request):
+    """(user, None), or (None, error response) the way DRF's Token/SessionAuthentication would answer."""
+    auth = request.headers.get('Authorization', '').split()
+    if auth and auth[0].lower() == 'token':
+        if len(auth) != 2:
+            return None, respond({"detail": "Invalid token header."}, 401, {"WWW-Authenticate": "Token"})
+        try:
+            token = await Token.objects.select_related('user').aget(key=auth[1])
+        except Token.DoesNotExist:
+            return None, respond({"detail": "Invalid token."}, 401, {"WWW-Authenticate": "Token"})
+        if not token.user.is_active:
+            return None, respond({"detail": "User inactive or deleted."}, 401, {"WWW-Authenticate": "Token"})
+        return token.user, None
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None, respond({"detail": "Authentication credentials were not provided."}, 401,
+                             {"WWW-Authenticate": "Token"})
+    # Cookie sessions need the CSRF token on writes, as with DRF's SessionAuthentication
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    reason = check.process_view(request, None, (), {})
+    if reason:
+        return None, respond({"detail": f"CSRF Failed: {reason}"}, 403)
+    return user, None
+
+
+def read_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+def async_api(methods, gate_method=None):
+    """
+    Wrap an ``async def view(request, data)``: method check, authentication, body
+    parsing and, for gate endpoints, the live gate counters (gate_stats.observe).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return respond({"detail": f'Method "{request.method}" not allowed.'}, 405)
+            user, error = await authenticate(request)
+            if error:
+                return error
+            request.user = user
+            data = read_data(request)
+            if not isinstance(data, dict):
+                return respond({"detail": "JSON parse error."}, 400)
+            started = time.perf_counter()
+            response = await view(request, data, *args, **kwargs)
+            if gate_method:
+                # Only rejections are told apart by their body
+                body = json.loads(response.content) if response.status_code >= 300 else None
+                gate_stats.observe(gate_method, data.get('gate'), response.status_code, body,
+                                   time.perf_counter() - started)
+            return response
+        # Token clients send no CSRF token; session requests are checked in authenticate()
+        return csrf_exempt(wrapper)
+    return decorator
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(getattr(settings, 'ASYNC_FACE_THREADS', None), thread_name_prefix='face')
+    return _executor
+
+
+def match_face(index, image):
+    embedding = embed_image(image)
+    with metrics.timed('search'):
+        return index.match(embedding)
+
+
+def scan_response(outcome):
+    return respond(*outcome)
+
+
+async def get_blocked():
+    return suspensions.fresh() or await sync_to_async(suspensions.get_blocked)()
+
+
+@async_api(['POST'], gate_method='qr')
+async def verify_qr(request, data):
+    if not request.user.is_staff:
+        return respond({"detail": "Unauthorized"}, 403)
+
+    qr_data = data.get('qr_data')
+    refused = scans.check_qr(qr_data)
+    if refused:
+        return scan_response(refused)
+
+    try:
+        entry = await pass_cache.aload(qr_data)
+    except Pass.DoesNotExist:
+        return scan_response(scans.INVALID_QR)
+    return scan_response(scans.admit_pass(entry, await get_blocked(), gate=data.get('gate'),
+                                          coordinator_id=request.user.id))
+
+
+@async_api(['POST'], gate_method='face')
+async def face_recognize(request, data):
+    if 'image' not in request.FILES:
+        return respond({"detail": "Image required."}, 400)
+
+    try:
+        index = await sync_to_async(get_index)()
+        if len(index) == 0:
+            return scan_response(scans.NO_FACES_ENROLLED)
+
+        try:
+            hit = await asyncio.get_running_loop().run_in_executor(
+                get_executor(), match_face, index, request.FILES['image'].read())
+        except ValueError:
+            return scan_response(scans.NO_FACE_DETECTED)
+        except FaceWorkerError as e:
+            return scan_response(scans.worker_error(e))
+        if hit is None:
+            return scan_response(scans.NO_MATCH)
+
+        profile_id, distance = hit
+        try:
+            profile = await UserProfile.objects.select_related('user').aget(id=profile_id)
+        except UserProfile.DoesNotExist:
+            return scan_response(scans.profile_missing(profile_id))
+
+        passes = [p async for p in Pass.objects.filter(user_id=profile.user_id, is_active=True).select_related('event')]
+        return scan_response(scans.admit_face(profile, distance, passes, await get_blocked(),
+                                              event_id=data.get('event') or None, gate=data.get('gate'),
+                                              coordinator_id=request.user.id))
+    except Exception as e:
+        logger.exception("Face recognition failed")
+        return respond({"detail": str(e)}, 500)
+
+
+@async_api(['GET'])
+async def my_qr(request, data):
+    passes = [p async for p in Pass.objects.filter(user=request.user, is_active=True).select_related('event')]
+    if passes:
+        return respond(PassSerializer(passes, many=True).data)
+    return respond({"detail": "No active pass found."}, 404)
@@ -0,0 +1,87 @@
+"""
+Synthetic data for benchmarks and load tests.
+
+``seed()`` bulk-creates users with profiles, events and signed passes,
+bypassing signals: profile photos are a few generated images shared
+round-robin, and face embeddings are random unit vectors written straight
+to FaceEmbedding, so seeding needs no face model. Everything seeded is
+named after ``tag`` so ``unseed()`` can remove it again.
+"""
+import io
+import uuid
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from . import tokens
+from .face_index import MODEL_NAME, normalize
+from .models import Event, FaceEmbedding, UserProfile
+
+User = get_user_model()
+
+EMBEDDING_DIM = 4096  # VGG-Face
+
+
+def synthetic_photo(seed, size=160):
+    """JPEG bytes of a smooth random image; distinct per seed."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize((size, size), Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def seed(users=1000, events=5, passes_per_user=2, photos=20, faces=0, tag=None, rng_seed=0):
+    """
+    Create ``users`` users (with profiles) and ``events`` events, give every
+    user a pass to each of the first ``passes_per_user`` events, and enroll
+    random embeddings for the first ``faces`` profiles. Returns a dict of the
+    tag, users, events, passes and photo names.
+    """
+    tag = tag or uuid.uuid4().hex[:8]
+    rng = np.random.default_rng(rng_seed)
+    photo_names = [default_storage.save(f"profile_photos/bench_{tag}_{i}.jpg", ContentFile(synthetic_photo(rng_seed + i)))
+                   for i in range(photos)]
+
+    User.objects.bulk_create([User(username=f"bench-{tag}-{i}", email=f"bench-{tag}-{i}@example.com", password='!')
+                              for i in range(users)], batch_size=2000)
+    seeded_users = list(User.objects.filter(username__startswith=f"bench-{tag}-").order_by('id'))
+    UserProfile.objects.bulk_create([
+        UserProfile(user=u, role=('student', 'guest', 'staff')[i % 3],
+                    student_type='external' if i % 4 == 0 else 'internal',
+                    college_name=f"College {i % 10}", photo=photo_names[i % photos] if photos else None)
+        for i, u in enumerate(seeded_users)
+    ], batch_size=2000)
+    seeded_events = [Event.objects.create(name=f"Bench {tag} {i}") for i in range(events)]
+
+    passes = []
+    for event in seeded_events[:passes_per_user]:
+        created, _ = tokens.create_passes(seeded_users, event)
+        passes += created
+
+    if faces:
+        enroll_random_faces(seeded_users[:faces], rng)
+    return {'tag': tag, 'users': seeded_users, 'events': seeded_events, 'passes': passes, 'photos': photo_names}
+
+
+def enroll_random_faces(users, rng):
+    profiles = UserProfile.objects.filter(user__in=users).values_list('id', 'photo')
+    vectors = normalize(rng.standard_normal((len(profiles), EMBEDDING_DIM), dtype=np.float32))
+    FaceEmbedding.objects.bulk_create([
+        FaceEmbedding(profile_id=profile_id, model_name=MODEL_NAME, photo_name=photo or '', vector=vector.tobytes())
+        for (profile_id, photo), vector in zip(profiles, vectors)
+    ], batch_size=1000)
+
+
+def unseed(tag):
+    User.objects.filter(username__startswith=f"bench-{tag}-").delete()
+    Event.objects.filter(name__startswith=f"Bench {tag} ").delete()
+    _, files = default_storage.listdir('profile_photos')
+    for name in files:
+        if name.startswith(f"bench_{tag}_"):
+            default_storage.delete(f"profile_photos/{name}")
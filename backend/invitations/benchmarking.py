@@ -0,0 +1,31 @@
+import time
+
+
+def percentile(samples, pct):
+    # Nearest-rank percentile, good enough for latency reports
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Latency summary (in milliseconds) for a list of durations in seconds."""
+    ms = [s * 1000.0 for s in samples]
+    return {
+        "count": len(ms),
+        "mean_ms": sum(ms) / len(ms) if ms else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+    }
+
+
+def time_calls(fn, args_iter):
+    samples = []
+    for args in args_iter:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
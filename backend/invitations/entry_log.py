@@ -0,0 +1,218 @@
+"""
+Gate entry logging off the scan path.
+
+``record()`` appends an EntryLog to an in-process buffer and returns at
+once. A background thread bulk-inserts the buffer when it holds
+ENTRY_LOG_BATCH_SIZE entries or its oldest entry is ENTRY_LOG_FLUSH_SECONDS
+old, and once more at exit. If the database is unreachable the entries are
+kept (up to ENTRY_LOG_MAX_BUFFER) and retried on the next flush. If the
+batch is rejected by a constraint it is written row by row. A pass, event
+or coordinator deleted since the scan (say the pass was revoked) is nulled,
+as on_delete=SET_NULL would have done to a row already written; only rows
+that still fail, such as those of a deleted user, are logged and dropped.
+
+Anti-passback: with ANTI_PASSBACK_SECONDS > 0 a person who entered an
+event is refused again for that long. The check is served from an in-memory
+map of recent entries, so it is per process; put a sticky load balancer in
+front of the gates (or run one worker) if it must hold across workers.
+"""
+import atexit
+import collections
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from . import gate_stats
+from .models import EntryLog
+
+logger = logging.getLogger(__name__)
+
+GATE_MAX_LENGTH = EntryLog._meta.get_field('gate').max_length
+
+
+class RecentEntries:
+    """Last entry time per (user, event), forgetting anything older than the window."""
+
+    def __init__(self, window):
+        self.window = window
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_and_add(self, key, now=None):
+        """None if ``key`` may enter (and records it), else seconds since its previous entry."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # Oldest first, so pruning stops at the first entry still inside the window
+            while self._seen:
+                oldest_key, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.window:
+                    break
+                del self._seen[oldest_key]
+            seen_at = self._seen.get(key)
+            if seen_at is not None:
+                return now - seen_at
+            self._seen[key] = now
+            return None
+
+    def forget(self, key):
+        with self._lock:
+            self._seen.pop(key, None)
+
+
+class EntryBuffer:
+    def __init__(self, batch_size=200, flush_seconds=2.0, max_buffer=100000):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self._entries = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def add(self, entry):
+        with self._lock:
+            if len(self._entries) >= self.max_buffer:
+                self.dropped += 1
+                return
+            if not self._entries:
+                self._oldest = time.monotonic()
+            self._entries.append(entry)
+            full = len(self._entries) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='entry-log-flusher', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            with self._lock:
+                due = self._entries and (len(self._entries) >= self.batch_size
+                                         or time.monotonic() - self._oldest >= self.flush_seconds)
+            if due:
+                self.flush()
+                # This thread outlives requests, so tidy its connection the way request handling would
+                close_old_connections()
+
+    def flush(self):
+        with self._lock:
+            entries, self._entries = self._entries, []
+            self._oldest = None
+        if not entries:
+            return 0
+        try:
+            with transaction.atomic():
+                EntryLog.objects.bulk_create(entries, batch_size=self.batch_size)
+        except IntegrityError as e:
+            logger.warning("Could not write %s entry logs in one batch, writing them one by one: %s", len(entries), e)
+            return self._flush_rows(entries)
+        except Exception as e:
+            self._requeue(entries, e)
+            return 0
+        self.flushed += len(entries)
+        return len(entries)
+
+    def _flush_rows(self, entries):
+        written = 0
+        for i, entry in enumerate(entries):
+            try:
+                self._write_row(entry)
+            except IntegrityError as e:
+                # Retrying can never succeed, and keeping it would block every later flush
+                logger.error("Dropping entry log of user %s at %s: %s", entry.user_id, entry.created_at, e)
+                with self._lock:
+                    self.dropped += 1
+            except Exception as e:
+                self._requeue(entries[i:], e)
+                break
+            else:
+                written += 1
+        self.flushed += written
+        return written
+
+    def _write_row(self, entry):
+        pk = entry.pk
+        try:
+            with transaction.atomic():
+                EntryLog.objects.bulk_create([entry])
+        except IntegrityError:
+            if not _forget_deleted(entry):
+                raise
+            entry.pk = pk  # the failed insert may have assigned one
+            with transaction.atomic():
+                EntryLog.objects.bulk_create([entry])
+
+    def _requeue(self, entries, error):
+        logger.warning("Could not write %s entry logs, will retry: %s", len(entries), error)
+        with self._lock:
+            keep = max(0, self.max_buffer - len(self._entries))
+            self.dropped += max(0, len(entries) - keep)
+            self._entries[:0] = entries[:keep]
+            self._oldest = time.monotonic()
+
+
+def _forget_deleted(entry):
+    """Null the optional foreign keys whose rows were deleted since the scan. True if there were any."""
+    forgotten = False
+    for name in ('user_pass', 'event', 'coordinator'):
+        field = EntryLog._meta.get_field(name)
+        value = getattr(entry, field.attname)
+        if value is not None and not field.related_model._default_manager.filter(pk=value).exists():
+            setattr(entry, field.attname, None)
+            forgotten = True
+    return forgotten
+
+
+_buffer = None
+_recent = None
+_init_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _init_lock:
+        if _buffer is None:
+            _buffer = EntryBuffer(
+                batch_size=getattr(settings, 'ENTRY_LOG_BATCH_SIZE', 200),
+                flush_seconds=getattr(settings, 'ENTRY_LOG_FLUSH_SECONDS', 2.0),
+                max_buffer=getattr(settings, 'ENTRY_LOG_MAX_BUFFER', 100000),
+            )
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def get_recent_entries():
+    global _recent
+    with _init_lock:
+        if _recent is None:
+            _recent = RecentEntries(getattr(settings, 'ANTI_PASSBACK_SECONDS', 0))
+        return _recent
+
+
+def check_passback(user_id, event_id):
+    """Seconds since this person last entered the event if anti-passback refuses them, else None."""
+    recent = get_recent_entries()
+    if not recent.window:
+        return None
+    return recent.check_and_add((user_id, event_id))
+
+
+def record(user_id, method, pass_id=None, event_id=None, gate='', coordinator_id=None, at=None):
+    # Gate names come from the devices; an overlong one must not fail the whole batch insert
+    get_buffer().add(EntryLog(user_id=user_id, user_pass_id=pass_id, event_id=event_id,
+                              gate=(gate or '')[:GATE_MAX_LENGTH], method=method, coordinator_id=coordinator_id,
+                              created_at=at or timezone.now()))
+    gate_stats.entered(event_id, user_id)
@@ -0,0 +1,377 @@
+import io
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "VGG-Face"
+DETECTOR_BACKEND = "opencv"
+# DeepFace's own cosine threshold for VGG-Face
+DEFAULT_THRESHOLD = 0.68
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def get_model():
+    """
+    Build the recognition model once per process. deepface (and TensorFlow
+    behind it) is imported here rather than at module level so endpoints and
+    management commands that never touch faces don't pay for it.
+    """
+    from deepface import DeepFace
+
+    return DeepFace.build_model(MODEL_NAME)
+
+
+def warm_up(load_index=True):
+    """Load the model and run one throwaway inference so the first scan isn't the slow one."""
+    get_model()
+    embed_frames([np.zeros((224, 224, 3), dtype=np.uint8)])
+    if load_index:
+        get_index()
+
+
+def detect_faces(img, all_faces=False):
+    """
+    Run face detection once on an image (path or BGR array). Returns aligned
+    face crops with their facial areas, largest face first. With
+    ``all_faces`` False only the most prominent face is kept and, like the
+    original enforce_detection=False behaviour, the whole frame is used when
+    no face is found; with ``all_faces`` True undetected frames yield nothing.
+    """
+    from deepface import DeepFace
+
+    faces = DeepFace.extract_faces(img_path=img, detector_backend=DETECTOR_BACKEND, enforce_detection=False, align=True)
+    faces.sort(key=lambda f: f['facial_area']['w'] * f['facial_area']['h'], reverse=True)
+    if all_faces:
+        return [f for f in faces if f.get('confidence', 0) > 0]
+    return faces[:1]
+
+
+def embed_faces(faces):
+    """Embed many detected faces with a single batched forward pass. Returns an (n, dim) float32 matrix."""
+    if not faces:
+        return np.empty((0, 0), dtype=np.float32)
+    from deepface.modules import preprocessing
+
+    model = get_model()
+    target = model.input_shape
+    # Same preprocessing DeepFace.represent applies per face: RGB -> BGR, pad/resize to the model input
+    batch = np.concatenate([
+        preprocessing.resize_image(img=face['face'][:, :, ::-1], target_size=(target[1], target[0]))
+        for face in faces
+    ])
+    return np.asarray(model.model(batch, training=False), dtype=np.float32)
+
+
+def embed_frames(frames, all_faces=False):
+    """
+    Detect faces in every frame, then embed all of them in one forward pass.
+    ``all_faces`` may be a bool or one bool per frame. Returns one
+    ``(vectors, facial_areas)`` pair per frame, where ``vectors`` is (n, dim).
+    """
+    if isinstance(all_faces, bool):
+        all_faces = [all_faces] * len(frames)
+    with metrics.timed('detect'):
+        detected = [detect_faces(frame, multi) for frame, multi in zip(frames, all_faces)]
+    with metrics.timed('embed'):
+        vectors = embed_faces([face for faces in detected for face in faces])
+    results, start = [], 0
+    for faces in detected:
+        results.append((vectors[start:start + len(faces)], [face['facial_area'] for face in faces]))
+        start += len(faces)
+    return results
+
+
+def represent(img):
+    """Embed the most prominent face in an image and return a float32 vector."""
+    vectors, _ = embed_frames([img])[0]
+    if len(vectors) == 0:
+        raise ValueError("No face detected in the image.")
+    return vectors[0]
+
+
+def decode_image(data, max_side=None):
+    """
+    Decode encoded image bytes straight to a BGR ndarray (what OpenCV and
+    DeepFace expect), already shrunk to the detector's working resolution.
+    JPEGs are scaled during decoding (libjpeg DCT scaling via draft()), so a
+    1080p phone capture is never materialised at full size.
+    """
+    from PIL import Image, ImageOps
+
+    if max_side is None:
+        max_side = getattr(settings, 'FACE_DETECT_MAX_SIDE', 640)
+    try:
+        img = Image.open(io.BytesIO(data))
+        scale = max_side / max(img.size) if max_side else 1.0
+        if scale < 1.0:
+            img.draft('RGB', (int(img.width * scale), int(img.height * scale)))
+        img = img.convert('RGB')
+        # Phone captures are often stored sideways with an EXIF rotation flag
+        if img.getexif().get(0x0112, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        raise ValueError(f"Could not decode image: {e}")
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
+
+
+def embed_uploads(images, all_faces=False):
+    """embed_frames() for encoded images (e.g. uploaded JPEG bytes), decoded in memory."""
+    with metrics.timed('decode'):
+        frames = [decode_image(data) for data in images]
+    return embed_frames(frames, all_faces)
+
+
+def read_embeddings(since=None):
+    """Stored embeddings as (profile ids, float32 vectors, latest updated_at)."""
+    from .models import FaceEmbedding
+
+    rows = FaceEmbedding.objects.filter(model_name=MODEL_NAME)
+    if since is not None:
+        rows = rows.filter(updated_at__gt=since)
+    ids, vectors, synced_to = [], [], since
+    for profile_id, vector, updated_at in rows.values_list('profile_id', 'vector', 'updated_at').iterator(chunk_size=2000):
+        ids.append(profile_id)
+        vectors.append(np.frombuffer(vector, dtype=np.float32))
+        synced_to = updated_at if synced_to is None else max(synced_to, updated_at)
+    return ids, (np.stack(vectors) if vectors else None), synced_to
+
+
+def top_k(ids, distances, k, rows=None):
+    """Pick the k smallest distances; ``rows`` maps positions in ``distances`` back to ``ids``."""
+    k = min(k, len(distances))
+    if k == 0:
+        return []
+    if k == 1:
+        order = [int(np.argmin(distances))]
+    else:
+        top = np.argpartition(distances, k - 1)[:k]
+        order = top[np.argsort(distances[top])]
+    if rows is None:
+        return [(int(ids[i]), float(distances[i])) for i in order]
+    return [(int(ids[rows[i]]), float(distances[i])) for i in order]
+
+
+class FaceIndex:
+    """
+    Exact face index: one contiguous float32 matrix of L2-normalised
+    embeddings plus a parallel array of UserProfile ids. A lookup is a single
+    matrix-vector product, so cosine distance to every enrolled face is
+    computed in one call.
+    """
+
+    def __init__(self, ids=None, vectors=None):
+        self._lock = threading.Lock()
+        self.synced_to = None
+        self.replace(ids if ids is not None else [], vectors)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, **options):
+        """Entry point used by get_index(); ``options`` come from FACE_INDEX_OPTIONS."""
+        index = cls(**options)
+        index.reload_from_db()
+        return index
+
+    def replace(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        if vectors is None or len(ids) == 0:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        else:
+            matrix = np.ascontiguousarray(normalize(vectors))
+        with self._lock:
+            self.ids = ids
+            self.matrix = matrix
+
+    def upsert(self, profile_id, vector):
+        vector = normalize(vector)
+        with self._lock:
+            # Copy-on-write so concurrent searches keep a consistent snapshot
+            keep = self.ids != profile_id
+            ids = np.append(self.ids[keep], np.int64(profile_id))
+            matrix = self._append_row(self.matrix if keep.all() else self.matrix[keep], vector)
+            self.ids, self.matrix = ids, matrix
+
+    def _append_row(self, matrix, vector):
+        """
+        Append a row without copying the whole matrix on every enrollment:
+        rows live in a buffer with spare capacity that grows geometrically.
+        Readers holding the previous view never see the new row.
+        """
+        n = len(matrix)
+        buffer = getattr(self, '_buffer', None)
+        if n == 0 or matrix.shape[1] != vector.shape[0]:
+            buffer = np.empty((16, vector.shape[0]), dtype=np.float32)
+            n = 0
+        elif buffer is None or matrix.base is not buffer or n >= len(buffer) or self._buffer_used != n:
+            grown = np.empty((max(16, 2 * n), matrix.shape[1]), dtype=np.float32)
+            grown[:n] = matrix
+            buffer = grown
+        buffer[n] = vector
+        self._buffer, self._buffer_used = buffer, n + 1
+        return buffer[:n + 1]
+
+    def remove(self, profile_id):
+        with self._lock:
+            keep = self.ids != profile_id
+            if keep.all():
+                return
+            self.ids, self.matrix = self.ids[keep], np.ascontiguousarray(self.matrix[keep])
+
+    def search(self, embedding, k=1):
+        """Return up to ``k`` (profile_id, cosine_distance) pairs, closest first."""
+        # Grab a consistent snapshot; writers swap both arrays together
+        with self._lock:
+            ids, matrix = self.ids, self.matrix
+        if len(ids) == 0:
+            return []
+        return top_k(ids, 1.0 - matrix @ normalize(embedding), k)
+
+    def search_batch(self, embeddings):
+        """Nearest (profile_id, cosine_distance) for each row of ``embeddings``, in one matrix product."""
+        with self._lock:
+            ids, matrix = self.ids, self.matrix
+        if len(ids) == 0 or len(embeddings) == 0:
+            return [None] * len(embeddings)
+        distances = 1.0 - normalize(embeddings) @ matrix.T
+        best = np.argmin(distances, axis=1)
+        return [(int(ids[j]), float(distances[i, j])) for i, j in enumerate(best)]
+
+    def match(self, embedding, threshold=None):
+        """Best (profile_id, distance) under the match threshold, or None."""
+        return self.match_batch(np.asarray(embedding)[None, :], threshold)[0]
+
+    def match_batch(self, embeddings, threshold=None):
+        if threshold is None:
+            threshold = getattr(settings, 'FACE_MATCH_THRESHOLD', DEFAULT_THRESHOLD)
+        return [hit if hit is not None and hit[1] <= threshold else None for hit in self.search_batch(embeddings)]
+
+    def reload_from_db(self):
+        ids, vectors, synced_to = read_embeddings()
+        self.replace(ids, vectors)
+        self.synced_to = synced_to
+
+    def sync_from_db(self):
+        """
+        Apply rows written by other workers since the last sync. Deletions
+        can't be seen incrementally, so a count mismatch triggers a reload.
+        """
+        from .models import FaceEmbedding
+
+        ids, vectors, synced_to = read_embeddings(since=self.synced_to)
+        for profile_id, vector in zip(ids, vectors if vectors is not None else []):
+            self.upsert(profile_id, vector)
+        self.synced_to = synced_to
+        if FaceEmbedding.objects.filter(model_name=MODEL_NAME).count() != len(self):
+            self.reload_from_db()
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Per-process singleton loaded from the FaceEmbedding table. Writes made in
+    this process are applied directly; writes from other workers are picked
+    up at most every FACE_INDEX_REFRESH_SECONDS.
+    """
+    global _index, _index_checked_at
+    interval = getattr(settings, 'FACE_INDEX_REFRESH_SECONDS', 5)
+    if _index is not None and time.monotonic() - _index_checked_at < interval:
+        return _index
+    with _index_lock:
+        if _index is None:
+            backend = import_string(getattr(settings, 'FACE_INDEX_BACKEND', 'invitations.face_index.FaceIndex'))
+            _index = backend.load(**getattr(settings, 'FACE_INDEX_OPTIONS', {}))
+        else:
+            _index.sync_from_db()
+        _index_checked_at = time.monotonic()
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def _apply(method, *args):
+    # Only touch the live index once the DB write is durable. Looked up by name on the
+    # instance so backends that override upsert/remove (ann.IVFIndex) keep their lists current
+    def apply():
+        if _index is not None:
+            getattr(_index, method)(*args)
+    transaction.on_commit(apply)
+
+
+def enroll_profile(profile):
+    """
+    Compute and store the embedding for a profile's current photo. Returns the
+    FaceEmbedding, or None if the profile has no photo or no face was found.
+    """
+    from .models import FaceEmbedding
+
+    if not profile.photo:
+        unenroll_profile(profile.id)
+        return None
+    try:
+        # Same in-memory decode + downscale as live scans so both sides of a match are preprocessed alike
+        with profile.photo.open('rb') as f:
+            vector = represent(decode_image(f.read()))
+    except Exception as e:
+        logger.warning("Could not embed photo for %s: %s", profile, e)
+        unenroll_profile(profile.id)
+        return None
+
+    embedding, _ = FaceEmbedding.objects.update_or_create(
+        profile=profile,
+        defaults={'model_name': MODEL_NAME, 'photo_name': profile.photo.name, 'vector': vector.tobytes()},
+    )
+    _apply('upsert', profile.id, vector)
+    return embedding
+
+
+def enroll_vectors(profiles, vectors):
+    """
+    Store embeddings computed elsewhere (e.g. a batch through embed_images())
+    for profiles that have none yet, in one bulk insert.
+    """
+    from .models import FaceEmbedding
+
+    FaceEmbedding.objects.bulk_create([
+        FaceEmbedding(profile=profile, model_name=MODEL_NAME, photo_name=profile.photo.name, vector=vector.tobytes())
+        for profile, vector in zip(profiles, vectors)
+    ], batch_size=500)
+    for profile, vector in zip(profiles, vectors):
+        _apply('upsert', profile.id, vector)
+
+
+def unenroll_profile(profile_id):
+    from .models import FaceEmbedding
+
+    FaceEmbedding.objects.filter(profile_id=profile_id).delete()
+    drop_from_index(profile_id)
+
+
+def drop_from_index(profile_id):
+    _apply('remove', profile_id)
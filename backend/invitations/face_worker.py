@@ -0,0 +1,297 @@
+"""
+Out-of-process face inference.
+
+'manage.py face_worker' runs a local service that owns the DeepFace models
+(one per worker process) and batches concurrent gate requests together.
+Django views talk to it through ``embed_image()``, which falls back to
+in-process inference when FACE_WORKER_ADDRESS is not configured.
+"""
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .benchmarking import summarize
+from .face_index import embed_uploads
+
+logger = logging.getLogger(__name__)
+
+
+class FaceWorkerError(Exception):
+    pass
+
+
+class FaceWorkerBusy(FaceWorkerError):
+    """The admission queue is full; the caller should shed load (HTTP 503)."""
+
+
+class FaceWorkerTimeout(FaceWorkerError):
+    pass
+
+
+class FaceWorkerUnavailable(FaceWorkerError):
+    pass
+
+
+def parse_address(value):
+    # "host:port" for TCP, anything else is a unix socket path
+    if value and ':' in value and not value.startswith('/'):
+        host, port = value.rsplit(':', 1)
+        return (host, int(port))
+    return value
+
+
+def _authkey():
+    return getattr(settings, 'FACE_WORKER_AUTHKEY', None) or settings.SECRET_KEY.encode()
+
+
+def _worker_init():
+    from .face_index import warm_up
+    warm_up(load_index=False)
+
+
+def _pack(embedded):
+    return [(vectors.shape, vectors.tobytes(), areas) for vectors, areas in embedded]
+
+
+def _embed_request(images, all_faces):
+    try:
+        return ('ok', _pack(embed_uploads(images, all_faces)))
+    except ValueError as e:
+        return ('invalid', str(e))  # not an image; the client raises ValueError, as in-process inference does
+    except Exception as e:
+        return ('error', str(e))
+
+
+def _embed_batch(requests):
+    """
+    Runs inside a pool process (one model copy lives in each). Every frame of
+    every request in the batch goes through one batched forward pass. If that
+    fails, the requests are embedded one by one, so a bad upload only fails
+    the request that sent it.
+    """
+    if len(requests) == 1:
+        return [_embed_request(*requests[0])]
+    frames = [image for images, _ in requests for image in images]
+    flags = [all_faces for images, all_faces in requests for _ in images]
+    try:
+        embedded = embed_uploads(frames, flags)
+    except Exception:
+        return [_embed_request(*request) for request in requests]
+    results, start = [], 0
+    for images, _ in requests:
+        results.append(('ok', _pack(embedded[start:start + len(images)])))
+        start += len(images)
+    return results
+
+
+def _unpack(payload):
+    return [(np.frombuffer(data, dtype=np.float32).reshape(shape), areas) for shape, data, areas in payload]
+
+
+class FaceWorkerServer:
+    """
+    Accepts connections on a local socket and feeds a bounded admission queue.
+    A batcher thread drains the queue into batches of up to ``batch_size``
+    (waiting at most ``batch_wait`` seconds to fill one) and hands them to a
+    process pool. Requests that can't be queued are rejected immediately, and
+    requests whose caller has already timed out are dropped before inference.
+    """
+
+    def __init__(self, address, processes=None, queue_size=64, batch_size=8, batch_wait=0.01):
+        self.address = address
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_worker_init)
+        # At most one batch per process in flight; the rest waits in the admission queue
+        self.slots = threading.BoundedSemaphore(self.processes)
+        self.in_flight = 0
+        self.stats_lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.batch_latencies = collections.deque(maxlen=1000)
+        self.batch_sizes = collections.deque(maxlen=1000)
+
+    def count(self, name, n=1):
+        with self.stats_lock:
+            self.counters[name] += n
+
+    def stats(self):
+        with self.stats_lock:
+            latencies, sizes = list(self.batch_latencies), list(self.batch_sizes)
+            counters, in_flight = dict(self.counters), self.in_flight
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "processes": self.processes,
+            "in_flight_batches": in_flight,
+            "counters": counters,
+            "batch_size_mean": sum(sizes) / len(sizes) if sizes else 0.0,
+            "batch_latency": summarize(latencies),
+        }
+
+    def serve_forever(self):
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        with Listener(self.address, authkey=_authkey()) as listener:
+            logger.info("Face worker listening on %s with %s processes", self.address, self.processes)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning("Rejected face worker connection: %s", e)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                while True:
+                    request = conn.recv()
+                    conn.send(self._dispatch(request))
+            except EOFError:
+                pass
+            except Exception as e:
+                logger.warning("Face worker connection error: %s", e)
+
+    def _dispatch(self, request):
+        op = request.get('op')
+        if op == 'stats':
+            return {'status': 'ok', 'stats': self.stats()}
+        if op != 'embed':
+            return {'status': 'error', 'detail': f"Unknown op {op!r}"}
+
+        future = Future()
+        deadline = request.get('deadline') or time.time() + 30
+        try:
+            self.queue.put_nowait(((request['images'], request.get('all_faces', False)), deadline, future))
+        except queue.Full:
+            self.count('rejected_busy')
+            return {'status': 'busy'}
+        self.count('accepted')
+        try:
+            status, payload = future.result(timeout=max(0.0, deadline - time.time()))
+        except Exception:
+            self.count('timed_out')
+            return {'status': 'timeout'}
+        return {'status': status, 'payload': payload}
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        cutoff = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = cutoff - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            self.slots.acquire()
+            batch = self._next_batch()
+            now = time.time()
+            live = [item for item in batch if item[1] > now and not item[2].done()]
+            if len(live) < len(batch):
+                self.count('expired_in_queue', len(batch) - len(live))
+            if not live:
+                self.slots.release()
+                continue
+
+            started = time.perf_counter()
+            with self.stats_lock:
+                self.in_flight += 1
+            job = self.pool.submit(_embed_batch, [item[0] for item in live])
+            job.add_done_callback(lambda job, live=live, started=started: self._finish(job, live, started))
+
+    def _finish(self, job, live, started):
+        self.slots.release()
+        elapsed = time.perf_counter() - started
+        with self.stats_lock:
+            self.in_flight -= 1
+            self.batch_latencies.append(elapsed)
+            # Batch size counts frames, not requests
+            self.batch_sizes.append(sum(len(item[0][0]) for item in live))
+            self.counters['batches'] += 1
+        try:
+            results = job.result()
+        except Exception as e:
+            results = [('error', str(e))] * len(live)
+        for (_, _, future), result in zip(live, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class FaceWorkerClient:
+    def __init__(self, address, timeout=10.0):
+        self.address = address
+        self.timeout = timeout
+
+    def _call(self, request, timeout):
+        try:
+            conn = Client(self.address, authkey=_authkey())
+        except (OSError, EOFError) as e:
+            raise FaceWorkerUnavailable(f"Face worker unreachable at {self.address}: {e}")
+        with conn:
+            conn.send(request)
+            if not conn.poll(timeout):
+                raise FaceWorkerTimeout("Face worker did not answer in time.")
+            return conn.recv()
+
+    def embed_frames(self, images, all_faces=False, timeout=None):
+        timeout = timeout or self.timeout
+        request = {'op': 'embed', 'images': list(images), 'all_faces': all_faces, 'deadline': time.time() + timeout}
+        # Slightly longer socket wait than the server-side deadline so the server answers first
+        response = self._call(request, timeout + 1.0)
+        status = response.get('status')
+        if status == 'ok':
+            return _unpack(response['payload'])
+        if status == 'busy':
+            raise FaceWorkerBusy("Face recognition is at capacity, retry shortly.")
+        if status == 'timeout':
+            raise FaceWorkerTimeout("Face recognition timed out.")
+        if status == 'invalid':
+            raise ValueError(response['payload'])
+        raise FaceWorkerError(response.get('payload') or response.get('detail') or 'Face worker error')
+
+    def stats(self):
+        return self._call({'op': 'stats'}, self.timeout)['stats']
+
+
+def get_client():
+    address = getattr(settings, 'FACE_WORKER_ADDRESS', None)
+    if not address:
+        return None
+    return FaceWorkerClient(parse_address(address), timeout=getattr(settings, 'FACE_WORKER_TIMEOUT', 10.0))
+
+
+def embed_images(images, all_faces=False):
+    """
+    Embed faces in uploaded image bytes via the worker service if configured,
+    else in this process. Returns one ``(vectors, facial_areas)`` per image.
+    """
+    client = get_client()
+    if client is None:
+        return embed_uploads(images, all_faces)
+    # Decode/detect/embed happen in the worker; here only the round trip is visible
+    with metrics.timed('worker'):
+        return client.embed_frames(images, all_faces)
+
+
+def embed_image(data):
+    """Embedding of the most prominent face in one uploaded image."""
+    vectors, _ = embed_images([data])[0]
+    if len(vectors) == 0:
+        raise ValueError("No face detected in the image.")
+    return vectors[0]
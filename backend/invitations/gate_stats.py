@@ -0,0 +1,171 @@
+"""
+Live gate counters, maintained incrementally by the verification views.
+
+Per gate: accepted/rejected totals and scans in the last minute (per-second
+buckets over GATE_STATS_WINDOW_SECONDS). Per event: how many distinct
+people have entered. Per method: recent verification latency. Dashboards
+read ``snapshot()`` through /api/admin/gate-stats/ or its SSE stream
+instead of polling the list endpoints.
+
+Like the anti-passback map, the counters live in this process; with several
+workers each reports its own share.
+"""
+import collections
+import functools
+import threading
+import time
+
+from django.conf import settings
+
+from .benchmarking import summarize
+
+
+class GateStats:
+    def __init__(self, window=60, latency_samples=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.version = 0
+        self.started = time.time()
+        self.totals = collections.defaultdict(collections.Counter) # gate -> {'accepted': n, 'rejected': n}
+        self.buckets = collections.defaultdict(collections.deque) # gate -> deque of [second, count]
+        self.latency = collections.defaultdict(lambda: collections.deque(maxlen=latency_samples))
+        self.inside = collections.defaultdict(set) # event id -> user ids seen entering
+        self.seeded = False
+
+    def _bump(self):
+        self.version += 1
+        self._changed.notify_all()
+
+    def scan(self, gate, accepted):
+        now = int(time.time())
+        with self._lock:
+            self.totals[gate]['accepted' if accepted else 'rejected'] += 1
+            buckets = self.buckets[gate]
+            if buckets and buckets[-1][0] == now:
+                buckets[-1][1] += 1
+            else:
+                buckets.append([now, 1])
+            while buckets and buckets[0][0] <= now - self.window:
+                buckets.popleft()
+            self._bump()
+
+    def timed(self, method, seconds):
+        with self._lock:
+            self.latency[method].append(seconds)
+
+    def entered(self, event_id, user_id):
+        if event_id is None:
+            return
+        with self._lock:
+            people = self.inside[event_id]
+            if user_id not in people:
+                people.add(user_id)
+                self._bump()
+
+    def seed(self, pairs):
+        """Merge (event id, user id) pairs of entries logged before this process started."""
+        with self._lock:
+            for event_id, user_id in pairs:
+                self.inside[event_id].add(user_id)
+            self.seeded = True
+            self._bump()
+
+    def wait_for_change(self, version, timeout):
+        """Block until the counters move past ``version`` or ``timeout`` passes; returns the current version."""
+        with self._lock:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def snapshot(self):
+        now = int(time.time())
+        with self._lock:
+            gates = {}
+            for gate, totals in self.totals.items():
+                recent = sum(count for second, count in self.buckets[gate] if second > now - self.window)
+                gates[gate or 'unspecified'] = {
+                    "accepted": totals['accepted'],
+                    "rejected": totals['rejected'],
+                    "scans_per_minute": round(recent * 60.0 / self.window, 1),
+                }
+            inside = {event_id: len(people) for event_id, people in self.inside.items()}
+            latency = {method: summarize(list(samples)) for method, samples in self.latency.items()}
+            version = self.version
+        return {
+            "version": version,
+            "since": self.started,
+            "gates": gates,
+            "inside": inside,
+            "latency": latency,
+        }
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_stats():
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = GateStats(window=getattr(settings, 'GATE_STATS_WINDOW_SECONDS', 60),
+                               latency_samples=getattr(settings, 'GATE_STATS_LATENCY_SAMPLES', 500))
+        return _stats
+
+
+def entered(event_id, user_id):
+    get_stats().entered(event_id, user_id)
+
+
+_event_names = {}
+
+
+def snapshot():
+    """Current counters with event names; seeds the inside counts from EntryLog on first use."""
+    from .models import EntryLog, Event
+
+    stats = get_stats()
+    if not stats.seeded:
+        stats.seed(EntryLog.objects.filter(event__isnull=False).values_list('event_id', 'user_id').distinct())
+    data = stats.snapshot()
+    missing = [event_id for event_id in data["inside"] if event_id not in _event_names]
+    if missing:
+        _event_names.update(Event.objects.filter(id__in=missing).values_list('id', 'name'))
+    data["inside"] = [{"event": event_id, "event_name": _event_names.get(event_id), "count": count}
+                      for event_id, count in sorted(data["inside"].items())]
+    return data
+
+
+def observe(method, gate, status_code, data, seconds, outcomes=None):
+    """
+    Count one verification answer and its timing. A 2xx response is accepted and
+    one with ``"valid": False`` is rejected; anything else (bad input, permissions,
+    worker errors) is not a scan. ``outcomes`` (a list of accepted flags) overrides
+    this for answers that admit several people at once.
+    """
+    if status_code < 300:
+        results = outcomes if outcomes is not None else [True]
+    elif isinstance(data, dict) and data.get('valid') is False:
+        results = [False]
+    else:
+        return
+    stats = get_stats()
+    gate = str(gate or '')[:50]
+    for accepted in results:
+        stats.scan(gate, accepted)
+    stats.timed(method, seconds)
+
+
+def track(method, outcomes=None):
+    """Decorator for DRF function views: ``observe()`` each response, with ``outcomes(response)`` if given."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            started = time.perf_counter()
+            response = view(request, *args, **kwargs)
+            results = outcomes(response) if outcomes and response.status_code < 300 else None
+            observe(method, request.data.get('gate'), response.status_code, getattr(response, 'data', None),
+                    time.perf_counter() - started, results)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,138 @@
+"""
+Pass emails and the bulk invite queue.
+
+Bulk invites create their passes up front and queue one InviteEmail row per
+pass; 'manage.py send_invites' delivers due rows in rounds over the pooled
+mail connections (mail_pool.py), rate-limited, retrying failures with
+exponential backoff. Rows are claimed by moving next_attempt_at forward by a lease, so several
+workers can run side by side and a crashed worker's rows are retried once
+the lease expires.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Count
+from django.utils import timezone
+
+from . import mail_pool, qr_images
+from .models import InviteEmail
+
+logger = logging.getLogger(__name__)
+
+
+def build_pass_email(user_pass):
+    user, event = user_pass.user, user_pass.event
+    email_from = getattr(settings, 'EMAIL_HOST_USER', None) or 'admin@hackathon.com'
+    email = EmailMultiAlternatives(
+        f'Your Pass for {event.name}',
+        f'Hi {user.username}, here is your entry pass for {event.name}.',
+        email_from,
+        [user.email],
+    )
+    png, _ = qr_images.get_image(user_pass.qr_code_data, 'png')
+    email.attach(f'pass_{user.username}.png', png, 'image/png')
+    return email
+
+
+def queue_emails(batch, passes):
+    now = timezone.now()
+    InviteEmail.objects.bulk_create([InviteEmail(batch=batch, user_pass=p, next_attempt_at=now) for p in passes],
+                                    batch_size=500)
+
+
+def batch_progress(batch):
+    counts = dict(batch.emails.values_list('status').annotate(n=Count('id')).order_by())
+    total = sum(counts.values())
+    done = counts.get('sent', 0) + counts.get('failed', 0)
+    return {
+        "batch": batch.id,
+        "event": batch.event.name,
+        "created_at": batch.created_at,
+        "requested": batch.requested,
+        "skipped": batch.skipped,
+        "total": total,
+        "queued": counts.get('queued', 0),
+        "sending": counts.get('sending', 0),
+        "sent": counts.get('sent', 0),
+        "failed": counts.get('failed', 0),
+        "percent_done": round(100.0 * done / total, 1) if total else 100.0,
+    }
+
+
+class RateLimiter:
+    """Spaces calls to at most ``rate`` per second (no limit when rate is falsy)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def claim_due(limit):
+    """Claim up to ``limit`` due emails for this worker by leasing them; returns the claimed rows."""
+    now = timezone.now()
+    ids = list(InviteEmail.objects.filter(status__in=('queued', 'sending'), next_attempt_at__lte=now)
+               .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    lease = now + timedelta(seconds=getattr(settings, 'INVITE_EMAIL_LEASE_SECONDS', 300))
+    # The next_attempt_at condition makes this a compare-and-set: rows another worker leased first are skipped
+    InviteEmail.objects.filter(id__in=ids, next_attempt_at__lte=now).update(status='sending', next_attempt_at=lease)
+    return list(InviteEmail.objects.filter(id__in=ids, status='sending', next_attempt_at=lease)
+                .select_related('user_pass__user', 'user_pass__event'))
+
+
+def _failed(email, error, now):
+    email.attempts += 1
+    email.last_error = error
+    if email.attempts >= getattr(settings, 'INVITE_EMAIL_MAX_ATTEMPTS', 5):
+        email.status = 'failed'
+    else:
+        email.status = 'queued'
+        retry = getattr(settings, 'INVITE_EMAIL_RETRY_SECONDS', 60)
+        email.next_attempt_at = now + timedelta(seconds=retry * 2 ** (email.attempts - 1))
+
+
+def deliver_due(limit=50, limiter=None):
+    """
+    Send one round of due emails through the mail pool. Returns a dict of
+    outcome counts ('sent', 'retry', 'failed').
+    """
+    emails = claim_due(limit)
+    outcomes = {'sent': 0, 'retry': 0, 'failed': 0}
+    if not emails:
+        return outcomes
+
+    sendable = []
+    for email in emails:
+        if not email.user_pass.is_active:
+            email.status, email.last_error = 'failed', "Pass was revoked before delivery."
+        elif not email.user_pass.user.email:
+            email.status, email.last_error = 'failed', "User has no email address."
+        else:
+            sendable.append(email)
+    errors = mail_pool.send_messages([build_pass_email(email.user_pass) for email in sendable], limiter)
+    now = timezone.now()
+    for email, error in zip(sendable, errors):
+        if error is None:
+            email.status, email.sent_at, email.last_error = 'sent', now, ''
+            email.attempts += 1
+        else:
+            logger.warning("Invite email for pass %s failed: %s", email.user_pass_id, error)
+            _failed(email, error, now)
+    for email in emails:
+        outcomes['retry' if email.status == 'queued' else email.status] += 1
+
+    InviteEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return outcomes
@@ -0,0 +1,180 @@
+"""
+Pooled, persistent mail connections.
+
+Django's ``EmailMessage.send()`` without an explicit connection opens a new
+SMTP session (TCP + TLS handshake + AUTH) for every message, which costs
+far more than sending the message itself. ``MailPool`` keeps up to
+MAIL_POOL_SIZE authenticated connections open and reuses them across
+messages and across requests in this process. Connections are recycled
+after MAIL_POOL_MAX_MESSAGES messages (providers cap messages per session)
+and probed with NOOP when they have sat idle, and a message that fails on
+a dropped connection is retried once on a fresh one.
+"""
+import collections
+import logging
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Rejections of the message itself; retrying on a new connection won't help
+REJECTED = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class PooledConnection:
+    def __init__(self, backend):
+        self.backend = backend
+        self.is_open = False
+        self.sent = 0
+        self.last_used = 0.0
+
+    def alive(self):
+        smtp = getattr(self.backend, 'connection', None)
+        if smtp is None or not hasattr(smtp, 'noop'):
+            # Non-SMTP backends (console, locmem, ...) have nothing to probe
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def open(self):
+        self.backend.open()
+        self.is_open = True
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.backend.close()
+        except Exception:
+            pass
+        self.is_open = False
+
+
+class MailPool:
+    def __init__(self, size=2, max_messages=100, idle_check=30, backend=None):
+        self.size = size
+        self.max_messages = max_messages
+        self.idle_check = idle_check
+        self.backend = backend
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats_lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.send_seconds = 0.0
+
+    def count(self, name, n=1):
+        with self._stats_lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; at most ``size`` are in use at once, the rest of the callers wait."""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = PooledConnection(get_connection(self.backend, fail_silently=False))
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def _ready(self, conn):
+        if conn.is_open:
+            if conn.sent >= self.max_messages:
+                conn.close()
+            elif time.monotonic() - conn.last_used > self.idle_check and not conn.alive():
+                conn.close()
+                self.count('stale_connections')
+        if not conn.is_open:
+            conn.open()
+            self.count('connections_opened')
+
+    def _send_one(self, conn, message):
+        for attempt in (1, 2):
+            try:
+                self._ready(conn)
+                if not conn.backend.send_messages([message]):
+                    self.count('failed')
+                    return "Message has no recipients."
+                conn.sent += 1
+                conn.last_used = time.monotonic()
+                self.count('sent')
+                return None
+            except REJECTED as e:
+                self.count('failed')
+                return str(e)
+            except Exception as e:
+                # Dropped or broken session: reconnect and try once more
+                conn.close()
+                if attempt == 2:
+                    logger.warning("Sending mail failed after reconnecting: %s", e)
+                    self.count('failed')
+                    return str(e)
+                self.count('reconnects')
+
+    def send(self, messages, limiter=None):
+        """
+        Send ``messages`` over one pooled connection, in order. Returns one entry
+        per message: None if it was sent, else the error text. ``limiter``, if
+        given, has its ``wait()`` called before each message.
+        """
+        errors = []
+        started = time.perf_counter()
+        with self.connection() as conn:
+            for message in messages:
+                if limiter:
+                    limiter.wait()
+                errors.append(self._send_one(conn, message))
+        with self._stats_lock:
+            self.send_seconds += time.perf_counter() - started
+        return errors
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self._stats_lock:
+            counters, seconds = dict(self.counters), self.send_seconds
+        return {
+            "pool_size": self.size,
+            "idle_connections": self._idle.qsize(),
+            "counters": counters,
+            "send_seconds": round(seconds, 3),
+            "messages_per_second": round(counters.get('sent', 0) / seconds, 2) if seconds else 0.0,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MailPool(
+                size=getattr(settings, 'MAIL_POOL_SIZE', 2),
+                max_messages=getattr(settings, 'MAIL_POOL_MAX_MESSAGES', 100),
+                idle_check=getattr(settings, 'MAIL_POOL_IDLE_CHECK_SECONDS', 30),
+            )
+        return _pool
+
+
+def send_messages(messages, limiter=None):
+    return get_pool().send(messages, limiter)
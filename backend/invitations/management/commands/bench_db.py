@@ -0,0 +1,137 @@
+import collections
+import copy
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.utils import timezone
+
+from invitations.benchmarking import summarize
+from invitations.models import EntryLog, Event, Pass, PassChange, UserProfile
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Scan throughput under concurrent readers and writers on each database profile: SQLite with its "
+            "default rollback journal, SQLite in WAL mode with SQLITE_OPTIONS (IMMEDIATE, busy timeout), and the "
+            "configured database when it is not SQLite (e.g. DB_ENGINE=postgres, with or without DB_POOL=1). "
+            "SQLite runs use throwaway files; rows seeded into the configured database are removed afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--targets', nargs='+', choices=['sqlite-default', 'sqlite-wal', 'configured'],
+                            default=['sqlite-default', 'sqlite-wal', 'configured'])
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help='Share of scans paired with a write (entry log row, or a suspension change).')
+        parser.add_argument('--users', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        tmpdir = Path(tempfile.mkdtemp(prefix='bench_db_'))
+        default = connections.settings[DEFAULT_DB_ALIAS]
+        try:
+            for target in options['targets']:
+                if target == 'configured':
+                    if connections[DEFAULT_DB_ALIAS].vendor == 'sqlite':
+                        self.stdout.write("configured: the default database is SQLite, covered by the runs above")
+                        continue
+                    alias = DEFAULT_DB_ALIAS
+                else:
+                    alias = f"bench_{target.replace('-', '_')}"
+                    config = copy.deepcopy(default)
+                    config.update(ENGINE='django.db.backends.sqlite3', NAME=str(tmpdir / f'{alias}.sqlite3'),
+                                  CONN_MAX_AGE=0, OPTIONS=self.wal_options() if target == 'sqlite-wal' else {})
+                    connections.settings[alias] = connections.configure_settings(
+                        {DEFAULT_DB_ALIAS: default, alias: config})[alias]
+                    call_command('migrate', database=alias, verbosity=0)
+                tag = uuid.uuid4().hex[:8]
+                try:
+                    seeded = self.seed(alias, tag, options['users'])
+                    self.report(target, alias, *self.run(alias, seeded, options))
+                finally:
+                    if alias == DEFAULT_DB_ALIAS:
+                        User.objects.filter(username__startswith=f"dbbench-{tag}-").delete()
+                        Event.objects.filter(name=f"DB bench {tag}").delete()
+                    else:
+                        connections[alias].close()
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def wal_options(self):
+        # WAL whether or not SQLITE_WAL is set; these are throwaway files
+        options = copy.deepcopy(getattr(settings, 'SQLITE_OPTIONS', {}))
+        options['init_command'] = settings.SQLITE_WAL_INIT_COMMAND
+        return options
+
+    def seed(self, alias, tag, count):
+        User.objects.using(alias).bulk_create(
+            [User(username=f"dbbench-{tag}-{i}", password='!') for i in range(count)], batch_size=1000)
+        user_ids = list(User.objects.using(alias).filter(username__startswith=f"dbbench-{tag}-")
+                        .values_list('id', flat=True))
+        UserProfile.objects.using(alias).bulk_create([UserProfile(user_id=i) for i in user_ids], batch_size=1000)
+        event = Event.objects.using(alias).create(name=f"DB bench {tag}")
+        Pass.objects.using(alias).bulk_create(
+            [Pass(user_id=i, event=event, qr_code_data=f"dbbench-{tag}-{i}") for i in user_ids], batch_size=1000)
+        return {'event_id': event.id, 'passes': [(i, f"dbbench-{tag}-{i}") for i in user_ids]}
+
+    def run(self, alias, seeded, options):
+        deadline = time.monotonic() + options['seconds']
+        samples, errors = [], collections.Counter()
+        lock = threading.Lock()
+
+        def scanner(seed):
+            rng = random.Random(seed)
+            mine, failed = [], collections.Counter()
+            while time.monotonic() < deadline:
+                user_id, qr_data = rng.choice(seeded['passes'])
+                started = time.perf_counter()
+                try:
+                    # The verify_qr cache-miss read, then (sometimes) a concurrent write: an entry log
+                    # batch or an admin suspension change
+                    Pass.objects.using(alias).select_related('user__profile', 'event').get(qr_code_data=qr_data)
+                    roll = rng.random()
+                    if roll < options['write_ratio'] / 2:
+                        EntryLog.objects.using(alias).create(user_id=user_id, event_id=seeded['event_id'],
+                                                             method='qr', created_at=timezone.now())
+                    elif roll < options['write_ratio']:
+                        # Read, then write in one transaction, like the suspend/unsuspend and invite views
+                        with transaction.atomic(using=alias):
+                            profiles = UserProfile.objects.using(alias).filter(user_id=user_id)
+                            profiles.values('is_suspended').get()
+                            profiles.update(is_suspended=False, suspension_end_date=None)
+                            PassChange.objects.using(alias).create(kind='unsuspended', user_id=user_id)
+                    mine.append(time.perf_counter() - started)
+                except OperationalError as e:
+                    failed[str(e)] += 1
+            connections[alias].close()
+            with lock:
+                samples.extend(mine)
+                errors.update(failed)
+
+        threads = [threading.Thread(target=scanner, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return samples, errors, time.perf_counter() - started
+
+    def report(self, target, alias, samples, errors, elapsed):
+        if not samples and not errors:
+            raise CommandError(f"{target}: no scans completed")
+        s = summarize(samples)
+        vendor = connections[alias].vendor
+        self.stdout.write(f"{target:>15} ({vendor}): {s['count'] / elapsed:8.1f} scans/s, p50 {s['p50_ms']:.2f} ms, "
+                          f"p95 {s['p95_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms, {sum(errors.values())} failed")
+        for message, count in errors.most_common(3):
+            self.stdout.write(f"{'':>17}{count} x {message}")
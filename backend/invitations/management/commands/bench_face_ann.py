@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from invitations.ann import IVFIndex
+from invitations.benchmarking import summarize
+from invitations.face_index import FaceIndex
+
+
+class Command(BaseCommand):
+    help = "Compare IVF approximate face search against the exact index: recall@1 and latency per nprobe."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20000, help='Number of enrolled faces.')
+        parser.add_argument('--dim', type=int, default=4096, help='Embedding size (VGG-Face is 4096).')
+        parser.add_argument('--queries', type=int, default=300)
+        parser.add_argument('--nlist', type=int, default=None)
+        parser.add_argument('--nprobe', default='1,4,8,16,32', help='Comma-separated nprobe values to test.')
+        parser.add_argument('--clusters', type=int, default=200,
+                            help='Synthetic identity clusters; real embeddings are far from uniform.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        size, dim = options['size'], options['dim']
+
+        centers = rng.standard_normal((options['clusters'], dim), dtype=np.float32)
+        vectors = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.standard_normal((size, dim), dtype=np.float32)
+        picks = rng.integers(0, size, options['queries'])
+        queries = vectors[picks] + 0.3 * rng.standard_normal((len(picks), dim), dtype=np.float32)
+
+        exact = FaceIndex(np.arange(size), vectors)
+        truth, exact_samples = [], []
+        for query in queries:
+            start = time.perf_counter()
+            truth.append(exact.search(query)[0][0])
+            exact_samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ivf = IVFIndex(np.arange(size), vectors, nlist=options['nlist'], min_train_size=1)
+        build_s = time.perf_counter() - start
+        self.stdout.write(f"{size} faces, dim {dim}, nlist {len(ivf.centroids)}, IVF build {build_s:.1f}s")
+
+        stats = summarize(exact_samples)
+        self.stdout.write(f"{'backend':>12} {'recall@1':>9} {'p50_ms':>8} {'p99_ms':>8}")
+        self.stdout.write(f"{'exact':>12} {1.0:>9.3f} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f}")
+
+        for nprobe in [int(n) for n in options['nprobe'].split(',') if n.strip()]:
+            samples, hits = [], 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                result = ivf.search(query, nprobe=nprobe)
+                samples.append(time.perf_counter() - start)
+                hits += bool(result) and result[0][0] == expected
+            stats = summarize(samples)
+            self.stdout.write(
+                f"{'ivf/' + str(nprobe):>12} {hits / len(queries):>9.3f} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f}"
+            )
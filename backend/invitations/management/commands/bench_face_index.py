@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from invitations.benchmarking import summarize
+from invitations.face_index import FaceIndex
+
+
+class Command(BaseCommand):
+    help = "Benchmark face index lookup latency as the number of enrolled faces grows (synthetic embeddings)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,5000,10000,50000',
+                            help='Comma-separated enrolled-face counts to test.')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--dim', type=int, default=4096, help='Embedding size (VGG-Face is 4096).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        dim = options['dim']
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+
+        self.stdout.write(f"{'faces':>8} {'build_ms':>10} {'p50_ms':>8} {'p99_ms':>8} {'mean_ms':>8}")
+        for size in sizes:
+            vectors = rng.standard_normal((size, dim), dtype=np.float32)
+            start = time.perf_counter()
+            index = FaceIndex(np.arange(size), vectors)
+            build_ms = (time.perf_counter() - start) * 1000.0
+
+            # Queries are noisy copies of enrolled faces, like a live camera frame
+            picks = rng.integers(0, size, options['queries'])
+            queries = vectors[picks] + 0.3 * rng.standard_normal((len(picks), dim), dtype=np.float32)
+
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query)
+                samples.append(time.perf_counter() - start)
+
+            stats = summarize(samples)
+            self.stdout.write(
+                f"{size:>8} {build_ms:>10.1f} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f} {stats['mean_ms']:>8.3f}"
+            )
+            del vectors, index
@@ -0,0 +1,139 @@
+import asyncio
+import collections
+import random
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from invitations import tokens
+from invitations.benchmarking import summarize
+from invitations.models import Event
+
+User = get_user_model()
+
+PATHS = {'verify': '/api/admin/verify-qr/', 'face': '/api/admin/face-recognize/', 'my-qr': '/api/my-qr/'}
+
+
+class Command(BaseCommand):
+    help = ("Load-test the scanner endpoints of a running server with many concurrent keep-alive connections. "
+            "Run it against the same code served both ways and compare, e.g. "
+            "`gunicorn hackathon_backend.wsgi --threads 8` vs "
+            "`ASYNC_GATE_VIEWS=1 uvicorn hackathon_backend.asgi:application`. "
+            "Seeds a coordinator and passes in the server's database and removes them afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--endpoint', choices=sorted(PATHS), default='verify')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100, 300],
+                            help='Concurrent connections; one run per value.')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run.')
+        parser.add_argument('--passes', type=int, default=500)
+        parser.add_argument('--image', help='Face photo to post for --endpoint face.')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError("Only http:// URLs are supported.")
+        if options['endpoint'] == 'face' and not options['image']:
+            raise CommandError("--endpoint face needs --image.")
+        self.host, self.port = url.hostname, url.port or 80
+        self.timeout = options['timeout']
+
+        tag = uuid.uuid4().hex[:8]
+        coordinator = User.objects.create_user(f"loadtest-{tag}", is_staff=True)
+        event = Event.objects.create(name=f"Load test {tag}")
+        try:
+            User.objects.bulk_create([User(username=f"loadtest-{tag}-{i}", password='!')
+                                      for i in range(options['passes'])])
+            holders = list(User.objects.filter(username__startswith=f"loadtest-{tag}-"))
+            passes, _ = tokens.create_passes(holders, event)
+            requests = self.build_requests(options, coordinator, holders, passes)
+            for concurrency in options['concurrency']:
+                self.report(concurrency, asyncio.run(self.run(requests, concurrency, options['seconds'])))
+        finally:
+            User.objects.filter(username__startswith=f"loadtest-{tag}").delete()
+            event.delete()
+
+    def build_requests(self, options, coordinator, holders, passes):
+        """A pool of raw HTTP/1.1 requests; each connection cycles through them in random order."""
+        def request(method, path, token, body=b'', content_type=None):
+            head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                    f"Authorization: Token {token}", "Connection: keep-alive", f"Content-Length: {len(body)}"]
+            if content_type:
+                head.append(f"Content-Type: {content_type}")
+            return ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+        path = PATHS[options['endpoint']]
+        if options['endpoint'] == 'my-qr':
+            holder_tokens = Token.objects.bulk_create([Token(user=u, key=Token.generate_key()) for u in holders[:100]])
+            return [request('GET', path, t.key) for t in holder_tokens]
+        token = Token.objects.create(user=coordinator).key
+        if options['endpoint'] == 'verify':
+            return [request('POST', path, token, f'{{"qr_data": "{p.qr_code_data}", "gate": "load"}}'.encode(),
+                            'application/json') for p in passes]
+        boundary = uuid.uuid4().hex
+        with open(options['image'], 'rb') as f:
+            image = f.read()
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="gate"\r\n\r\nload\r\n'
+                f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="face.jpg"\r\n'
+                f'Content-Type: image/jpeg\r\n\r\n').encode() + image + f'\r\n--{boundary}--\r\n'.encode()
+        return [request('POST', path, token, body, f'multipart/form-data; boundary={boundary}')]
+
+    async def run(self, requests, concurrency, seconds):
+        samples, statuses = [], collections.Counter()
+        deadline = time.monotonic() + seconds
+        opened = {'now': 0, 'peak': 0}
+
+        async def connection():
+            rng = random.Random()
+            reader = writer = None
+            while time.monotonic() < deadline:
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection(self.host, self.port), self.timeout)
+                        opened['now'] += 1
+                        opened['peak'] = max(opened['peak'], opened['now'])
+                    started = time.perf_counter()
+                    writer.write(rng.choice(requests))
+                    status, keep_alive = await asyncio.wait_for(self.read_response(reader), self.timeout)
+                    samples.append(time.perf_counter() - started)
+                    statuses[status] += 1
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                    statuses[type(e).__name__] += 1
+                    keep_alive = False
+                if not keep_alive and writer is not None:
+                    writer.close()
+                    reader = writer = None
+                    opened['now'] -= 1
+            if writer is not None:
+                writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connection() for _ in range(concurrency)))
+        return samples, statuses, time.perf_counter() - started, opened['peak']
+
+    async def read_response(self, reader):
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        version, status = head[0].split(' ')[:2]
+        headers = dict(line.split(':', 1) for line in head[1:] if ':' in line)
+        headers = {k.strip().lower(): v.strip().lower() for k, v in headers.items()}
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+            keep_alive = headers.get('connection') != 'close' and version == 'HTTP/1.1'
+        else:
+            await reader.read()
+            keep_alive = False
+        return int(status), keep_alive
+
+    def report(self, concurrency, result):
+        samples, statuses, elapsed, peak = result
+        s = summarize(samples)
+        self.stdout.write(f"{concurrency:>5} connections (peak {peak} open): {s['count'] / elapsed:8.1f} req/s, "
+                          f"p50 {s['p50_ms']:.1f} ms, p95 {s['p95_ms']:.1f} ms, p99 {s['p99_ms']:.1f} ms  "
+                          f"{dict(sorted(statuses.items(), key=str))}")
@@ -0,0 +1,80 @@
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from invitations.benchmarking import summarize
+from invitations.face_index import decode_image
+
+
+def synthetic_capture(width, height, seed=0):
+    """A JPEG with camera-like texture, sized like a Scanner.jsx phone capture."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 6, (height, width, 3)).astype(np.float32)
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Measure per-scan image ingestion: temp file + full-size imread (old path) vs in-memory decode + downscale."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=1920)
+        parser.add_argument('--height', type=int, default=1080)
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--decode-only', action='store_true', help="Skip face detection on the decoded frame.")
+
+    def handle(self, *args, **options):
+        try:
+            import cv2
+        except ImportError:
+            raise CommandError("opencv (installed with deepface) is required to reproduce the old path.")
+
+        data = synthetic_capture(options['width'], options['height'])
+        detect = None
+        if not options['decode_only']:
+            # The Haar cascade behind DeepFace's "opencv" detector backend; its cost scales with frame size
+            cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+            detect = lambda frame: cascade.detectMultiScale(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), 1.1, 10)
+
+        def old_path():
+            fd, tmp_path = tempfile.mkstemp(suffix=".jpg")
+            os.close(fd)
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                frame = cv2.imread(tmp_path)
+                if detect:
+                    detect(frame)
+            finally:
+                os.remove(tmp_path)
+
+        def new_path():
+            frame = decode_image(data)
+            if detect:
+                detect(frame)
+
+        results = {}
+        for name, fn in (('tempfile+imread', old_path), ('in-memory', new_path)):
+            fn()  # warm caches / lazy imports
+            samples = []
+            for _ in range(options['runs']):
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+            results[name] = summarize(samples)
+
+        self.stdout.write(f"{options['width']}x{options['height']} JPEG, {len(data) / 1024:.0f} KiB, {options['runs']} runs"
+                          f"{' incl. detection' if detect else ''}")
+        for name, stats in results.items():
+            self.stdout.write(f"{name:>16}: p50 {stats['p50_ms']:.2f} ms  p99 {stats['p99_ms']:.2f} ms")
+        saved = results['tempfile+imread']['p50_ms'] - results['in-memory']['p50_ms']
+        self.stdout.write(f"Saved per request (p50): {saved:.2f} ms")
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.management.base import BaseCommand
+
+from invitations.benchmarking import summarize
+from invitations.mail_pool import MailPool
+from invitations.qr_images import render_png
+
+
+class Command(BaseCommand):
+    help = ("Compare sending pass emails with a new SMTP connection per message (old generate_invite path) "
+            "against the pooled connections. Point EMAIL_HOST at a local stand-in, e.g. "
+            "`python -m aiosmtpd -n -l localhost:1025`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', required=True, help='Recipient address for the test messages.')
+        parser.add_argument('--count', type=int, default=50)
+
+    def handle(self, *args, **options):
+        attachment = render_png('P1:' + 'x' * 69)
+        email_from = getattr(settings, 'EMAIL_HOST_USER', None) or 'admin@hackathon.com'
+
+        def message(i):
+            email = EmailMultiAlternatives(f'Benchmark pass {i}', 'Mail throughput benchmark.', email_from, [options['to']])
+            email.attach('pass.png', attachment, 'image/png')
+            return email
+
+        count = options['count']
+        samples = []
+        started = time.perf_counter()
+        for i in range(count):
+            t = time.perf_counter()
+            message(i).send()
+            samples.append(time.perf_counter() - t)
+        self.report("connection per message", samples, time.perf_counter() - started)
+
+        pool = MailPool(size=1, max_messages=getattr(settings, 'MAIL_POOL_MAX_MESSAGES', 100))
+        samples = []
+        started = time.perf_counter()
+        for i in range(count):
+            t = time.perf_counter()
+            error = pool.send([message(i)])[0]
+            if error:
+                self.stderr.write(f"Message {i} failed: {error}")
+            samples.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+        pool.close()
+        self.report("pooled connection", samples, elapsed)
+        self.stdout.write(f"  pool stats: {pool.stats()['counters']}")
+
+    def report(self, label, samples, elapsed):
+        s = summarize(samples)
+        self.stdout.write(f"{label:>24}: {s['count']} msgs, {s['count'] / elapsed:.1f} msg/s, "
+                          f"p50 {s['p50_ms']:.2f} ms, p95 {s['p95_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms")
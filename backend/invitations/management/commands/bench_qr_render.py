@@ -0,0 +1,37 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from invitations.benchmarking import summarize
+from invitations.qr_images import render_png, render_png_pil, render_svg
+
+
+class Command(BaseCommand):
+    help = "Compare QR rendering for bulk pass generation: qrcode+PIL (old path) vs the direct PNG encoder vs SVG."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000, help='Distinct payloads rendered per renderer.')
+        parser.add_argument('--project', type=int, default=30000, help='Pass count to extrapolate total time for.')
+
+    def handle(self, *args, **options):
+        # Token-sized payloads so the QR version matches real passes
+        payloads = ['P1:' + (uuid.uuid4().hex * 3)[:69] for _ in range(options['count'])]
+        renderers = [
+            ("qrcode + PIL", render_png_pil),
+            ("direct PNG, mask search", render_png),
+            ("direct PNG, fixed mask", lambda payload: render_png(payload, mask_pattern=0)),
+            ("SVG", render_svg),
+        ]
+        for label, render in renderers:
+            render(payloads[0]) # warm imports
+            samples, size = [], 0
+            for payload in payloads:
+                started = time.perf_counter()
+                size += len(render(payload))
+                samples.append(time.perf_counter() - started)
+            s = summarize(samples)
+            total = sum(samples)
+            self.stdout.write(f"{label:>23}: {s['count'] / total:7.0f} img/s, p50 {s['p50_ms']:.2f} ms, "
+                              f"p99 {s['p99_ms']:.2f} ms, {size / len(payloads) / 1024:.1f} KiB avg, "
+                              f"~{total / len(payloads) * options['project']:.0f} s for {options['project']} passes")
@@ -0,0 +1,127 @@
+import random
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from invitations.benchmarking import summarize, time_calls
+from invitations.models import Complaint, Event, Pass, UserProfile
+
+User = get_user_model()
+
+# Same indexes as migration 0010 (plus the id lookup replacing the photo LIKE scan)
+INDEXES = {
+    'pass': ["CREATE UNIQUE INDEX {t}_user_event ON {t} (user_id, event_id)",
+             "CREATE INDEX {t}_user_active ON {t} (user_id, is_active)"],
+    'complaint': ["CREATE INDEX {t}_reporter ON {t} (reporter_id, created_at DESC)"],
+    'event': ["CREATE UNIQUE INDEX {t}_name ON {t} (name)"],
+    'profile': ["CREATE UNIQUE INDEX {t}_id ON {t} (id)"],
+}
+SOURCES = {
+    'pass': Pass._meta.db_table,
+    'complaint': Complaint._meta.db_table,
+    'event': Event._meta.db_table,
+    'profile': UserProfile._meta.db_table,
+}
+
+
+class Command(BaseCommand):
+    help = ("Seed a large dataset (rolled back afterwards) and compare query plans and latency of the hot lookups "
+            "on unindexed copies of the tables vs copies with the indexes from migration 0010.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument('--passes-per-user', type=int, default=3)
+        parser.add_argument('--complaints', type=int, default=20000)
+        parser.add_argument('--runs', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            seeded = self.seed(options)
+            with connection.cursor() as cursor:
+                self.stdout.write("Copying tables...")
+                for name, source in SOURCES.items():
+                    for variant in ('plain', 'indexed'):
+                        table = f"bench_{name}_{variant}"
+                        cursor.execute(f"CREATE TEMPORARY TABLE {table} AS SELECT * FROM {source}")
+                        if variant == 'indexed':
+                            for statement in INDEXES[name]:
+                                cursor.execute(statement.format(t=table))
+                        cursor.execute(f"ANALYZE {table}")
+                self.run_scenarios(cursor, seeded, options['runs'])
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        tag = uuid.uuid4().hex[:8]
+        rng = random.Random(0)
+        self.stdout.write(f"Seeding {options['users']} users, {options['events']} events, "
+                          f"{options['users'] * options['passes_per_user']} passes, {options['complaints']} complaints...")
+        users = User.objects.bulk_create(
+            [User(username=f"bench-{tag}-{i}", password='!') for i in range(options['users'])], batch_size=2000)
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=f"bench-{tag}-"))
+        profiles = UserProfile.objects.bulk_create(
+            [UserProfile(user=u, photo=f"profile_photos/bench_{tag}_{u.id}.jpg") for u in users], batch_size=2000)
+        if profiles[0].pk is None:
+            profiles = list(UserProfile.objects.filter(user__in=users))
+        events = [Event.objects.create(name=f"Bench {tag} {i}") for i in range(options['events'])]
+        per_user = min(options['passes_per_user'], len(events))
+        Pass.objects.bulk_create([
+            Pass(user=u, event=event, qr_code_data=f"bench-{tag}-{u.id}-{event.id}", is_active=rng.random() > 0.1)
+            for u in users for event in rng.sample(events, per_user)
+        ], batch_size=5000)
+        now = timezone.now()
+        Complaint.objects.bulk_create([
+            Complaint(user=rng.choice(users), reporter=rng.choice(users), description='bench', created_at=now)
+            for _ in range(options['complaints'])
+        ], batch_size=5000)
+        return {'users': users, 'events': events, 'profiles': profiles}
+
+    def explain(self, cursor, sql, params):
+        if connection.vendor == 'sqlite':
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return '; '.join(row[-1] for row in cursor.fetchall())
+        cursor.execute("EXPLAIN " + sql, params)
+        return cursor.fetchone()[0]
+
+    def run_scenarios(self, cursor, seeded, runs):
+        rng = random.Random(1)
+        users, events, profiles = seeded['users'], seeded['events'], seeded['profiles']
+        true = True if connection.vendor != 'sqlite' else 1
+        scenarios = [
+            ("Pass by (user, event)", "SELECT 1 FROM {pass} WHERE user_id = %s AND event_id = %s LIMIT 1",
+             lambda: [rng.choice(users).id, rng.choice(events).id], None),
+            ("Active passes of a user", "SELECT id FROM {pass} WHERE user_id = %s AND is_active = %s",
+             lambda: [rng.choice(users).id, true], None),
+            ("Complaints filed by a user", "SELECT id FROM {complaint} WHERE reporter_id = %s ORDER BY created_at DESC LIMIT 20",
+             lambda: [rng.choice(users).id], None),
+            ("Event by name", "SELECT id FROM {event} WHERE name = %s",
+             lambda: [rng.choice(events).name], None),
+            # Before: the old face_recognize match of a file name against photo paths; after: the embedding's profile id
+            ("Face match -> profile", "SELECT id FROM {profile} WHERE photo LIKE %s",
+             lambda: [f"%{rng.choice(profiles).photo.name.rsplit('/', 1)[-1]}%"],
+             ("SELECT id FROM {profile} WHERE id = %s", lambda: [rng.choice(profiles).id])),
+        ]
+        tables = lambda variant: {name: f"bench_{name}_{variant}" for name in SOURCES}
+
+        for label, sql, params, after in scenarios:
+            after_sql, after_params = after if after else (sql, params)
+            results = {}
+            for variant, query, make_params in (('plain', sql, params), ('indexed', after_sql, after_params)):
+                query = query.format(**tables(variant))
+
+                def run(p, query=query):
+                    cursor.execute(query, p)
+                    cursor.fetchall()
+
+                samples = time_calls(run, ([make_params()] for _ in range(runs)))
+                results[variant] = (summarize(samples), self.explain(cursor, query, make_params()))
+            before, after_stats = results['plain'][0], results['indexed'][0]
+            speedup = before['p50_ms'] / after_stats['p50_ms'] if after_stats['p50_ms'] else float('inf')
+            self.stdout.write(f"\n{label}: p50 {before['p50_ms']:.3f} ms -> {after_stats['p50_ms']:.3f} ms "
+                              f"(p99 {before['p99_ms']:.3f} -> {after_stats['p99_ms']:.3f} ms, {speedup:.0f}x)")
+            self.stdout.write(f"  before: {results['plain'][1]}")
+            self.stdout.write(f"  after:  {results['indexed'][1]}")
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Each probe runs in a fresh interpreter so import costs are measured cold
+STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+django.setup()
+import invitations.urls
+elapsed = time.perf_counter() - start
+print(json.dumps({{'startup_s': elapsed, 'deepface_loaded': 'deepface' in sys.modules,
+                   'tensorflow_loaded': 'tensorflow' in sys.modules, 'pandas_loaded': 'pandas' in sys.modules}}))
+"""
+
+FIRST_SCAN_PROBE = """
+import json, os, time
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+django.setup()
+import numpy as np
+from invitations.face_index import represent, warm_up
+frame = (np.random.default_rng(0).random((480, 640, 3)) * 255).astype(np.uint8)
+warm_s = None
+if {warm!r}:
+    start = time.perf_counter()
+    warm_up(load_index=False)
+    warm_s = time.perf_counter() - start
+timings = []
+for _ in range(3):
+    start = time.perf_counter()
+    represent(frame)
+    timings.append(time.perf_counter() - start)
+print(json.dumps({{'warm_up_s': warm_s, 'scans_s': timings}}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Report Django startup time, which heavy modules it imports, and first-scan latency cold vs warmed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-inference', action='store_true', help='Only measure startup (no deepface needed).')
+
+    def _probe(self, source, **params):
+        code = source.format(settings_module=os.environ.get('DJANGO_SETTINGS_MODULE', 'hackathon_backend.settings'), **params)
+        env = dict(os.environ, FACE_WARMUP='0')
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        startup = self._probe(STARTUP_PROBE)
+        self.stdout.write(
+            f"Startup (django.setup + URLconf): {startup['startup_s'] * 1000:.0f} ms; "
+            f"deepface={startup['deepface_loaded']} tensorflow={startup['tensorflow_loaded']} pandas={startup['pandas_loaded']}"
+        )
+        if options['skip_inference']:
+            return
+
+        for warm in (False, True):
+            result = self._probe(FIRST_SCAN_PROBE, warm=warm)
+            label = 'warmed' if warm else 'cold'
+            scans = ', '.join(f"{t * 1000:.0f}" for t in result['scans_s'])
+            prefix = f"warm-up {result['warm_up_s']:.2f}s, " if warm else ''
+            self.stdout.write(f"{label:>6}: {prefix}first three scans {scans} ms")
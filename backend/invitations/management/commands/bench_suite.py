@@ -0,0 +1,210 @@
+import importlib.util
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings, setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.authtoken.models import Token
+
+from invitations import bench_data, entry_log
+from invitations.benchmarking import summarize
+from invitations.face_index import MODEL_NAME, reset_index
+from invitations.face_worker import embed_image
+from invitations.models import FaceEmbedding, UserProfile
+
+User = get_user_model()
+
+BASELINE = Path(__file__).resolve().parents[2] / 'bench_baseline.json'
+# Below this many requests one GC pause or flusher write swings p95 and throughput, so only the median is compared
+MIN_TAIL_SAMPLES = 100
+SCENARIOS = ['verify_qr_cold', 'verify_qr_warm', 'users_list', 'bulk_invite', 'face_recognize']
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway test database and benchmark the gate and admin APIs in-process: verify_qr bursts "
+            "(cache cold and warm), the admin user list, bulk invites and face_recognize at several index sizes. "
+            "Reports p50/p95/p99, throughput and queries per request, and fails if a scenario regresses against "
+            "the stored baseline (more queries per request, or median latency worse than --tolerance; p95 and "
+            "throughput too for scenarios of 100+ requests).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--events', type=int, default=5)
+        parser.add_argument('--passes-per-user', type=int, default=2)
+        parser.add_argument('--verify', type=int, default=500, help='Scans per verify_qr burst.')
+        parser.add_argument('--invite-size', type=int, default=500)
+        parser.add_argument('--invite-runs', type=int, default=10)
+        parser.add_argument('--face-sizes', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--face-requests', type=int, default=20)
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline.')
+        parser.add_argument('--no-compare', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative slowdown before failing (0.5 = 50%%).')
+        parser.add_argument('--output', help='Also write the results as JSON to this path.')
+
+    def handle(self, *args, **options):
+        results = {}
+        old_name = connection.settings_dict['NAME']
+        # Lets the test client's 'testserver' host through ALLOWED_HOSTS and keeps invite mail in memory
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(MEDIA_ROOT=tmpdir, ANTI_PASSBACK_SECONDS=0):
+            if connection.vendor == 'sqlite':
+                # A file rather than the default in-memory test database, so the entry log
+                # flusher thread can write while requests are served
+                connection.settings_dict['TEST']['NAME'] = str(Path(tmpdir) / 'bench.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.stdout.write(f"Seeding {options['users']} users, {options['events']} events...")
+                seeded = bench_data.seed(users=options['users'], events=options['events'],
+                                         passes_per_user=options['passes_per_user'])
+                admin = User.objects.create_superuser('bench-admin', 'bench-admin@example.com', None)
+                token = Token.objects.create(user=admin).key
+                # Server errors count as failed requests instead of aborting the run
+                self.client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f"Token {token}")
+                for scenario in options['scenarios']:
+                    results.update(getattr(self, scenario)(seeded, options))
+            finally:
+                # Buffered gate entries belong to the test database
+                entry_log.get_buffer().flush()
+                reset_index()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self.report(results)
+        run = {'parameters': {k: options[k] for k in ('users', 'events', 'passes_per_user', 'verify',
+                                                      'invite_size', 'invite_runs', 'face_sizes', 'face_requests')},
+               'scenarios': results}
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(run, indent=2) + '\n')
+        if options['save_baseline']:
+            Path(options['baseline']).write_text(json.dumps(run, indent=2) + '\n')
+            self.stdout.write(f"Saved baseline to {options['baseline']}")
+        elif not options['no_compare']:
+            self.compare(run, options)
+
+    def measure(self, calls, ok=(200,)):
+        samples, queries, failed = [], [], 0
+        started = time.perf_counter()
+        for call in calls:
+            with CaptureQueriesContext(connection) as captured:
+                t = time.perf_counter()
+                response = call()
+                samples.append(time.perf_counter() - t)
+            queries.append(len(captured))
+            failed += response.status_code not in ok
+        elapsed = time.perf_counter() - started
+        s = summarize(samples)
+        return {
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(s['p50_ms'], 3),
+            "p95_ms": round(s['p95_ms'], 3),
+            "p99_ms": round(s['p99_ms'], 3),
+            "queries_per_request": round(sum(queries) / len(queries), 2),
+            "failed": failed,
+        }
+
+    def verify_calls(self, seeded, options):
+        passes = random.Random(0).sample(seeded['passes'], min(options['verify'], len(seeded['passes'])))
+        return [lambda p=p: self.client.post('/api/admin/verify-qr/', {'qr_data': p.qr_code_data, 'gate': 'bench'},
+                                             content_type='application/json') for p in passes]
+
+    def verify_qr_cold(self, seeded, options):
+        caches[getattr(settings, 'PASS_CACHE_ALIAS', 'default')].clear()
+        return {'verify_qr_cold': self.measure(self.verify_calls(seeded, options))}
+
+    def verify_qr_warm(self, seeded, options):
+        calls = self.verify_calls(seeded, options)
+        for call in calls:
+            call()
+        return {'verify_qr_warm': self.measure(calls)}
+
+    def users_list(self, seeded, options):
+        pages = []
+        url = '/api/users/?page_size=100'
+        while url:
+            pages.append(url)
+            url = self.client.get(url).json()['next']
+        return {'users_list': self.measure([lambda url=url: self.client.get(url) for url in pages])}
+
+    def bulk_invite(self, seeded, options):
+        usernames = [u.username for u in seeded['users'][:options['invite_size']]]
+        calls = [lambda i=i: self.client.post('/api/admin/bulk-invite/', {'usernames': usernames,
+                                                                          'event': f"Bench invites {i}"},
+                                              content_type='application/json')
+                 for i in range(options['invite_runs'])]
+        return {'bulk_invite': self.measure(calls, ok=(202,))}
+
+    def face_recognize(self, seeded, options):
+        if not (importlib.util.find_spec('deepface') or getattr(settings, 'FACE_WORKER_ADDRESS', None)):
+            self.stdout.write("face_recognize: skipped, needs deepface installed or FACE_WORKER_ADDRESS")
+            return {}
+        probe = bench_data.synthetic_photo(12345)
+        probe_vector = embed_image(probe)
+        results = {}
+        for size in options['face_sizes']:
+            size = min(size, len(seeded['users']))
+            FaceEmbedding.objects.all().delete()
+            bench_data.enroll_random_faces(seeded['users'][:size - 1], np.random.default_rng(size))
+            # The probe itself is enrolled too, so every request ends in a match
+            profile = UserProfile.objects.get(user=seeded['users'][size - 1])
+            FaceEmbedding.objects.create(profile=profile, model_name=MODEL_NAME, photo_name='probe',
+                                         vector=probe_vector.tobytes())
+            reset_index()
+            post = lambda: self.client.post('/api/admin/face-recognize/', {'image': SimpleUploadedFile('probe.jpg', probe), 'gate': 'bench'})
+            post()  # loads the index
+            results[f'face_recognize_{size}'] = self.measure([post] * options['face_requests'])
+        return results
+
+    def report(self, results):
+        self.stdout.write(f"\n{'scenario':<22} {'reqs':>6} {'req/s':>9} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} "
+                          f"{'queries':>8} {'failed':>7}")
+        for name, r in results.items():
+            self.stdout.write(f"{name:<22} {r['requests']:>6} {r['throughput_rps']:>9.1f} {r['p50_ms']:>9.2f} "
+                              f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['queries_per_request']:>8.2f} "
+                              f"{r['failed']:>7}")
+
+    def compare(self, run, options):
+        path = Path(options['baseline'])
+        if not path.exists():
+            self.stdout.write(f"No baseline at {path}; store one with --save-baseline.")
+            return
+        baseline = json.loads(path.read_text())
+        if baseline.get('parameters') != run['parameters']:
+            self.stdout.write(self.style.WARNING("Parameters differ from the baseline run; comparing anyway."))
+        slack = 1 + options['tolerance']
+        regressions = []
+        for name, base in baseline['scenarios'].items():
+            current = run['scenarios'].get(name)
+            if current is None:
+                continue
+            if current['failed']:
+                regressions.append(f"{name}: {current['failed']} requests failed")
+            # Query counts are deterministic, so any increase is a regression
+            if current['queries_per_request'] > base['queries_per_request'] + 0.01:
+                regressions.append(f"{name}: {current['queries_per_request']} queries/request "
+                                   f"(baseline {base['queries_per_request']})")
+            many = current['requests'] >= MIN_TAIL_SAMPLES
+            # Sub-millisecond noise is not a regression
+            for stat in ('p50_ms', 'p95_ms') if many else ('p50_ms',):
+                if current[stat] > base[stat] * slack + 0.5:
+                    regressions.append(f"{name}: {stat[:3]} {current[stat]} ms (baseline {base[stat]} ms)")
+            if many and current['throughput_rps'] * slack < base['throughput_rps']:
+                regressions.append(f"{name}: {current['throughput_rps']} req/s (baseline {base['throughput_rps']})")
+        if regressions:
+            raise CommandError("Performance regressed against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}."))
+
@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = "Rebuild (and retrain) the configured face index from stored embeddings and persist it to disk."
+
+    def handle(self, *args, **options):
+        backend = import_string(settings.FACE_INDEX_BACKEND)
+        index = backend(**settings.FACE_INDEX_OPTIONS)
+        if not hasattr(index, 'save') or not getattr(index, 'path', None):
+            raise CommandError(f"{settings.FACE_INDEX_BACKEND} has no persisted form; set FACE_INDEX_OPTIONS['path'].")
+
+        start = time.perf_counter()
+        index.reload_from_db()
+        if hasattr(index, 'train'):
+            index.train()
+        index.save(index.path)
+        self.stdout.write(f"Indexed {len(index)} faces into {index.path} in {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from invitations.face_index import enroll_profile
+from invitations.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Compute face embeddings for profile photos that don't have one yet (or all with --all)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-embed every photo, not just missing or stale ones.')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(photo='').exclude(photo__isnull=True).select_related('face_embedding', 'user')
+        enrolled = skipped = failed = 0
+        for profile in profiles.iterator(chunk_size=500):
+            current = getattr(profile, 'face_embedding', None)
+            if not options['all'] and current is not None and current.photo_name == profile.photo.name:
+                skipped += 1
+                continue
+            if enroll_profile(profile):
+                enrolled += 1
+            else:
+                failed += 1
+        self.stdout.write(f"Enrolled {enrolled}, up to date {skipped}, failed {failed}.")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from invitations.suspensions import expire
+
+
+class Command(BaseCommand):
+    help = ("Lift timed suspensions that have ended, in one bulk update, and log them for offline gate devices "
+            "(see invitations/suspensions.py). Run from cron, or keep it running with --every.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, metavar='SECONDS', help='Sweep repeatedly at this interval.')
+
+    def handle(self, *args, **options):
+        while True:
+            lifted = expire()
+            if lifted or not options['every']:
+                self.stdout.write(f"Lifted {len(lifted)} expired suspension(s).")
+            if not options['every']:
+                return
+            close_old_connections()
+            time.sleep(options['every'])
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from invitations.face_worker import FaceWorkerServer, parse_address
+
+
+class Command(BaseCommand):
+    help = "Run the local face inference service that face_recognize submits to (see FACE_WORKER_ADDRESS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=None, help='host:port or unix socket path (default: FACE_WORKER_ADDRESS).')
+        parser.add_argument('--processes', type=int, default=settings.FACE_WORKER_PROCESSES,
+                            help='Inference processes, each holding one model copy (default: CPU count).')
+        parser.add_argument('--queue-size', type=int, default=settings.FACE_WORKER_QUEUE_SIZE)
+        parser.add_argument('--batch-size', type=int, default=settings.FACE_WORKER_BATCH_SIZE)
+        parser.add_argument('--batch-wait-ms', type=float, default=settings.FACE_WORKER_BATCH_WAIT_MS)
+
+    def handle(self, *args, **options):
+        address = options['address'] or settings.FACE_WORKER_ADDRESS
+        if not address:
+            raise CommandError("Pass --address or set FACE_WORKER_ADDRESS.")
+        server = FaceWorkerServer(
+            parse_address(address),
+            processes=options['processes'],
+            queue_size=options['queue_size'],
+            batch_size=options['batch_size'],
+            batch_wait=options['batch_wait_ms'] / 1000.0,
+        )
+        self.stdout.write(f"Face worker on {address}: {server.processes} processes, queue {options['queue_size']}, "
+                          f"batches of up to {options['batch_size']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,54 @@
+import contextlib
+import json
+import sys
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invitations.user_import import FORMATS, guess_format, import_users
+
+
+class Command(BaseCommand):
+    help = ("Register users in bulk from a CSV or JSONL file (see invitations/user_import.py), optionally with "
+            "profile photos from a zip archive. Bad rows are reported and skipped; the rest are imported.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, or - for stdin.")
+        parser.add_argument('--format', choices=FORMATS, help='Default: guessed from the file extension (csv for stdin).')
+        parser.add_argument('--photos', help='Zip archive with the photos named in the photo column.')
+        parser.add_argument('--batch-size', type=int, help='Rows per insert transaction (USER_IMPORT_BATCH_SIZE).')
+        parser.add_argument('--processes', type=int,
+                            help='Password hashing processes (USER_IMPORT_PROCESSES, default the CPU count).')
+        parser.add_argument('--no-enroll', action='store_true',
+                            help="Store photos without computing embeddings; run 'manage.py enroll_faces' later.")
+        parser.add_argument('--errors', help='Also write error and warning events as JSON lines to this file.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else guess_format(path))
+        with contextlib.ExitStack() as stack:
+            try:
+                stream = sys.stdin.buffer if path == '-' else stack.enter_context(open(path, 'rb'))
+                photos = stack.enter_context(open(options['photos'], 'rb')) if options['photos'] else None
+            except OSError as e:
+                raise CommandError(e)
+            report = stack.enter_context(open(options['errors'], 'w')) if options['errors'] else None
+            try:
+                events = import_users(stream, fmt, photos, batch_size=options['batch_size'],
+                                      processes=options['processes'], enroll=not options['no_enroll'])
+            except zipfile.BadZipFile as e:
+                raise CommandError(f"{options['photos']}: {e}")
+            for event in events:
+                if event['type'] in ('error', 'warning') and report is not None:
+                    report.write(json.dumps(event) + '\n')
+                if event['type'] == 'error':
+                    problems = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in event['errors'].items())
+                    self.stderr.write(f"line {event['line']} ({event['username']}): {problems}")
+                elif event['type'] == 'warning':
+                    self.stderr.write(f"line {event['line']} ({event['username']}): {event['detail']}")
+                elif event['type'] == 'progress':
+                    self.stdout.write(f"{event['rows']} rows read, {event['created']} created, {event['failed']} failed")
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Imported {event['created']} of {event['rows']} rows in {event['seconds']} s "
+                        f"({event['failed']} failed, {event['enrolled']} faces enrolled)."))
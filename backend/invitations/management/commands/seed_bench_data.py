@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from invitations import bench_data
+
+
+class Command(BaseCommand):
+    help = ("Seed synthetic users, profiles (with generated photos), events, passes and face embeddings into the "
+            "configured database, for load tests against a running server. Remove them with --remove <tag>.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=5)
+        parser.add_argument('--passes-per-user', type=int, default=2)
+        parser.add_argument('--photos', type=int, default=20, help='Distinct generated photos, shared round-robin.')
+        parser.add_argument('--faces', type=int, default=0, help='Profiles to enroll with random embeddings.')
+        parser.add_argument('--remove', metavar='TAG', help='Delete the data seeded under this tag instead.')
+
+    def handle(self, *args, **options):
+        if options['remove']:
+            bench_data.unseed(options['remove'])
+            self.stdout.write(f"Removed bench data tagged {options['remove']}.")
+            return
+        seeded = bench_data.seed(users=options['users'], events=options['events'],
+                                 passes_per_user=options['passes_per_user'], photos=options['photos'],
+                                 faces=options['faces'])
+        self.stdout.write(f"Seeded {len(seeded['users'])} users, {len(seeded['events'])} events and "
+                          f"{len(seeded['passes'])} passes, tag {seeded['tag']} (users bench-{seeded['tag']}-N).")
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from invitations.invites import RateLimiter, deliver_due
+from invitations.mail_pool import get_pool
+from invitations.models import InviteEmail
+
+
+class Command(BaseCommand):
+    help = "Deliver queued bulk invite emails with rate limiting and retries (see invitations/invites.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'INVITE_EMAIL_RATE', 5),
+                            help='Maximum messages per second for this worker (0 = unlimited).')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'INVITE_EMAIL_BATCH_SIZE', 50),
+                            help='Emails claimed per round; each round uses one SMTP connection.')
+        parser.add_argument('--poll-seconds', type=float, default=5.0, help='Sleep between polls when nothing is due.')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due instead of polling.')
+
+    def handle(self, *args, **options):
+        limiter = RateLimiter(options['rate'])
+        totals = {'sent': 0, 'retry': 0, 'failed': 0}
+        started = time.perf_counter()
+        try:
+            while True:
+                outcomes = deliver_due(options['batch_size'], limiter)
+                if not any(outcomes.values()):
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_seconds'])
+                    continue
+                for key, n in outcomes.items():
+                    totals[key] += n
+                elapsed = time.perf_counter() - started
+                remaining = InviteEmail.objects.filter(status__in=('queued', 'sending')).count()
+                self.stdout.write(f"sent {totals['sent']}, retrying {totals['retry']}, failed {totals['failed']}, "
+                                  f"{remaining} pending, {totals['sent'] / elapsed:.1f} msg/s")
+        except KeyboardInterrupt:
+            pass
+        pool = get_pool()
+        stats = pool.stats()
+        pool.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: sent {totals['sent']}, retried {totals['retry']}, failed {totals['failed']}; "
+            f"{stats['counters'].get('connections_opened', 0)} connections opened, "
+            f"{stats['counters'].get('reconnects', 0)} reconnects, {stats['messages_per_second']} msg/s on the wire"))
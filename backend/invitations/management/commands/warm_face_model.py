@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from invitations.face_index import get_index, warm_up
+
+
+class Command(BaseCommand):
+    help = "Load the face recognition model and face index, reporting how long each takes."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        warm_up(load_index=False)
+        model_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = get_index()
+        index_s = time.perf_counter() - start
+        self.stdout.write(f"Model ready in {model_s:.2f}s; index of {len(index)} faces loaded in {index_s:.2f}s.")
@@ -0,0 +1,209 @@
+"""
+In-process request metrics, exposed in Prometheus text format at /api/admin/metrics/.
+
+MetricsMiddleware times every request and, through a database execute
+wrapper, counts its SQL queries and their time. Results go into histograms
+labelled by URL name. Face recognition records its phases (decode, detect,
+embed, search, and the face worker round trip) with ``timed()``. Everything is per process: scrape every
+worker, or run one.
+
+Slow-request sampling: with METRICS_SLOW_REQUEST_SECONDS set, a
+METRICS_SLOW_SAMPLE_RATE share of requests keeps its SQL and runs under
+cProfile. Those that turn out slower than the threshold are logged with
+their queries and the top of the profile.
+"""
+import contextlib
+import contextvars
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers a cached scan (~1 ms) up to a cold face model load
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # name -> (help, buckets, {labels: Histogram})
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            self._metrics.setdefault(name, (help_text, buckets, {}))
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            _, buckets, series = self._metrics[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets, series) in sorted(self._metrics.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    labels = ','.join(f'{k}="{_escape(v)}"' for k, v in key)
+                    sep = ',' if labels else ''
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+registry.histogram('http_request_duration_seconds', 'Wall time of requests by URL name, method and status.')
+registry.histogram('http_request_db_queries', 'SQL queries per request.', QUERY_BUCKETS)
+registry.histogram('http_request_db_seconds', 'Time spent in SQL per request.')
+registry.histogram('face_phase_seconds', 'Face recognition time per phase (decode, detect, embed, search, worker).')
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """Record the duration of a face recognition phase."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('face_phase_seconds', time.perf_counter() - started, phase=phase)
+
+
+class RequestStats:
+    def __init__(self, keep_sql=False):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.sql = [] if keep_sql else None
+
+
+# Set for the duration of a request; asgiref copies it into sync_to_async threads,
+# so queries of async views are counted too
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.sql is not None:
+            stats.sql.append((elapsed, sql))
+
+
+def _install(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None)
+        self.sample_rate = getattr(settings, 'METRICS_SLOW_SAMPLE_RATE', 0.01)
+        connection_created.connect(_install)
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        sampled = bool(self.slow_seconds) and random.random() < self.sample_rate
+        stats = RequestStats(keep_sql=sampled)
+        return stats, _current.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, token, started, profiler=None):
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        match = request.resolver_match
+        endpoint = (match.url_name or match.route) if match else 'unmatched'
+        registry.observe('http_request_duration_seconds', elapsed,
+                         endpoint=endpoint, method=request.method, status=response.status_code)
+        registry.observe('http_request_db_queries', stats.queries, endpoint=endpoint)
+        registry.observe('http_request_db_seconds', stats.db_seconds, endpoint=endpoint)
+        if stats.sql is not None and elapsed >= self.slow_seconds:
+            self.log_slow(request, endpoint, elapsed, stats, profiler)
+
+    def log_slow(self, request, endpoint, elapsed, stats, profiler):
+        slowest = sorted(stats.sql, reverse=True)[:10]
+        report = [f"Slow request {request.method} {request.path} ({endpoint}): {elapsed * 1000:.1f} ms, "
+                  f"{stats.queries} queries in {stats.db_seconds * 1000:.1f} ms"]
+        report += [f"  {seconds * 1000:8.2f} ms  {sql}" for seconds, sql in slowest]
+        if profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(15)
+            report.append(out.getvalue())
+        logger.warning('\n'.join(report))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self._start()
+        profiler = cProfile.Profile() if stats.sql is not None else None
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                profiler = None  # another profiler is already running in this thread
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        self._finish(request, response, stats, token, started, profiler)
+        return response
+
+    async def __acall__(self, request):
+        # cProfile follows one thread, which an async request does not stay on; SQL is still sampled
+        stats, token, started = self._start()
+        response = await self.get_response(request)
+        self._finish(request, response, stats, token, started)
+        return response
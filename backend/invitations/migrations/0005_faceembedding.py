@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitations', '0004_complaint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(default='VGG-Face', max_length=50)),
+                ('photo_name', models.CharField(max_length=255)),
+                ('vector', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='face_embedding', to='invitations.userprofile')),
+            ],
+        ),
+    ]
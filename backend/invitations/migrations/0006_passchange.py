@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitations', '0005_faceembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PassChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('revoked', 'Pass revoked'), ('restored', 'Pass restored'), ('suspended', 'User suspended'), ('unsuspended', 'User unsuspended')], max_length=20)),
+                ('pass_id', models.IntegerField(blank=True, null=True)),
+                ('event_id', models.IntegerField(blank=True, null=True)),
+                ('user_id', models.IntegerField()),
+                ('suspension_end_date', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
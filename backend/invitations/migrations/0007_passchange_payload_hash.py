@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitations', '0006_passchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passchange',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='passchange',
+            name='kind',
+            field=models.CharField(choices=[('created', 'Pass created'), ('revoked', 'Pass revoked'), ('restored', 'Pass restored'), ('suspended', 'User suspended'), ('unsuspended', 'User unsuspended')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitations', '0007_passchange_payload_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InviteBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('requested', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invite_batches', to=settings.AUTH_USER_MODEL)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invite_batches', to='invitations.event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InviteEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emails', to='invitations.invitebatch')),
+                ('user_pass', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invite_emails', to='invitations.pass')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='invitations_status_a92ea7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitations', '0008_invitebatch_inviteemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='college_name',
+            field=models.CharField(blank=True, db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['-created_at', '-id'], name='complaint_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['role', 'student_type'], name='profile_role_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(condition=models.Q(('is_suspended', True)), fields=['user'], name='profile_suspended_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:34
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_events(apps, schema_editor):
+    # Event names become unique: fold every duplicate into the oldest event of that name
+    Event = apps.get_model('invitations', 'Event')
+    Pass = apps.get_model('invitations', 'Pass')
+    InviteBatch = apps.get_model('invitations', 'InviteBatch')
+    duplicated = Event.objects.values('name').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    for row in duplicated:
+        extra = Event.objects.filter(name=row['name']).exclude(id=row['keep'])
+        Pass.objects.filter(event__in=extra).update(event_id=row['keep'])
+        InviteBatch.objects.filter(event__in=extra).update(event_id=row['keep'])
+        extra.delete()
+
+
+def remove_duplicate_passes(apps, schema_editor):
+    # Keep one pass per (user, event), preferring an active one, then the oldest
+    Pass = apps.get_model('invitations', 'Pass')
+    PassChange = apps.get_model('invitations', 'PassChange')
+    duplicated = Pass.objects.values('user_id', 'event_id').annotate(n=Count('id')).filter(n__gt=1)
+    for row in duplicated:
+        passes = list(Pass.objects.filter(user_id=row['user_id'], event_id=row['event_id']).order_by('-is_active', 'id'))
+        for extra in passes[1:]:
+            if extra.is_active:
+                # Signals don't run here; tell offline gate devices directly
+                PassChange.objects.create(kind='revoked', pass_id=extra.id, event_id=extra.event_id, user_id=extra.user_id,
+                                          payload_hash=hashlib.sha256(extra.qr_code_data.encode()).hexdigest())
+            extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitations', '0009_list_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_events, migrations.RunPython.noop),
+        migrations.RunPython(remove_duplicate_passes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='event',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['reporter', '-created_at'], name='complaint_reporter_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['user', 'is_active'], name='pass_user_active_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pass',
+            constraint=models.UniqueConstraint(fields=('user', 'event'), name='unique_pass_per_user_event'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invitations', '0010_hot_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntryLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gate', models.CharField(blank=True, max_length=50)),
+                ('method', models.CharField(choices=[('qr', 'QR code'), ('face', 'Face recognition')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('coordinator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scans', to=settings.AUTH_USER_MODEL)),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entries', to='invitations.event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to=settings.AUTH_USER_MODEL)),
+                ('user_pass', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entries', to='invitations.pass')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', '-created_at'], name='entry_event_idx'), models.Index(fields=['user', '-created_at'], name='entry_user_idx')],
+            },
+        ),
+    ]
@@ -14,18 +14,36 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='student')
     student_type = models.CharField(max_length=20, choices=STUDENT_TYPE_CHOICES, default='internal')
-    college_name = models.CharField(max_length=200, blank=True, null=True)
+    college_name = models.CharField(max_length=200, blank=True, null=True, db_index=True) # prefix search in the admin user list
     student_id = models.CharField(max_length=50, blank=True, null=True)
     is_suspended = models.BooleanField(default=False)
     is_suspended = models.BooleanField(default=False)
     suspension_end_date = models.DateTimeField(null=True, blank=True)
     photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['role', 'student_type'], name='profile_role_type_idx'),
+            # Suspended users are a small minority, so index only them
+            models.Index(fields=['user'], condition=models.Q(is_suspended=True), name='profile_suspended_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
+class FaceEmbedding(models.Model):
+    # One stored embedding per profile photo so recognition never reads image files
+    profile = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='face_embedding')
+    model_name = models.CharField(max_length=50, default='VGG-Face')
+    photo_name = models.CharField(max_length=255) # The photo this vector was computed from
+    vector = models.BinaryField() # float32 bytes
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Embedding for {self.profile.user.username}"
+
 class Event(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True) # looked up by name in generate_invite/revoke_invite
     date = models.DateTimeField(null=True, blank=True)
     is_persistent = models.BooleanField(default=False) # True for "Main Gate Access", False for "Music Fest"
 
@@ -39,6 +57,13 @@ class Pass(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            # One pass per user per event; the index behind it serves (user, event) lookups too
+            models.UniqueConstraint(fields=['user', 'event'], name='unique_pass_per_user_event'),
+        ]
+        indexes = [models.Index(fields=['user', 'is_active'], name='pass_user_active_idx')]
+
     def __str__(self):
         return f"{self.user.username} - {self.event.name}"
 
@@ -55,5 +80,92 @@ class Complaint(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='complaint_newest_idx'),
+            models.Index(fields=['reporter', '-created_at'], name='complaint_reporter_idx'),
+        ]
+
     def __str__(self):
         return f"Complaint against {self.user.username} by {self.reporter.username if self.reporter else 'Unknown'}"
+
+class PassChange(models.Model):
+    """
+    Append-only log of pass creations, revocations and suspension changes.
+    Gate devices that validate passes offline pull it incrementally; the id is
+    the cursor. Plain integer columns, not FKs, so entries outlive the rows
+    they describe.
+    """
+    KIND_CHOICES = (
+        ('created', 'Pass created'),
+        ('revoked', 'Pass revoked'),
+        ('restored', 'Pass restored'),
+        ('suspended', 'User suspended'),
+        ('unsuspended', 'User unsuspended'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    pass_id = models.IntegerField(null=True, blank=True)
+    event_id = models.IntegerField(null=True, blank=True)
+    user_id = models.IntegerField()
+    payload_hash = models.CharField(max_length=64, blank=True) # sha256 of the pass's qr_code_data
+    suspension_end_date = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} user={self.user_id} pass={self.pass_id}"
+
+class InviteBatch(models.Model):
+    # One bulk invite request; its emails are delivered by 'manage.py send_invites'
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='invite_batches')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='invite_batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    requested = models.IntegerField(default=0) # users matched by the request
+    skipped = models.IntegerField(default=0) # already held a pass for the event
+
+    def __str__(self):
+        return f"Invite batch {self.id} for {self.event.name}"
+
+class InviteEmail(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    batch = models.ForeignKey(InviteBatch, on_delete=models.CASCADE, related_name='emails')
+    user_pass = models.ForeignKey(Pass, on_delete=models.CASCADE, related_name='invite_emails')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    # Due time for queued rows; for 'sending' rows it is the lease expiry after which a crashed worker's claim is retaken
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"Invite email for pass {self.user_pass_id} ({self.status})"
+
+class EntryLog(models.Model):
+    # One accepted gate scan. Written in batches by entry_log.py, so created_at is the scan time, not the insert time
+    METHOD_CHOICES = (
+        ('qr', 'QR code'),
+        ('face', 'Face recognition'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='entries')
+    user_pass = models.ForeignKey(Pass, on_delete=models.SET_NULL, null=True, blank=True, related_name='entries')
+    event = models.ForeignKey(Event, on_delete=models.SET_NULL, null=True, blank=True, related_name='entries')
+    gate = models.CharField(max_length=50, blank=True)
+    method = models.CharField(max_length=10, choices=METHOD_CHOICES)
+    coordinator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='scans')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event', '-created_at'], name='entry_event_idx'),
+            models.Index(fields=['user', '-created_at'], name='entry_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} entered via {self.method} at {self.created_at}"
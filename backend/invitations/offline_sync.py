@@ -0,0 +1,125 @@
+"""
+Snapshot + delta feed for gate devices that verify passes offline.
+
+A device first downloads a snapshot of every active pass for its event, one
+JSON object per line, keyed by the sha256 of the QR payload (the raw payload
+never leaves the server). The header line carries a PassChange cursor taken
+before the snapshot was read, so replaying deltas from it is always safe
+even if changes landed while the snapshot streamed. After that the device
+polls with ?cursor= and applies only what was created, revoked, restored or
+(un)suspended since.
+
+PassChange ids are handed out at insert but become visible at commit, so on
+PostgreSQL a lower id can appear after a higher one. A cursor never moves
+past a change younger than PASS_CHANGES_SETTLE_SECONDS (see
+settled_cursor()); the newest changes are still returned at once, and again
+on the next poll until they settle. Every change sets state (revoked,
+suspended until ...), so replaying them in order is harmless.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Pass, PassChange
+from .tokens import is_pending, payload_hash
+
+PASS_FIELDS = (
+    'id', 'user_id', 'qr_code_data', 'user__username', 'user__first_name', 'user__last_name',
+    'user__profile__role', 'user__profile__photo', 'user__profile__is_suspended',
+    'user__profile__suspension_end_date',
+)
+
+
+def current_cursor():
+    return PassChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def settled_cursor():
+    """
+    Highest change id no in-flight transaction can still slip under: the
+    newest change older than PASS_CHANGES_SETTLE_SECONDS. Walks down from the
+    newest id, so it only reads the changes inside the window.
+    """
+    settle = timedelta(seconds=getattr(settings, 'PASS_CHANGES_SETTLE_SECONDS', 30))
+    return (PassChange.objects.filter(created_at__lte=timezone.now() - settle)
+            .order_by('-id').values_list('id', flat=True).first() or 0)
+
+
+def next_cursor(since, last_id):
+    """Cursor to hand back after returning changes up to ``last_id``, held at the settled one."""
+    return max(since, min(last_id, settled_cursor()))
+
+
+def _line(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+def pass_entry(row, photo_url):
+    """Compact device-side record of one pass, built from a Pass.values(*PASS_FIELDS) row."""
+    photo = row['user__profile__photo']
+    return {
+        "hash": payload_hash(row['qr_code_data']),
+        "pass_id": row['id'],
+        "user_id": row['user_id'],
+        "username": row['user__username'],
+        "name": f"{row['user__first_name']} {row['user__last_name']}".strip(),
+        "role": row['user__profile__role'],
+        "photo_url": photo_url(default_storage.url(photo)) if photo else None,
+        "suspended": bool(row['user__profile__is_suspended']),
+        "suspension_end_date": row['user__profile__suspension_end_date'],
+    }
+
+
+def stream_snapshot(event, photo_url=str, chunk_size=2000):
+    """
+    Yields the snapshot as JSON lines: a header with the cursor, one line per
+    active pass, then an end marker with the count so devices can detect a
+    truncated download. Rows are read with a server-side iterator, so memory
+    stays flat however many passes the event has.
+    """
+    cursor = settled_cursor()
+    yield _line({"type": "snapshot", "event": event.id, "event_name": event.name, "cursor": cursor})
+    rows = (Pass.objects.filter(event=event, is_active=True)
+            .order_by('id').values(*PASS_FIELDS).iterator(chunk_size=chunk_size))
+    count = 0
+    for row in rows:
+        if is_pending(row['qr_code_data']):
+            continue
+        count += 1
+        yield _line(pass_entry(row, photo_url))
+    yield _line({"type": "end", "count": count, "cursor": cursor})
+
+
+def changes_since(event, since, limit, photo_url=str):
+    """
+    Changes after ``since`` relevant to ``event``: its own pass changes plus
+    suspensions of anyone holding one of its passes. Created/restored passes
+    come with the full record so the device can add them without a lookup.
+    Returns (changes, cursor, has_more).
+    """
+    head = current_cursor()
+    holders = Pass.objects.filter(event=event).values('user_id')
+    changes = list(PassChange.objects.filter(id__gt=since, id__lte=head)
+                   .filter(Q(event_id=event.id) | Q(event_id__isnull=True, user_id__in=holders))
+                   .order_by('id').values('id', 'kind', 'pass_id', 'user_id', 'payload_hash',
+                                          'suspension_end_date', 'created_at')[:limit + 1])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    added = [c['pass_id'] for c in changes if c['kind'] in ('created', 'restored')]
+    if added:
+        passes = {row['id']: row for row in Pass.objects.filter(id__in=added).values(*PASS_FIELDS)}
+        for change in changes:
+            row = passes.get(change['pass_id']) if change['kind'] in ('created', 'restored') else None
+            if row is not None:
+                change['pass'] = pass_entry(row, photo_url)
+
+    # Once caught up, jump to the head read up front so other events' changes aren't rescanned
+    cursor = next_cursor(since, changes[-1]['id'] if has_more else head)
+    # A page of changes that have not settled yet is fetched again on the next regular poll, not at once
+    return changes, cursor, has_more and cursor == changes[-1]['id']
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    # Keyset pagination on the primary key: every page is "WHERE id > cursor ORDER BY id LIMIT n",
+    # so deep pages cost the same as the first and rows added meanwhile don't shift pages.
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class NewestFirstCursorPagination(IdCursorPagination):
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,82 @@
+"""
+Read-through cache of precomputed verify_qr responses, keyed by QR payload.
+
+Entries hold the full success response, so a valid scan is answered
+without touching the database; suspensions are checked separately against
+the in-memory blocked set (suspensions.py). Signals
+in signals.py invalidate entries whenever a pass, its holder or its event
+changes. The cache alias is PASS_CACHE_ALIAS: local memory by default; use a
+shared backend (e.g. Redis) when running several workers so an
+invalidation in one worker reaches the others.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Pass
+from .tokens import payload_hash
+from .serializers import PassSerializer
+
+
+def _cache():
+    return caches[getattr(settings, 'PASS_CACHE_ALIAS', 'default')]
+
+
+def cache_key(qr_data):
+    # Hash so arbitrary scanned payloads are always valid cache keys
+    return 'verify-qr:' + payload_hash(qr_data)
+
+
+def build_entry(user_pass):
+    """The cached form of a pass: its holder and verify_qr success body."""
+    user = user_pass.user
+    profile = user.profile if hasattr(user, 'profile') else None
+    return {
+        "user_id": user.id,
+        "response": {
+            "valid": True,
+            "message": f"ACCESS GRANTED: {user.username} ({user_pass.event.name})",
+            "data": dict(PassSerializer(user_pass).data),
+            "user_details": {
+                "name": user.username,
+                "role": profile.role if profile else "Unknown",
+                "photo_url": profile.photo.url if profile and profile.photo else None
+            },
+        },
+    }
+
+
+def get(qr_data):
+    return _cache().get(cache_key(qr_data))
+
+
+def load(qr_data):
+    """Cached entry for a payload, filled from the database (one joined query) on a miss. Raises Pass.DoesNotExist."""
+    entry = get(qr_data)
+    if entry is None:
+        user_pass = Pass.objects.select_related('user__profile', 'event').get(qr_code_data=qr_data)
+        entry = build_entry(user_pass)
+        _cache().set(cache_key(qr_data), entry, getattr(settings, 'PASS_CACHE_TIMEOUT', 30))
+    return entry
+
+
+async def aload(qr_data):
+    """``load()`` for async views: async cache and ORM calls."""
+    entry = await _cache().aget(cache_key(qr_data))
+    if entry is None:
+        user_pass = await Pass.objects.select_related('user__profile', 'event').aget(qr_code_data=qr_data)
+        entry = build_entry(user_pass)
+        await _cache().aset(cache_key(qr_data), entry, getattr(settings, 'PASS_CACHE_TIMEOUT', 30))
+    return entry
+
+
+def invalidate(*qr_codes):
+    if qr_codes:
+        _cache().delete_many([cache_key(code) for code in qr_codes])
+
+
+def invalidate_user(user_id):
+    invalidate(*Pass.objects.filter(user_id=user_id).values_list('qr_code_data', flat=True))
+
+
+def invalidate_event(event_id):
+    invalidate(*Pass.objects.filter(event_id=event_id).values_list('qr_code_data', flat=True))
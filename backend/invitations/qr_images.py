@@ -0,0 +1,115 @@
+"""
+QR images for passes, rendered once per payload.
+
+Images are content-addressed: the storage name is a hash of the payload and
+the rendering parameters, so a pass's PNG/SVG is rendered the first time it
+is emailed or displayed and read back from storage after that. A payload
+never changes meaning, so the hash doubles as a permanent ETag.
+
+PNGs come from a small direct encoder (module matrix from ``qrcode``, then a
+1-bit grayscale PNG written with zlib) instead of drawing through PIL; see
+'manage.py bench_qr_render' for the comparison.
+"""
+import hashlib
+import io
+import struct
+import zlib
+
+import numpy as np
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+BOX_SIZE = 10
+BORDER = 4
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def configured_mask():
+    # Scoring all 8 mask patterns is ~90% of qrcode's encode time. Any mask decodes,
+    # but the search avoids patterns that trip up scanners, so it stays the default;
+    # QR_MASK_PATTERN (0-7) fixes the mask for ~6x faster encoding, e.g. while
+    # pre-rendering a large bulk invite run
+    return getattr(settings, 'QR_MASK_PATTERN', None)
+
+
+def module_matrix(data, border=BORDER, mask_pattern=None):
+    """Boolean matrix of dark modules, quiet zone included; mask_pattern None searches for the best mask."""
+    qr = qrcode.QRCode(version=1, border=border, mask_pattern=mask_pattern)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+
+def _chunk(kind, body):
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff)
+
+
+def render_png(data, box_size=BOX_SIZE, border=BORDER, mask_pattern=None):
+    modules = module_matrix(data, border, mask_pattern)
+    # White is 1 in 1-bit grayscale; scale each module to box_size x box_size pixels
+    pixels = np.repeat(np.repeat(~modules, box_size, axis=0), box_size, axis=1)
+    height, width = pixels.shape
+    rows = np.packbits(pixels, axis=1)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows]).tobytes() # filter byte 0 per row
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)),
+        _chunk(b'IDAT', zlib.compress(raw, 6)),
+        _chunk(b'IEND', b''),
+    ])
+
+
+def render_svg(data, border=BORDER, mask_pattern=None):
+    modules = module_matrix(data, border, mask_pattern)
+    size = modules.shape[0]
+    # One path, one horizontal run per segment of dark modules
+    runs = []
+    for y, row in enumerate(modules):
+        padded = np.concatenate([[False], row, [False]])
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        for start, end in zip(edges[::2], edges[1::2]):
+            runs.append(f"M{start} {y}h{end - start}v1h-{end - start}z")
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<rect width="{size}" height="{size}" fill="#fff"/><path fill="#000" d="{"".join(runs)}"/></svg>').encode()
+
+
+def render_png_pil(data, box_size=BOX_SIZE, border=BORDER):
+    """The original generate_invite rendering through PIL; kept for benchmarks."""
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def image_key(data, fmt='png'):
+    params = f"{fmt}:{BOX_SIZE}:{BORDER}:{configured_mask()}:"
+    return hashlib.sha256((params + data).encode()).hexdigest()
+
+
+def storage_name(key, fmt):
+    return f"qr/{key[:2]}/{key}.{fmt}"
+
+
+def get_image(data, fmt='png'):
+    """(bytes, key) for a payload's QR image, rendering and storing it on first use."""
+    key = image_key(data, fmt)
+    name = storage_name(key, fmt)
+    if default_storage.exists(name):
+        with default_storage.open(name, 'rb') as f:
+            return f.read(), key
+    mask = configured_mask()
+    content = render_png(data, mask_pattern=mask) if fmt == 'png' else render_svg(data, mask_pattern=mask)
+    store(name, content)
+    return content, key
+
+
+def store(name, content):
+    saved = default_storage.save(name, ContentFile(content))
+    if saved != name:
+        # Another worker stored the same payload between our exists() and save(), and
+        # storage gave ours a fresh name instead of overwriting; same bytes, drop the copy
+        default_storage.delete(saved)
@@ -0,0 +1,115 @@
+"""
+What the gate endpoints decide about a scan, shared by the DRF views in
+views.py and their async counterparts in async_views.py.
+
+Only fetching the inputs differs between the two: the sync views call the
+cache, ORM and face model directly, the async ones await them. Everything
+after that (input checks, suspension, anti-passback, the entry log and the
+response body) lives here, so both answer the same way. The helpers return
+an Outcome, which each kind of view turns into its own response type, or
+None when there is nothing to refuse yet.
+"""
+from collections import namedtuple
+
+from rest_framework import status
+
+from . import entry_log, tokens
+from .face_worker import FaceWorkerBusy, FaceWorkerTimeout
+
+Outcome = namedtuple('Outcome', 'body status headers', defaults=(status.HTTP_200_OK, None))
+
+INVALID_QR = Outcome({"valid": False, "detail": "Invalid QR Code."}, status.HTTP_404_NOT_FOUND)
+NO_FACES_ENROLLED = Outcome({"detail": "No registered users with photos found."}, status.HTTP_404_NOT_FOUND)
+NO_FACE_DETECTED = Outcome({"detail": "No face detected in the image."}, status.HTTP_400_BAD_REQUEST)
+NO_MATCH = Outcome({"valid": False, "detail": "No match found in database."}, status.HTTP_404_NOT_FOUND)
+
+
+def check_qr(qr_data):
+    """Refuse a QR payload that needs no lookup: missing, not text, or a forged or expired signed pass."""
+    if not qr_data:
+        return Outcome({"detail": "QR Data is required."}, status.HTTP_400_BAD_REQUEST)
+    if not isinstance(qr_data, str):
+        # JSON bodies can carry any type; the cache key and token check need text
+        return Outcome({"detail": "QR Data must be a string."}, status.HTTP_400_BAD_REQUEST)
+    if tokens.is_token(qr_data):
+        try:
+            tokens.read(qr_data)
+        except tokens.ExpiredPassToken:
+            return Outcome({"valid": False, "detail": "Pass has EXPIRED."}, status.HTTP_403_FORBIDDEN)
+        except tokens.InvalidPassToken:
+            return INVALID_QR  # forged signed passes are rejected without a lookup
+    return None
+
+
+def admit(user_id, method, blocked, event_id=None, pass_id=None, gate=None, coordinator_id=None):
+    """
+    Suspension, then anti-passback, then the entry is logged (buffered; see
+    entry_log.py). Returns (suspended, seconds since this person's previous
+    entry if anti-passback refuses them, else None).
+    """
+    # In-memory check; expired timed suspensions no longer block and are lifted by the sweeper (suspensions.py)
+    if blocked.is_blocked(user_id):
+        return True, None
+    seconds = entry_log.check_passback(user_id, event_id)
+    if seconds is None:
+        entry_log.record(user_id, method, pass_id=pass_id, event_id=event_id, gate=gate,
+                         coordinator_id=coordinator_id)
+    return False, seconds
+
+
+def admit_pass(entry, blocked, gate=None, coordinator_id=None):
+    """Outcome of a QR scan, given the pass_cache entry for its code."""
+    pass_data = entry["response"]["data"]
+    event_id = pass_data["event"]["id"] if pass_data.get("event") else None
+    suspended, seconds = admit(entry["user_id"], 'qr', blocked, event_id=event_id, pass_id=pass_data["id"],
+                               gate=gate, coordinator_id=coordinator_id)
+    if suspended:
+        return Outcome({"valid": False, "detail": "User is SUSPENDED."}, status.HTTP_403_FORBIDDEN)
+    if seconds is not None:
+        return Outcome({"valid": False, "detail": f"Already entered {int(seconds)}s ago (anti-passback)."},
+                       status.HTTP_409_CONFLICT)
+    return Outcome(entry["response"])
+
+
+def event_pass(passes, event_id):
+    """The pass among ``passes`` for the optional ?event=<id>, which ties a face entry to that event."""
+    return next((p for p in passes if str(p.event_id) == str(event_id)), None)
+
+
+def admit_face(profile, distance, passes, blocked, event_id=None, gate=None, coordinator_id=None):
+    """Outcome of a face match to ``profile``, given the user's active passes (with their events)."""
+    user = profile.user
+    matched = event_pass(passes, event_id)
+    suspended, seconds = admit(user.id, 'face', blocked, event_id=matched.event_id if matched else None,
+                               pass_id=matched.id if matched else None, gate=gate, coordinator_id=coordinator_id)
+    if suspended:
+        return Outcome({"valid": False, "detail": f"{user.username} is SUSPENDED."}, status.HTTP_403_FORBIDDEN)
+    if seconds is not None:
+        detail = f"{user.username} already entered {int(seconds)}s ago (anti-passback)."
+        return Outcome({"valid": False, "detail": detail}, status.HTTP_409_CONFLICT)
+    return Outcome({
+        "valid": True,
+        "message": f"IDENTIFIED: {user.username}",
+        "distance": distance,
+        "user_details": {
+            "name": user.username,
+            "role": profile.role,
+            "student_type": profile.student_type,
+            "college_name": profile.college_name,
+            "photo_url": profile.photo.url if profile.photo else None,
+            "passes": [p.event.name for p in passes],
+        }
+    })
+
+
+def profile_missing(profile_id):
+    return Outcome({"detail": f"Face matched (profile {profile_id}) but User record not found."},
+                   status.HTTP_404_NOT_FOUND)
+
+
+def worker_error(e):
+    if isinstance(e, FaceWorkerBusy):
+        return Outcome({"detail": str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE, {"Retry-After": "1"})
+    if isinstance(e, FaceWorkerTimeout):
+        return Outcome({"detail": str(e)}, status.HTTP_504_GATEWAY_TIMEOUT)
+    return Outcome({"detail": str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Pass, Event, Complaint
+from .models import Pass, Event, Complaint, EntryLog
 
 User = get_user_model()
 
@@ -25,6 +25,9 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_pass_event_names(self, obj):
         # Return list of event names for which the user has a pass
+        if 'passes' in getattr(obj, '_prefetched_objects_cache', {}):
+            # List views prefetch passes with their events (see UserListView)
+            return [p.event.name for p in obj.passes.all()]
         return list(Pass.objects.filter(user=obj).values_list('event__name', flat=True))
 
     def get_is_suspended(self, obj):
@@ -51,7 +54,7 @@ class UserSerializer(serializers.ModelSerializer):
             password=validated_data['password']
         )
         
-        # Auto-create profile
+        # Auto-create profile (its face embedding is computed on save, see signals.py)
         from .models import UserProfile
         if not hasattr(user, 'profile'):
             UserProfile.objects.create(
@@ -82,3 +85,12 @@ class PassSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pass
         fields = '__all__'
+
+class EntryLogSerializer(serializers.ModelSerializer):
+    username = serializers.ReadOnlyField(source='user.username')
+    event_name = serializers.ReadOnlyField(source='event.name')
+    coordinator_name = serializers.ReadOnlyField(source='coordinator.username')
+
+    class Meta:
+        model = EntryLog
+        fields = ('id', 'user', 'username', 'user_pass', 'event', 'event_name', 'gate', 'method', 'coordinator', 'coordinator_name', 'created_at')
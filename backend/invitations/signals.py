@@ -0,0 +1,137 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import pass_cache, suspensions
+from .tokens import is_pending, payload_hash
+from .face_index import drop_from_index, enroll_profile, unenroll_profile
+from .models import Event, Pass, PassChange, UserProfile
+
+User = get_user_model()
+
+
+@receiver(post_init, sender=UserProfile)
+def remember_profile_state(sender, instance, **kwargs):
+    # Lets post_save tell whether the photo actually changed. Read the raw
+    # attribute so deferred loads (.only()) don't trigger a query; None = unknown.
+    if 'photo' in instance.__dict__:
+        photo = instance.__dict__['photo']
+        instance._original_photo = str(photo) if photo else ''
+    else:
+        instance._original_photo = None
+    if 'is_suspended' in instance.__dict__:
+        instance._original_suspension = (instance.is_suspended, instance.__dict__.get('suspension_end_date'))
+    else:
+        instance._original_suspension = None
+
+
+@receiver(post_save, sender=UserProfile)
+def enroll_face(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'photo' not in update_fields):
+        return
+    if instance._original_photo is None and update_fields is None:
+        # Deferred load saved without touching the photo; nothing to compare against
+        return
+    photo = instance.photo.name if instance.photo else ''
+    if created or photo != instance._original_photo:
+        if photo:
+            enroll_profile(instance)
+        elif not created:
+            unenroll_profile(instance.id)
+        instance._original_photo = photo
+
+
+@receiver(post_delete, sender=UserProfile)
+def forget_face(sender, instance, **kwargs):
+    # The FaceEmbedding row goes with the profile via CASCADE; drop it from the live index too
+    drop_from_index(instance.id)
+
+
+# Verification cache invalidation: revoke_invite, pass deactivation, delete_user
+# (passes cascade) and suspend_user all pass through one of these.
+
+@receiver(post_save, sender=Pass)
+@receiver(post_delete, sender=Pass)
+def invalidate_pass(sender, instance, **kwargs):
+    pass_cache.invalidate(instance.qr_code_data)
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_passes(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pass_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_passes(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # The cached response embeds the username; logins only touch last_login
+    if not created and not raw and update_fields != frozenset({'last_login'}):
+        pass_cache.invalidate_user(instance.id)
+
+
+@receiver(post_save, sender=Event)
+def invalidate_event_passes(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        pass_cache.invalidate_event(instance.id)
+
+
+# Creation/revocation/suspension log for offline gate devices (see offline_sync.py)
+
+@receiver(post_init, sender=Pass)
+def remember_pass_state(sender, instance, **kwargs):
+    instance._original_is_active = instance.__dict__.get('is_active')
+    instance._original_qr_code_data = instance.__dict__.get('qr_code_data')
+
+
+def log_pass_change(kind, user_pass, qr_data):
+    PassChange.objects.create(kind=kind, pass_id=user_pass.id, event_id=user_pass.event_id,
+                              user_id=user_pass.user_id, payload_hash=payload_hash(qr_data))
+
+
+@receiver(post_save, sender=Pass)
+def log_pass_state(sender, instance, created, raw=False, **kwargs):
+    if raw or is_pending(instance.qr_code_data):
+        # tokens.create_pass saves a placeholder first; it is logged once the real payload lands
+        return
+    original_qr = instance._original_qr_code_data
+    if created or is_pending(original_qr):
+        if instance.is_active:
+            log_pass_change('created', instance, instance.qr_code_data)
+    elif original_qr is not None and original_qr != instance.qr_code_data:
+        # Re-issued payload: devices drop the old hash and learn the new one
+        if instance._original_is_active:
+            log_pass_change('revoked', instance, original_qr)
+        if instance.is_active:
+            log_pass_change('created', instance, instance.qr_code_data)
+    elif instance._original_is_active is not None and instance.is_active != instance._original_is_active:
+        log_pass_change('restored' if instance.is_active else 'revoked', instance, instance.qr_code_data)
+    instance._original_is_active = instance.is_active
+    instance._original_qr_code_data = instance.qr_code_data
+
+
+@receiver(post_delete, sender=Pass)
+def log_pass_deleted(sender, instance, **kwargs):
+    if instance.is_active and not is_pending(instance.qr_code_data):
+        log_pass_change('revoked', instance, instance.qr_code_data)
+
+
+@receiver(post_save, sender=UserProfile)
+def log_suspension(sender, instance, created, raw=False, **kwargs):
+    state = (instance.is_suspended, instance.suspension_end_date)
+    if raw or instance._original_suspension in (None, state) or (created and not instance.is_suspended):
+        return
+    PassChange.objects.create(kind='suspended' if instance.is_suspended else 'unsuspended', user_id=instance.user_id,
+                              suspension_end_date=instance.suspension_end_date)
+    instance._original_suspension = state
+
+
+@receiver(post_save, sender=UserProfile)
+def track_suspension(sender, instance, raw=False, **kwargs):
+    # Keeps this process's blocked set current without waiting for its refresh (see suspensions.py)
+    if not raw and 'is_suspended' in instance.__dict__:
+        suspensions.note(instance.user_id, instance.is_suspended, instance.__dict__.get('suspension_end_date'))
+
+
+@receiver(post_delete, sender=UserProfile)
+def untrack_suspension(sender, instance, **kwargs):
+    suspensions.note(instance.user_id, False, None)
@@ -0,0 +1,146 @@
+"""
+Suspension checks for the scan paths, and the sweeper for timed suspensions.
+
+Scans never touch the database for suspensions. ``is_blocked()`` reads a
+per-process map of suspended users to their end times (None = indefinite),
+so a suspension whose end time has passed stops blocking at once, even
+before the sweeper lifts it. The map comes from one query over the partial
+index on suspended profiles. It is reloaded at most every
+SUSPENSION_REFRESH_SECONDS, and saves in this process update it directly
+(see signals.py).
+
+``expire()`` lifts every expired suspension with one UPDATE and logs a
+PassChange 'unsuspended' row for each, in bulk, for offline gate devices.
+Run it periodically with 'manage.py expire_suspensions' (cron, or --every),
+or set SUSPENSION_SWEEP_SECONDS to run it on a background thread in each
+web process. Concurrent sweeps are safe: the expired rows are locked first.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import PassChange, UserProfile
+
+logger = logging.getLogger(__name__)
+
+_missing = object()
+
+
+class BlockedUsers:
+    def __init__(self, until=None):
+        self._until = until or {}  # user id -> suspension end, None = indefinite
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._until)
+
+    def is_blocked(self, user_id, now=None):
+        until = self._until.get(user_id, _missing)
+        if until is _missing:
+            return False
+        return until is None or until > (now or timezone.now())
+
+    def note(self, user_id, suspended, until):
+        # Copy-on-write, like the face index, so readers never need a lock
+        changed = dict(self._until)
+        if suspended:
+            changed[user_id] = until
+        else:
+            changed.pop(user_id, None)
+        self._until = changed
+
+    def lift(self, user_ids):
+        changed = dict(self._until)
+        for user_id in user_ids:
+            changed.pop(user_id, None)
+        self._until = changed
+
+    @classmethod
+    def load(cls):
+        return cls(dict(UserProfile.objects.filter(is_suspended=True).values_list('user_id', 'suspension_end_date')))
+
+
+_blocked = None
+_lock = threading.Lock()
+_sweeper = None
+
+
+def fresh():
+    """The blocked set if it is loaded and due no refresh, else None (async views then load it in a thread)."""
+    blocked = _blocked
+    if blocked is not None and time.monotonic() - blocked.loaded_at < getattr(settings, 'SUSPENSION_REFRESH_SECONDS', 5):
+        return blocked
+    return None
+
+
+def get_blocked():
+    """Per-process blocked set, reloaded from the database when older than SUSPENSION_REFRESH_SECONDS."""
+    global _blocked
+    blocked = fresh()
+    if blocked is not None:
+        return blocked
+    with _lock:
+        blocked = fresh()
+        if blocked is None:
+            blocked = _blocked = BlockedUsers.load()
+        _start_sweeper()
+    return blocked
+
+
+def reset():
+    global _blocked
+    with _lock:
+        _blocked = None
+
+
+def is_blocked(user_id):
+    return get_blocked().is_blocked(user_id)
+
+
+def note(user_id, suspended, until):
+    """Apply a suspension change made in this process to the loaded set (other processes catch up on refresh)."""
+    blocked = _blocked
+    if blocked is not None:
+        blocked.note(user_id, suspended, until)
+
+
+def expire(now=None):
+    """Lift suspensions that ended by ``now``. Returns the user ids unsuspended."""
+    now = now or timezone.now()
+    expired = UserProfile.objects.filter(is_suspended=True, suspension_end_date__lte=now)
+    with transaction.atomic():
+        user_ids = list(expired.select_for_update().values_list('user_id', flat=True))
+        if not user_ids:
+            return []
+        expired.update(is_suspended=False, suspension_end_date=None)
+        PassChange.objects.bulk_create([PassChange(kind='unsuspended', user_id=user_id) for user_id in user_ids],
+                                       batch_size=500)
+    blocked = _blocked
+    if blocked is not None:
+        blocked.lift(user_ids)
+    return user_ids
+
+
+def _start_sweeper():
+    global _sweeper
+    interval = getattr(settings, 'SUSPENSION_SWEEP_SECONDS', None)
+    if interval and _sweeper is None:
+        _sweeper = threading.Thread(target=_sweep_forever, args=(interval,), name='suspension-sweeper', daemon=True)
+        _sweeper.start()
+
+
+def _sweep_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            lifted = expire()
+            if lifted:
+                logger.info("Lifted %s expired suspensions", len(lifted))
+        except Exception as e:
+            logger.warning("Suspension sweep failed: %s", e)
+        # This thread outlives requests, so tidy its connection the way request handling would
+        close_old_connections()
@@ -1,3 +1,1000 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import smtplib
+import tempfile
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import qrcode
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import entry_log, gate_stats, mail_pool, metrics, suspensions
+from .models import EntryLog, Event, Pass, PassChange, UserProfile
+
+
+class UserListQueryCountTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.events = [Event.objects.create(name=f'Event {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_users(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(f'user{i}', f'user{i}@example.com')
+            UserProfile.objects.create(user=user, role='student', college_name='ABC')
+            for event in self.events[:i % 3 + 1]:
+                Pass.objects.create(user=user, event=event, qr_code_data=f'qr-{i}-{event.id}')
+
+    def list_users(self, **params):
+        # Users + prefetched passes/events, independent of the number of users
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/users/', {'page_size': 100, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_query_count_does_not_grow_with_users(self):
+        self.add_users(3)
+        self.assertEqual(len(self.list_users()), 4)
+        self.add_users(20)
+        self.assertEqual(len(self.list_users()), 24)
+
+    def test_list_content(self):
+        self.add_users(3)
+        by_name = {u['username']: u for u in self.list_users()}
+        self.assertEqual(sorted(by_name['user2']['pass_event_names']), ['Event 0', 'Event 1', 'Event 2'])
+        self.assertEqual(by_name['user1']['role'], 'student')
+        self.assertEqual(by_name['user1']['college_name'], 'ABC')
+        self.assertFalse(by_name['user1']['is_suspended'])
+        self.assertEqual(by_name['admin']['pass_event_names'], [])
+        self.assertEqual(by_name['admin']['role'], 'unknown')
+
+
+class UserListFilterTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.event = Event.objects.create(name='Fest')
+        for i in range(6):
+            user = User.objects.create_user(f'user{i}', f'user{i}@example.com')
+            UserProfile.objects.create(user=user, role='guest' if i % 2 else 'student',
+                                       student_type='external' if i < 2 else 'internal',
+                                       college_name='Beta College' if i < 2 else 'Alpha College',
+                                       is_suspended=i == 5)
+            if i < 3:
+                Pass.objects.create(user=user, event=self.event, qr_code_data=f'qr-{i}')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def usernames(self, **params):
+        response = self.client.get('/api/users/', params)
+        self.assertEqual(response.status_code, 200)
+        return [u['username'] for u in response.json()['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.usernames(role='guest'), ['user1', 'user3', 'user5'])
+        self.assertEqual(self.usernames(student_type='external'), ['user0', 'user1'])
+        self.assertEqual(self.usernames(suspended='true'), ['user5'])
+        self.assertEqual(self.usernames(event=self.event.id), ['user0', 'user1', 'user2'])
+        self.assertEqual(self.usernames(search='Beta'), ['user0', 'user1'])
+        self.assertEqual(self.usernames(search='user4'), ['user4'])
+        self.assertEqual(self.usernames(role='student', suspended='false', search='Alpha'), ['user2', 'user4'])
+
+    def test_non_numeric_event_is_a_bad_request(self):
+        for path in ('/api/users/', '/api/admin/export/users.csv'):
+            response = self.client.get(path, {'event': 'abc'})
+            self.assertEqual((response.status_code, response.json()), (400, {"detail": "event must be an integer."}))
+
+    def test_cursor_pages_cover_every_user_once(self):
+        seen, url = [], '/api/users/?page_size=2'
+        while url:
+            body = self.client.get(url).json()
+            seen += [u['username'] for u in body['results']]
+            url = body['next']
+        self.assertEqual(seen, ['admin'] + [f'user{i}' for i in range(6)])
+
+
+class SuspensionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        event = Event.objects.create(name='Fest')
+        now = timezone.now()
+        for name, end in (('ended', now - timedelta(hours=1)), ('running', now + timedelta(hours=1)), ('indefinite', None)):
+            user = User.objects.create_user(name)
+            UserProfile.objects.create(user=user, is_suspended=True, suspension_end_date=end)
+            Pass.objects.create(user=user, event=event, qr_code_data=f'qr-{name}')
+        suspensions.reset()
+        # Accepted scans are buffered; write them inside this test's transaction
+        self.addCleanup(entry_log.get_buffer().flush)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def scan(self, name):
+        return self.client.post('/api/admin/verify-qr/', {'qr_data': f'qr-{name}'}, format='json').status_code
+
+    def test_scans_never_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.scan('ended'), 200)
+            self.assertEqual(self.scan('running'), 403)
+            self.assertEqual(self.scan('indefinite'), 403)
+        self.assertEqual([q['sql'] for q in queries if not q['sql'].lstrip().upper().startswith('SELECT')], [])
+
+    def test_expire_lifts_only_ended_suspensions(self):
+        ended = User.objects.get(username='ended')
+        self.assertEqual(suspensions.expire(), [ended.id])
+        self.assertEqual(suspensions.expire(), [])
+        self.assertEqual(set(UserProfile.objects.filter(is_suspended=True).values_list('user__username', flat=True)),
+                         {'running', 'indefinite'})
+        self.assertEqual(list(PassChange.objects.filter(kind='unsuspended').values_list('user_id', flat=True)), [ended.id])
+
+    def test_unsuspend_applies_to_this_process_at_once(self):
+        self.assertEqual(self.scan('indefinite'), 403)
+        self.client.post('/api/admin/suspend-user/', {'username': 'indefinite', 'action': 'unsuspend'}, format='json')
+        self.assertEqual(self.scan('indefinite'), 200)
+
+    def test_async_view_answers_like_sync(self):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncRequestFactory
+        from rest_framework.authtoken.models import Token
+
+        from . import async_views
+
+        token = Token.objects.create(user=self.admin)
+        for name in ('ended', 'running', 'indefinite', 'unknown'):
+            expected = self.client.post('/api/admin/verify-qr/', {'qr_data': f'qr-{name}'}, format='json')
+            request = AsyncRequestFactory().post('/api/admin/verify-qr/', {'qr_data': f'qr-{name}'},
+                                                 content_type='application/json',
+                                                 headers={'Authorization': f'Token {token.key}'})
+            response = async_to_sync(async_views.verify_qr)(request)
+            self.assertEqual((response.status_code, json.loads(response.content)),
+                             (expected.status_code, expected.json()), name)
+
+
+class IVFLiveUpdateTests(TestCase):
+    def setUp(self):
+        from . import face_index
+        from .ann import IVFIndex
+
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((400, 32)).astype(np.float32)
+        self.index = IVFIndex(nlist=8, nprobe=2, min_train_size=100)
+        # Ids well clear of the profile created below
+        self.index.replace(np.arange(1001, 1401), self.vectors)
+        self.assertTrue(self.index.is_trained)
+        face_index._index = self.index
+        self.addCleanup(face_index.reset_index)
+        user = User.objects.create_user('face')
+        self.profile = UserProfile.objects.create(user=user)
+        self.profile.photo.name = 'profile_photos/face.jpg'
+
+    def test_enroll_then_delete_updates_inverted_lists(self):
+        from .face_index import enroll_vectors, unenroll_profile
+
+        probe = np.random.default_rng(1).standard_normal(32).astype(np.float32)
+        with self.captureOnCommitCallbacks(execute=True):
+            enroll_vectors([self.profile], [probe])
+        self.assertEqual(self.index.search(probe)[0][0], self.profile.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            unenroll_profile(self.profile.id)
+            unenroll_profile(1400)
+        self.assertEqual(len(self.index), 399)
+        self.assertNotIn(self.profile.id, [hit[0] for hit in self.index.search(probe, k=5)])
+        # Every remaining face is still found through its own list
+        for i in (0, 150, 398):
+            self.assertEqual(self.index.search(self.vectors[i])[0][0], i + 1001)
+
+
+class EntryBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('gatecrasher')
+        # Flushed by hand; the background flusher must not get there first
+        self.buffer = entry_log.EntryBuffer(batch_size=10, flush_seconds=3600)
+
+    def entry(self, **fields):
+        return EntryLog(user=self.user, method='qr', created_at=timezone.now(), **fields)
+
+    def test_constraint_violation_drops_only_the_bad_row(self):
+        first = self.entry()
+        self.buffer.add(first)
+        self.assertEqual(self.buffer.flush(), 1)
+
+        self.buffer.add(self.entry(gate='a'))
+        self.buffer.add(self.entry(id=first.id))
+        self.buffer.add(self.entry(gate='b'))
+        with self.assertLogs('invitations.entry_log') as logs:
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertIn('Dropping entry log', logs.output[-1])
+        self.assertEqual((self.buffer.pending(), self.buffer.dropped), (0, 1))
+        self.assertEqual(sorted(EntryLog.objects.values_list('gate', flat=True)), ['', 'a', 'b'])
+
+    def test_unreachable_database_requeues_the_batch(self):
+        self.buffer.add(self.entry(gate='a'))
+        self.buffer.add(self.entry(gate='b'))
+        with mock.patch.object(EntryLog.objects, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('invitations.entry_log', 'WARNING'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(), 2)
+        self.buffer.add(self.entry(gate='c'))
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(list(EntryLog.objects.order_by('id').values_list('gate', flat=True)), ['a', 'b', 'c'])
+
+    def test_full_buffer_drops_new_entries(self):
+        buffer = entry_log.EntryBuffer(batch_size=10, flush_seconds=3600, max_buffer=2)
+        for gate in 'abc':
+            buffer.add(self.entry(gate=gate))
+        self.assertEqual((buffer.pending(), buffer.dropped), (2, 1))
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(sorted(EntryLog.objects.values_list('gate', flat=True)), ['a', 'b'])
+
+    def test_recent_entries_forget_after_the_window(self):
+        recent = entry_log.RecentEntries(window=60)
+        self.assertIsNone(recent.check_and_add((1, 7), now=1000))
+        self.assertEqual(recent.check_and_add((1, 7), now=1030), 30)
+        self.assertIsNone(recent.check_and_add((1, 8), now=1030))
+        self.assertIsNone(recent.check_and_add((1, 7), now=1061))
+
+    def test_scans_are_logged_at_scan_time_and_refused_again_within_the_window(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        UserProfile.objects.create(user=self.user)
+        Pass.objects.create(user=self.user, event=Event.objects.create(name='Fest'), qr_code_data='qr-gate')
+        self.addCleanup(setattr, entry_log, '_recent', entry_log._recent)
+        entry_log._recent = entry_log.RecentEntries(window=60)
+        client = APIClient()
+        client.force_authenticate(admin)
+        scan = lambda: client.post('/api/admin/verify-qr/', {'qr_data': 'qr-gate', 'gate': 'north'}, format='json')
+
+        scanned_at = timezone.now()
+        self.assertEqual(scan().status_code, 200)
+        self.assertEqual(scan().status_code, 409)
+        # Buffered, not written by the request
+        self.assertFalse(EntryLog.objects.exists())
+        entry_log.get_buffer().flush()
+        entry = EntryLog.objects.get()
+        self.assertEqual((entry.gate, entry.method, entry.coordinator_id), ('north', 'qr', admin.id))
+        self.assertLess(abs(entry.created_at - scanned_at), timedelta(seconds=5))
+
+    def test_entry_list_filters_and_rejects_non_numeric_ids(self):
+        event = Event.objects.create(name='Fest')
+        EntryLog.objects.create(user=self.user, event=event, gate='north', method='qr', created_at=timezone.now())
+        EntryLog.objects.create(user=self.user, gate='south', method='face', created_at=timezone.now())
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', None))
+        gates = lambda **params: [e['gate'] for e in client.get('/api/admin/entries/', params).json()['results']]
+        self.assertEqual(gates(event=event.id), ['north'])
+        self.assertEqual(gates(user=self.user.id, gate='south'), ['south'])
+        for param in ('event', 'user'):
+            response = client.get('/api/admin/entries/', {param: 'abc'})
+            self.assertEqual((response.status_code, response.json()), (400, {"detail": f"{param} must be an integer."}))
+
+    def test_record_truncates_long_gate_names(self):
+        self.addCleanup(entry_log.get_buffer().flush)
+        entry_log.record(self.user.id, 'qr', gate='x' * 80)
+        entry_log.get_buffer().flush()
+        self.assertEqual(EntryLog.objects.get().gate, 'x' * 50)
+
+
+class EntryBufferDeletedRowsTests(TransactionTestCase):
+    # Foreign keys are only checked when a transaction commits, which TestCase never does
+
+    def test_revoked_pass_is_nulled_rather_than_losing_the_entry(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        holder = User.objects.create_user('holder')
+        UserProfile.objects.create(user=holder)
+        event = Event.objects.create(name='Fest')
+        Pass.objects.create(user=holder, event=event, qr_code_data='qr-revoked')
+        self.addCleanup(setattr, entry_log, '_recent', entry_log._recent)
+        entry_log._recent = entry_log.RecentEntries(window=0)
+        self.addCleanup(entry_log.get_buffer().flush)
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        self.assertEqual(client.post('/api/admin/verify-qr/', {'qr_data': 'qr-revoked', 'gate': 'north'},
+                                     format='json').status_code, 200)
+        self.assertEqual(client.post('/api/admin/revoke-invite/', {'username': 'holder', 'event': 'Fest'},
+                                     format='json').status_code, 200)
+        with self.assertLogs('invitations.entry_log', 'WARNING') as logs:
+            self.assertEqual(entry_log.get_buffer().flush(), 1)
+        self.assertNotIn('Dropping', '\n'.join(logs.output))
+        entry = EntryLog.objects.get()
+        self.assertEqual((entry.user_id, entry.user_pass_id, entry.event_id, entry.gate),
+                         (holder.id, None, event.id, 'north'))
+
+    def test_entry_of_a_deleted_user_is_dropped(self):
+        buffer = entry_log.EntryBuffer(batch_size=10, flush_seconds=3600)
+        kept, gone = User.objects.create_user('kept'), User.objects.create_user('gone')
+        for user in (kept, gone):
+            buffer.add(EntryLog(user_id=user.id, method='qr', created_at=timezone.now()))
+        gone_id = gone.id
+        gone.delete()
+        with self.assertLogs('invitations.entry_log') as logs:
+            self.assertEqual(buffer.flush(), 1)
+        self.assertIn(f'Dropping entry log of user {gone_id}', logs.output[-1])
+        self.assertEqual(list(EntryLog.objects.values_list('user_id', flat=True)), [kept.id])
+
+
+class FaceRecognizeGroupTests(TestCase):
+    def setUp(self):
+        from . import face_index
+        from .models import FaceEmbedding
+
+        person = User.objects.create_user('person')
+        profile = UserProfile.objects.create(user=person)
+        FaceEmbedding.objects.create(profile=profile, model_name=face_index.MODEL_NAME, photo_name='person.jpg',
+                                     vector=np.ones(32, dtype=np.float32).tobytes())
+        face_index.reset_index()
+        self.addCleanup(face_index.reset_index)
+        self.client = APIClient()
+
+    def post(self, user):
+        self.client.force_authenticate(user)
+        image = SimpleUploadedFile('frame.jpg', b'not an image')
+        return self.client.post('/api/admin/face-recognize-group/', {'image': image})
+
+    def test_only_coordinators_may_log_group_entries(self):
+        self.assertEqual(self.post(User.objects.create_user('student')).status_code, 403)
+
+    def test_undecodable_upload_is_a_bad_request(self):
+        self.assertEqual(self.post(User.objects.create_superuser('admin', 'admin@example.com', 'pw')).status_code, 400)
+
+
+class VerifyQRInputTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+
+    def test_non_string_qr_data_is_a_bad_request(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        for qr_data in (123, ['x'], {'id': 1}):
+            response = client.post('/api/admin/verify-qr/', {'qr_data': qr_data}, format='json')
+            self.assertEqual(response.status_code, 400, qr_data)
+
+    def test_non_string_qr_data_is_a_bad_request_async(self):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncRequestFactory
+        from rest_framework.authtoken.models import Token
+
+        from . import async_views
+
+        token = Token.objects.create(user=self.admin)
+        for qr_data in (123, ['x']):
+            request = AsyncRequestFactory().post('/api/admin/verify-qr/', {'qr_data': qr_data},
+                                                 content_type='application/json',
+                                                 headers={'Authorization': f'Token {token.key}'})
+            self.assertEqual(async_to_sync(async_views.verify_qr)(request).status_code, 400, qr_data)
+
+
+class QRImageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = Path(media.name)
+
+    def test_mask_search_unless_configured(self):
+        from . import qr_images
+
+        searched = qrcode.QRCode(border=qr_images.BORDER)
+        searched.add_data('P1:pass')
+        searched.make(fit=True)
+        self.assertEqual(qr_images.module_matrix('P1:pass').tolist(), searched.get_matrix())
+
+        content, key = qr_images.get_image('P1:pass')
+        self.assertEqual(content, qr_images.render_png('P1:pass'))
+        with override_settings(QR_MASK_PATTERN=0):
+            fixed, fixed_key = qr_images.get_image('P1:pass')
+        self.assertNotEqual(key, fixed_key)
+        self.assertEqual(fixed, qr_images.render_png('P1:pass', mask_pattern=0))
+
+    def test_concurrent_render_leaves_one_file(self):
+        from . import qr_images
+
+        name = qr_images.storage_name(qr_images.image_key('P1:pass'), 'png')
+        content = qr_images.render_png('P1:pass')
+        qr_images.store(name, content)
+        # A second worker that also missed the image before the first stored it
+        qr_images.store(name, content)
+        self.assertEqual([path.name for path in (self.media / name).parent.iterdir()], [Path(name).name])
+
+
+class OfflineSyncTests(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(name='Fest')
+        self.other = Event.objects.create(name='Other')
+        self.user = User.objects.create_user('holder')
+        UserProfile.objects.create(user=self.user)
+        self.pass_ = Pass.objects.create(user=self.user, event=self.event, qr_code_data='qr-holder')
+        Pass.objects.create(user=User.objects.create_user('elsewhere'), event=self.other, qr_code_data='qr-elsewhere')
+
+    def settle(self):
+        PassChange.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+
+    def test_deltas_for_the_event(self):
+        from . import offline_sync
+
+        self.settle()
+        changes, cursor, has_more = offline_sync.changes_since(self.event, 0, 100)
+        self.assertEqual([(c['kind'], c['pass_id']) for c in changes], [('created', self.pass_.id)])
+        self.assertEqual(changes[0]['pass']['username'], 'holder')
+        self.assertEqual((cursor, has_more), (offline_sync.current_cursor(), False))
+
+        self.pass_.is_active = False
+        self.pass_.save()
+        self.user.profile.is_suspended = True
+        self.user.profile.save()
+        self.settle()
+        changes, _, _ = offline_sync.changes_since(self.event, cursor, 100)
+        self.assertEqual([c['kind'] for c in changes], ['revoked', 'suspended'])
+
+    def test_cursor_waits_for_changes_to_settle(self):
+        from . import offline_sync
+
+        self.settle()
+        settled = offline_sync.current_cursor()
+        self.pass_.is_active = False
+        self.pass_.save()
+        # Returned at once, but a change with a lower id may still be committing elsewhere
+        changes, cursor, _ = offline_sync.changes_since(self.event, settled, 100)
+        self.assertEqual([c['kind'] for c in changes], ['revoked'])
+        self.assertEqual(cursor, settled)
+
+        self.settle()
+        _, cursor, _ = offline_sync.changes_since(self.event, settled, 100)
+        self.assertEqual(cursor, offline_sync.current_cursor())
+
+    def test_unsettled_page_is_not_fetched_again_at_once(self):
+        from . import offline_sync
+
+        for i in range(3):
+            Pass.objects.create(user=User.objects.create_user(f'guest{i}'), event=self.event, qr_code_data=f'qr-{i}')
+        changes, cursor, has_more = offline_sync.changes_since(self.event, 0, 2)
+        self.assertEqual((len(changes), cursor, has_more), (2, 0, False))
+        self.settle()
+        changes, cursor, has_more = offline_sync.changes_since(self.event, 0, 2)
+        self.assertEqual((cursor, has_more), (changes[-1]['id'], True))
+
+
+class UserImportTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = Path(media.name)
+        User.objects.create_user('taken')
+
+    def photos(self, *names):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for name in names:
+                zf.writestr(name, b'jpeg bytes')
+        archive.seek(0)
+        return archive
+
+    def stored_photos(self):
+        return [path.name for path in self.media.rglob('*') if path.is_file()]
+
+    def test_bad_rows_are_reported_and_the_rest_imported(self):
+        from .user_import import import_users
+
+        rows = (b"username,email,role,photo\n"
+                b"ana,ana@example.com,student,ana.jpg\n"
+                b"taken,,student,\n"
+                b"bo,not-an-email,wizard,\n"
+                b"ana,,student,\n"
+                b"cy,,guest,\n")
+        events = list(import_users(io.BytesIO(rows), 'csv', self.photos('faces/ana.jpg'), enroll=False))
+        errors = {event['line']: sorted(event['errors']) for event in events if event['type'] == 'error'}
+        self.assertEqual(errors, {3: ['username'], 4: ['email', 'role'], 5: ['username']})
+        self.assertEqual({k: events[-1][k] for k in ('rows', 'created', 'failed')},
+                         {'rows': 5, 'created': 2, 'failed': 3})
+        ana = UserProfile.objects.get(user__username='ana')
+        self.assertEqual(ana.user.email, 'ana@example.com')
+        self.assertFalse(ana.user.has_usable_password())
+        self.assertEqual(self.stored_photos(), [Path(ana.photo.name).name])
+        self.assertEqual(UserProfile.objects.get(user__username='cy').role, 'guest')
+
+    def test_failed_insert_removes_stored_photos(self):
+        from .user_import import Importer, import_users
+
+        rows = b'{"username": "ana", "photo": "ana.jpg"}\n{"username": "bo", "photo": "bo.jpg"}\n'
+        events = import_users(io.BytesIO(rows), 'jsonl', self.photos('ana.jpg', 'bo.jpg'), enroll=False)
+        with mock.patch.object(Importer, 'create', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                list(events)
+        self.assertEqual(self.stored_photos(), [])
+        self.assertFalse(User.objects.filter(username__in=['ana', 'bo']).exists())
+
+    def test_admin_endpoint_hashes_in_process(self):
+        from . import user_import
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        client = APIClient()
+        client.force_authenticate(admin)
+        upload = SimpleUploadedFile('users.csv', b"username,password\nana,s3cret-pass\nbo,s3cret-pass\n")
+        with mock.patch.object(user_import, 'ProcessPoolExecutor') as pool:
+            response = client.post('/api/admin/import-users/', {'file': upload})
+            events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        pool.assert_not_called()
+        self.assertEqual(events[-1]['created'], 2)
+        self.assertTrue(User.objects.get(username='bo').check_password('s3cret-pass'))
+
+
+class FaceWorkerBatchTests(SimpleTestCase):
+    def setUp(self):
+        from . import face_index
+
+        # The face model is out of scope here; every decoded frame holds one face
+        self.enterContext(mock.patch.object(face_index, 'embed_frames', side_effect=lambda frames, flags: [
+            (np.ones((1, 4), dtype=np.float32), [{'x': 0}]) for _ in frames]))
+        photo = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(photo, 'JPEG')
+        self.photo = photo.getvalue()
+
+    def test_bad_upload_fails_only_its_own_request(self):
+        from .face_worker import _embed_batch, _unpack
+
+        results = _embed_batch([([self.photo], False), ([b'not an image'], False), ([self.photo, self.photo], True)])
+        self.assertEqual([status for status, _ in results], ['ok', 'invalid', 'ok'])
+        self.assertIn('Could not decode image', results[1][1])
+        self.assertEqual([vectors.shape for vectors, _ in _unpack(results[2][1])], [(1, 4), (1, 4)])
+
+    def test_client_raises_value_error_for_an_invalid_upload(self):
+        from .face_worker import FaceWorkerClient, _embed_batch
+
+        client = FaceWorkerClient('unused')
+        answer = lambda request, timeout: dict(zip(('status', 'payload'),
+                                                   _embed_batch([(request['images'], request['all_faces'])])[0]))
+        with mock.patch.object(client, '_call', side_effect=answer):
+            self.assertEqual(len(client.embed_frames([self.photo])), 1)
+            with self.assertRaises(ValueError):
+                client.embed_frames([b'not an image'])
+
+
+class FaceEnrollmentTests(TestCase):
+    def setUp(self):
+        from . import face_index
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, FACE_INDEX_REFRESH_SECONDS=0))
+        # The face model is out of scope here; each photo embeds to the vector registered for its colour
+        self.vectors = {colour: np.eye(8, dtype=np.float32)[i] for i, colour in enumerate(('red', 'green', 'blue'))}
+        self.enterContext(mock.patch.object(face_index, 'represent', side_effect=self.represent))
+        face_index.reset_index()
+        self.addCleanup(face_index.reset_index)
+        self.index = face_index.get_index()
+        self.user = User.objects.create_user('face')
+
+    def represent(self, img):
+        blue, green, red = img[0, 0]
+        return self.vectors['red' if red > 100 else 'green' if green > 100 else 'blue']
+
+    def photo(self, colour):
+        buffer = io.BytesIO()
+        Image.new('RGB', (32, 32), colour).save(buffer, format='JPEG')
+        return SimpleUploadedFile(f'{colour}.jpg', buffer.getvalue())
+
+    def matched(self, colour):
+        hit = self.index.match(self.vectors[colour])
+        return hit[0] if hit else None
+
+    def test_photo_changes_keep_the_live_index_current(self):
+        from .models import FaceEmbedding
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.create(user=self.user, photo=self.photo('red'))
+        self.assertEqual(FaceEmbedding.objects.get().photo_name, profile.photo.name)
+        self.assertEqual(self.matched('red'), profile.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.photo = self.photo('green')
+            profile.save()
+        self.assertEqual((self.matched('red'), self.matched('green')), (None, profile.id))
+
+        # Saves that leave the photo alone don't re-embed
+        with mock.patch('invitations.signals.enroll_profile') as enroll:
+            profile.college_name = 'Elsewhere'
+            profile.save()
+        enroll.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.photo = None
+            profile.save()
+        self.assertFalse(FaceEmbedding.objects.exists())
+        self.assertEqual(len(self.index), 0)
+
+    def test_delete_drops_the_face(self):
+        from .models import FaceEmbedding
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.create(user=self.user, photo=self.photo('blue'))
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.delete()
+        self.assertFalse(FaceEmbedding.objects.exists())
+        self.assertIsNone(self.matched('blue'))
+
+    def test_refresh_picks_up_other_workers_writes(self):
+        from . import face_index
+        from .models import FaceEmbedding
+
+        # Rows written by another process never pass through this process's on_commit hooks
+        profile = UserProfile.objects.create(user=self.user)
+        FaceEmbedding.objects.create(profile=profile, model_name=face_index.MODEL_NAME, photo_name='elsewhere.jpg',
+                                     vector=self.vectors['blue'].tobytes())
+        self.assertIs(face_index.get_index(), self.index)
+        self.assertEqual(self.matched('blue'), profile.id)
+
+        FaceEmbedding.objects.all().delete()
+        face_index.get_index()
+        self.assertEqual(len(self.index), 0)
+
+
+class PassTokenTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        self.user = User.objects.create_user('holder')
+        UserProfile.objects.create(user=self.user)
+        self.addCleanup(entry_log.get_buffer().flush)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def scan(self, qr_data):
+        return self.client.post('/api/admin/verify-qr/', {'qr_data': qr_data}, format='json')
+
+    def test_issued_token_verifies_offline_and_at_the_gate(self):
+        from . import tokens
+
+        event = Event.objects.create(name='Main Gate', is_persistent=True)
+        user_pass = tokens.create_pass(self.user, event)
+        self.assertEqual(tokens.read(user_pass.qr_code_data), {'p': user_pass.id, 'e': event.id})
+        self.assertEqual(list(PassChange.objects.values_list('kind', 'pass_id')), [('created', user_pass.id)])
+        self.assertEqual(self.scan(user_pass.qr_code_data).status_code, 200)
+
+    def test_forged_tokens_are_refused_without_a_lookup(self):
+        from . import tokens
+
+        user_pass = tokens.create_pass(self.user, Event.objects.create(name='Main Gate', is_persistent=True))
+        forged = user_pass.qr_code_data[:-2] + ('AA' if not user_pass.qr_code_data.endswith('AA') else 'BB')
+        with override_settings(PASS_SIGNING_KEY='another-key'):
+            foreign = tokens.issue(user_pass)
+        for qr_data in (forged, foreign):
+            with self.assertRaises(tokens.InvalidPassToken):
+                tokens.read(qr_data)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.scan(qr_data).status_code, 404)
+            self.assertFalse(any('invitations_pass' in q['sql'] for q in queries))
+
+    def test_dated_passes_expire_after_the_grace_period(self):
+        from . import tokens
+
+        start = timezone.now() - timedelta(hours=30)
+        with override_settings(PASS_TOKEN_GRACE_HOURS=24):
+            user_pass = tokens.create_pass(self.user, Event.objects.create(name='Music Fest', date=start))
+            expires = int(start.timestamp()) + 24 * 3600
+            self.assertEqual(tokens.read(user_pass.qr_code_data, now=expires)['x'], expires)
+            with self.assertRaises(tokens.ExpiredPassToken):
+                tokens.read(user_pass.qr_code_data, now=expires + 1)
+            response = self.scan(user_pass.qr_code_data)
+        self.assertEqual((response.status_code, response.json()['detail']), (403, 'Pass has EXPIRED.'))
+
+    def test_bulk_creation_skips_existing_passes(self):
+        from . import tokens
+
+        event = Event.objects.create(name='Main Gate', is_persistent=True)
+        tokens.create_pass(self.user, event)
+        others = [User.objects.create_user(f'guest{i}') for i in range(3)]
+        created, skipped = tokens.create_passes([self.user, *others], event)
+        self.assertEqual((len(created), skipped), (3, 1))
+        self.assertEqual({tokens.read(p.qr_code_data)['p'] for p in created}, {p.id for p in created})
+        self.assertEqual(PassChange.objects.filter(kind='created', event_id=event.id).count(), 4)
+
+
+class InviteQueueTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, INVITE_EMAIL_RETRY_SECONDS=60,
+                                            INVITE_EMAIL_LEASE_SECONDS=300, INVITE_EMAIL_MAX_ATTEMPTS=2))
+        admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        for i in range(3):
+            User.objects.create_user(f'guest{i}', f'guest{i}@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def invite(self, usernames):
+        return self.client.post('/api/admin/bulk-invite/', {'usernames': usernames, 'event': 'Fest'}, format='json')
+
+    def test_usernames_must_be_a_list_of_strings(self):
+        for usernames in ('guest0', [{'username': 'guest0'}], [['guest0']]):
+            response = self.invite(usernames)
+            self.assertEqual((response.status_code, response.json()),
+                             (400, {"detail": "usernames must be a list of strings."}))
+
+    def test_bulk_invite_queues_one_email_per_new_pass(self):
+        from .models import InviteEmail
+
+        self.invite(['guest0'])
+        response = self.invite(['guest0', 'guest1', 'guest2', 'nobody'])
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual((body['requested'], body['skipped'], body['queued'], body['unknown_usernames']),
+                         (3, 1, 2, ['nobody']))
+        self.assertEqual(InviteEmail.objects.filter(batch_id=body['batch'], status='queued').count(), 2)
+
+    def test_claims_are_leased_until_they_expire(self):
+        from . import invites
+        from .models import InviteEmail
+
+        self.invite(['guest0', 'guest1', 'guest2'])
+        claimed = invites.claim_due(2)
+        self.assertEqual([e.status for e in claimed], ['sending', 'sending'])
+        # A second worker only gets what the first did not lease
+        self.assertEqual(len(invites.claim_due(10)), 1)
+        self.assertEqual(invites.claim_due(10), [])
+
+        # The first worker died: its rows are retaken once the lease runs out
+        InviteEmail.objects.filter(id__in=[e.id for e in claimed]).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual({e.id for e in invites.claim_due(10)}, {e.id for e in claimed})
+
+    def test_delivery_marks_sent_and_backs_off_failures(self):
+        from django.core import mail
+
+        from . import invites, mail_pool
+        from .models import InviteEmail
+
+        self.invite(['guest0', 'guest1', 'guest2'])
+        Pass.objects.filter(user__username='guest2').update(is_active=False)
+        with mock.patch.object(mail_pool, 'send_messages', return_value=[None, 'Connection unexpectedly closed']), \
+                self.assertLogs('invitations.invites', 'WARNING'):
+            self.assertEqual(invites.deliver_due(), {'sent': 1, 'retry': 1, 'failed': 1})
+        emails = {e.user_pass.user.username: e for e in InviteEmail.objects.select_related('user_pass__user')}
+        self.assertEqual(emails['guest0'].status, 'sent')
+        self.assertEqual((emails['guest2'].status, emails['guest2'].last_error),
+                         ('failed', "Pass was revoked before delivery."))
+        retry = emails['guest1']
+        self.assertEqual((retry.status, retry.attempts), ('queued', 1))
+        self.assertGreater(retry.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(invites.deliver_due(), {'sent': 0, 'retry': 0, 'failed': 0})
+
+        InviteEmail.objects.filter(id=retry.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(invites.deliver_due(), {'sent': 1, 'retry': 0, 'failed': 0})
+        self.assertEqual([m.to for m in mail.outbox], [['guest1@example.com']])
+        self.assertEqual(mail.outbox[0].attachments[0][2], 'image/png')
+
+
+class FlakySMTP:
+    noop_code = 250
+
+    def noop(self):
+        return self.noop_code, b''
+
+
+class FlakyBackend(BaseEmailBackend):
+    """Test mail backend whose session can be made to drop or go stale."""
+    opened = 0
+    failures = []  # exceptions raised by the next send_messages() calls
+    sent = []
+
+    def open(self):
+        FlakyBackend.opened += 1
+        self.connection = FlakySMTP()
+
+    def close(self):
+        self.connection = None
+
+    def send_messages(self, messages):
+        if FlakyBackend.failures:
+            raise FlakyBackend.failures.pop(0)
+        FlakyBackend.sent.extend(messages)
+        return len(messages)
+
+
+class MailPoolTests(SimpleTestCase):
+    def setUp(self):
+        FlakyBackend.opened, FlakyBackend.failures, FlakyBackend.sent = 0, [], []
+
+    def pool(self, **options):
+        return mail_pool.MailPool(backend='invitations.tests.FlakyBackend', **options)
+
+    def messages(self, n):
+        return [EmailMessage('Pass', 'Body', 'gate@example.com', [f'guest{i}@example.com']) for i in range(n)]
+
+    def test_connections_are_reused_and_recycled(self):
+        pool = self.pool(size=1, max_messages=2)
+        self.assertEqual(pool.send(self.messages(3)), [None] * 3)
+        self.assertEqual(pool.send(self.messages(1)), [None])
+        self.assertEqual((FlakyBackend.opened, len(FlakyBackend.sent)), (2, 4))
+
+    def test_dropped_session_is_retried_once_on_a_new_connection(self):
+        pool = self.pool(size=1)
+        FlakyBackend.failures = [smtplib.SMTPServerDisconnected('Connection unexpectedly closed')]
+        self.assertEqual(pool.send(self.messages(2)), [None, None])
+        self.assertEqual((FlakyBackend.opened, pool.counters['reconnects']), (2, 1))
+
+        FlakyBackend.failures = [smtplib.SMTPServerDisconnected('gone')] * 2
+        with self.assertLogs('invitations.mail_pool', 'WARNING'):
+            self.assertEqual(pool.send(self.messages(1)), ['gone'])
+
+    def test_rejected_messages_are_not_retried(self):
+        pool = self.pool(size=1)
+        FlakyBackend.failures = [smtplib.SMTPRecipientsRefused({'guest0@example.com': (550, b'No such user')})]
+        errors = pool.send(self.messages(2))
+        self.assertIn('No such user', errors[0])
+        self.assertEqual((errors[1], FlakyBackend.opened, pool.counters['reconnects']), (None, 1, 0))
+
+    def test_idle_connection_is_probed_before_reuse(self):
+        pool = self.pool(size=1, idle_check=0)
+        pool.send(self.messages(1))
+        FlakySMTP.noop_code = 421
+        self.addCleanup(setattr, FlakySMTP, 'noop_code', 250)
+        self.assertEqual(pool.send(self.messages(1)), [None])
+        self.assertEqual((FlakyBackend.opened, pool.counters['stale_connections']), (2, 1))
+
+
+class DuplicatePassMigrationTests(TransactionTestCase):
+    before = [('invitations', '0009_list_filter_indexes')]
+    after = [('invitations', '0010_hot_lookup_indexes')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.apps = executor.loader.project_state(self.before).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged_before_the_constraints(self):
+        OldUser = self.apps.get_model('auth', 'User')
+        OldEvent = self.apps.get_model('invitations', 'Event')
+        OldPass = self.apps.get_model('invitations', 'Pass')
+        OldBatch = self.apps.get_model('invitations', 'InviteBatch')
+        fest, again = OldEvent.objects.create(name='Fest'), OldEvent.objects.create(name='Fest')
+        ana, bo = OldUser.objects.create(username='ana'), OldUser.objects.create(username='bo')
+        kept = OldPass.objects.create(user=ana, event=fest, qr_code_data='ana-1')
+        OldPass.objects.create(user=ana, event=again, qr_code_data='ana-2')
+        OldPass.objects.create(user=bo, event=fest, qr_code_data='bo-1', is_active=False)
+        active = OldPass.objects.create(user=bo, event=again, qr_code_data='bo-2')
+        batch = OldBatch.objects.create(event=again)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        Event, Pass, PassChange, InviteBatch = (apps.get_model('invitations', name)
+                                                for name in ('Event', 'Pass', 'PassChange', 'InviteBatch'))
+
+        self.assertEqual(list(Event.objects.values_list('id', flat=True)), [fest.id])
+        self.assertEqual(InviteBatch.objects.get(id=batch.id).event_id, fest.id)
+        # One pass per person, an active one where there was any
+        self.assertEqual(sorted(Pass.objects.values_list('id', flat=True)), sorted([kept.id, active.id]))
+        # Only the active pass that was dropped has to reach offline gate devices
+        self.assertEqual(list(PassChange.objects.values_list('kind', 'payload_hash')),
+                         [('revoked', hashlib.sha256(b'ana-2').hexdigest())])
+
+
+class GateStatsStreamTests(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, gate_stats, '_stats', gate_stats._stats)
+        gate_stats._stats = None
+        self.enterContext(override_settings(GATE_STATS_PUSH_SECONDS=0, GATE_STATS_KEEPALIVE_SECONDS=60,
+                                            GATE_STATS_STREAM_SECONDS=5))
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+
+    def stream(self, **params):
+        return self.client.get('/api/admin/gate-stats/stream/', params)
+
+    def test_only_staff_may_subscribe(self):
+        from rest_framework.authtoken.models import Token
+
+        self.assertEqual(self.stream().status_code, 403)
+        self.assertEqual(self.stream(token='not-a-token').status_code, 401)
+        student = Token.objects.create(user=User.objects.create_user('student'))
+        self.assertEqual(self.stream(token=student.key).status_code, 403)
+
+    def test_counters_are_pushed_when_they_change(self):
+        from rest_framework.authtoken.models import Token
+
+        response = self.stream(token=Token.objects.create(user=self.admin).key)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks), b'retry: 0\n\n')
+
+        def event():
+            lines = dict(line.split(': ', 1) for line in next(chunks).decode().strip().split('\n'))
+            self.assertEqual(lines['event'], 'stats')
+            return json.loads(lines['data'])
+
+        first = event()
+        self.assertEqual(first['gates'], {})
+        gate_stats.observe('qr', 'north', 200, {}, 0.01)
+        gate_stats.observe('qr', 'north', 403, {"valid": False}, 0.01)
+        second = event()
+        self.assertGreater(second['version'], first['version'])
+        self.assertEqual((second['gates']['north']['accepted'], second['gates']['north']['rejected']), (1, 1))
+        response.close()
+
+
+class MetricsTests(TestCase):
+    def test_histograms_render_cumulative_buckets(self):
+        registry = metrics.Registry()
+        registry.histogram('scan_seconds', 'Scan time.', (0.1, 1.0))
+        for value in (0.05, 0.5, 3.0):
+            registry.observe('scan_seconds', value, gate='north "A"')
+        lines = registry.render().splitlines()
+        self.assertEqual(lines[:2], ['# HELP scan_seconds Scan time.', '# TYPE scan_seconds histogram'])
+        self.assertEqual(lines[2:], [
+            'scan_seconds_bucket{gate="north \\"A\\"",le="0.1"} 1',
+            'scan_seconds_bucket{gate="north \\"A\\"",le="1.0"} 2',
+            'scan_seconds_bucket{gate="north \\"A\\"",le="+Inf"} 3',
+            'scan_seconds_sum{gate="north \\"A\\""} 3.55',
+            'scan_seconds_count{gate="north \\"A\\""} 3',
+        ])
+
+    def test_endpoint_is_admin_only_and_reports_requests(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('student'))
+        self.assertEqual(client.get('/api/admin/metrics/').status_code, 403)
+
+        client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', None))
+        client.get('/api/admin/metrics/')
+        response = client.get('/api/admin/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'http_request_duration_seconds_count\{endpoint="metrics",method="GET",status="200"\} [1-9]')
+        self.assertRegex(body, r'http_request_db_queries_count\{endpoint="metrics"\} [1-9]')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', None))
+        event = Event.objects.create(name='Music Fest')
+        other = Event.objects.create(name='Main Gate Access')
+        for username in ('alice', '=HYPERLINK("http://evil")'):
+            user = User.objects.create_user(username, f'{len(username)}@example.com')
+            Pass.objects.create(user=user, event=event, qr_code_data=f'qr-{user.id}')
+        Pass.objects.create(user=user, event=other, qr_code_data='qr-main')
+
+    def export(self, path, **params):
+        response = self.client.get(f'/api/admin/export/{path}', params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_streams_in_chunks_and_neutralises_formulas(self):
+        with override_settings(EXPORT_CHUNK_SIZE=1):
+            response, body = self.export('passes.csv', event=Event.objects.get(name='Music Fest').id)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="passes.csv"')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row['username'] for row in rows], ['alice', '\'=HYPERLINK("http://evil")'])
+        self.assertEqual({row['event'] for row in rows}, {'Music Fest'})
+
+    def test_jsonl_keeps_values_as_stored(self):
+        response, body = self.export('passes.jsonl', active='true')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1]['username'], '=HYPERLINK("http://evil")')
+        self.assertIs(rows[0]['is_active'], True)
+
+    def test_unknown_exports_and_bad_filters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/admin/export/secrets.csv').status_code, 404)
+        self.assertEqual(self.client.get('/api/admin/export/passes.xlsx').status_code, 404)
+        self.assertEqual(self.client.get('/api/admin/export/entries.csv', {'since': 'yesterday'}).status_code, 400)
@@ -0,0 +1,122 @@
+"""
+Signed, self-verifying pass tokens.
+
+A token is ``P1:`` followed by a django.core.signing payload (HMAC-SHA256)
+over the pass id, event id and optional expiry. Anything holding
+PASS_SIGNING_KEY, the server or a gate device configured out-of-band, can
+check authenticity and expiry with no database or network call. Revocations
+and suspensions still need the delta list from /api/admin/pass-changes/
+or the per-event feed at /api/admin/sync/.
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+
+PREFIX = 'P1:'
+SALT = 'invitations.pass-token'
+PENDING_PREFIX = 'pending-' # placeholder qr_code_data while create_pass is mid-way
+
+
+class InvalidPassToken(Exception):
+    pass
+
+
+class ExpiredPassToken(InvalidPassToken):
+    pass
+
+
+def _key():
+    return getattr(settings, 'PASS_SIGNING_KEY', None) or settings.SECRET_KEY
+
+
+def expiry_for(event):
+    """Unix time after which passes for ``event`` stop validating, or None for persistent/undated events."""
+    if event.is_persistent or not event.date:
+        return None
+    grace = getattr(settings, 'PASS_TOKEN_GRACE_HOURS', 24)
+    return int(event.date.timestamp() + grace * 3600)
+
+
+def issue(user_pass):
+    claims = {'p': user_pass.id, 'e': user_pass.event_id}
+    expires = expiry_for(user_pass.event)
+    if expires is not None:
+        claims['x'] = expires
+    return PREFIX + signing.dumps(claims, key=_key(), salt=SALT, compress=True)
+
+
+def create_pass(user, event):
+    """Create a Pass whose qr_code_data is a signed token (the token needs the pass id, hence two writes)."""
+    from .models import Pass
+
+    with transaction.atomic():
+        new_pass = Pass.objects.create(user=user, event=event, qr_code_data=PENDING_PREFIX + uuid.uuid4().hex)
+        new_pass.qr_code_data = issue(new_pass)
+        new_pass.save(update_fields=['qr_code_data'])
+    return new_pass
+
+
+def create_passes(users, event, batch_size=500):
+    """
+    Bulk version of create_pass for users without a pass for ``event`` yet:
+    placeholders are bulk-inserted, then swapped for tokens in one bulk update.
+    bulk_create skips signals, so the 'created' PassChange rows are written
+    here. Returns (new passes, number of users skipped).
+    """
+    from .models import Pass, PassChange
+
+    existing = set(Pass.objects.filter(event=event).values_list('user_id', flat=True))
+    new = [Pass(user=user, event=event, qr_code_data=PENDING_PREFIX + uuid.uuid4().hex)
+           for user in users if user.id not in existing]
+    skipped = len(users) - len(new)
+    with transaction.atomic():
+        created = Pass.objects.bulk_create(new, batch_size=batch_size)
+        if any(p.pk is None for p in created):
+            # Backends that can't return ids from bulk inserts: look them up by placeholder
+            ids = dict(Pass.objects.filter(qr_code_data__in=[p.qr_code_data for p in created])
+                       .values_list('qr_code_data', 'id'))
+            for p in created:
+                p.pk = ids[p.qr_code_data]
+        for p in created:
+            p.qr_code_data = issue(p)
+        Pass.objects.bulk_update(created, ['qr_code_data'], batch_size=batch_size)
+        PassChange.objects.bulk_create([
+            PassChange(kind='created', pass_id=p.id, event_id=event.id, user_id=p.user_id,
+                       payload_hash=payload_hash(p.qr_code_data))
+            for p in created
+        ], batch_size=batch_size)
+    return created, skipped
+
+
+def is_pending(qr_data):
+    return bool(qr_data) and qr_data.startswith(PENDING_PREFIX)
+
+
+def payload_hash(qr_data):
+    """sha256 hex of a QR payload; what offline gate devices key passes by."""
+    return hashlib.sha256(qr_data.encode()).hexdigest()
+
+
+def is_token(qr_data):
+    return qr_data.startswith(PREFIX)
+
+
+def read(qr_data, now=None):
+    """
+    Verify a token and return its claims ({'p': pass id, 'e': event id, 'x': expiry}).
+    Raises InvalidPassToken for forged/garbled tokens and ExpiredPassToken once past expiry.
+    """
+    if not is_token(qr_data):
+        raise InvalidPassToken("Not a signed pass token.")
+    try:
+        claims = signing.loads(qr_data[len(PREFIX):], key=_key(), salt=SALT)
+    except signing.BadSignature:
+        raise InvalidPassToken("Pass signature is invalid.")
+    expires = claims.get('x')
+    if expires is not None and (now if now is not None else time.time()) > expires:
+        raise ExpiredPassToken("Pass has expired.")
+    return claims
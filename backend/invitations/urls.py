@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework.authtoken import views as auth_views
-from .views import RegisterView, MyQRCodeView, generate_invite, UserListView, revoke_invite, verify_qr, suspend_user, EventListView, delete_user, UserDetailView, face_recognize, ComplaintListCreateView, delete_complaint
+from .views import RegisterView, MyQRCodeView, MyQRImageView, generate_invite, bulk_invite, invite_batch_progress, import_users, UserListView, revoke_invite, verify_qr, pass_changes, offline_sync_view, EntryLogListView, upload_entries, export_data, gate_stats_view, gate_stats_stream, suspend_user, EventListView, delete_user, UserDetailView, face_recognize, face_recognize_group, metrics_view, face_worker_stats, ComplaintListCreateView, delete_complaint
+from . import async_views
+
+# Scanner-facing endpoints as async views when served through asgi.py (see async_views.py)
+async_gate = getattr(settings, 'ASYNC_GATE_VIEWS', False)
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
@@ -8,13 +13,27 @@ urlpatterns = [
     path('me/', UserDetailView.as_view(), name='user-detail'),
     path('events/', EventListView.as_view(), name='event-list'),
     path('login/', auth_views.obtain_auth_token, name='api_token_auth'),
-    path('my-qr/', MyQRCodeView.as_view(), name='my-qr'),
+    path('my-qr/', async_views.my_qr if async_gate else MyQRCodeView.as_view(), name='my-qr'),
+    path('my-qr/<int:pass_id>/image.<str:fmt>', MyQRImageView.as_view(), name='my-qr-image'),
     path('admin/generate-invite/', generate_invite, name='generate-invite'),
+    path('admin/bulk-invite/', bulk_invite, name='bulk-invite'),
+    path('admin/invite-batches/<int:batch_id>/', invite_batch_progress, name='invite-batch-progress'),
+    path('admin/import-users/', import_users, name='import-users'),
     path('admin/revoke-invite/', revoke_invite, name='revoke-invite'),
-    path('admin/verify-qr/', verify_qr, name='verify-qr'),
+    path('admin/verify-qr/', async_views.verify_qr if async_gate else verify_qr, name='verify-qr'),
+    path('admin/pass-changes/', pass_changes, name='pass-changes'),
+    path('admin/sync/', offline_sync_view, name='offline-sync'),
+    path('admin/entries/', EntryLogListView.as_view(), name='entry-list'),
+    path('admin/entries/upload/', upload_entries, name='upload-entries'),
+    path('admin/export/<str:dataset>.<str:fmt>', export_data, name='export'),
+    path('admin/gate-stats/', gate_stats_view, name='gate-stats'),
+    path('admin/gate-stats/stream/', gate_stats_stream, name='gate-stats-stream'),
     path('admin/suspend-user/', suspend_user, name='suspend-user'),
     path('admin/delete-user/', delete_user, name='delete-user'),
-    path('admin/face-recognize/', face_recognize, name='face-recognize'),
+    path('admin/face-recognize/', async_views.face_recognize if async_gate else face_recognize, name='face-recognize'),
+    path('admin/face-recognize-group/', face_recognize_group, name='face-recognize-group'),
+    path('admin/face-worker-stats/', face_worker_stats, name='face-worker-stats'),
+    path('admin/metrics/', metrics_view, name='metrics'),
     path('complaints/', ComplaintListCreateView.as_view(), name='complaint-list-create'),
     path('admin/delete-complaint/', delete_complaint, name='delete-complaint'),
 ]
@@ -0,0 +1,312 @@
+"""
+Bulk user registration from CSV or JSONL files sent in by colleges.
+
+``import_users()`` reads rows one at a time, so a file of any size is
+parsed in constant memory. Columns (CSV header or JSON keys): username
+(required), email, password, role, student_type, college_name, student_id
+and photo, the name of an image inside an optional zip archive.
+
+Valid rows are inserted ``batch_size`` at a time: one transaction per
+batch bulk-creates the User rows and then their UserProfile rows. Password
+hashing (PBKDF2, deliberately slow) dominates an import, so each batch is
+hashed across a process pool first ('manage.py import_users'; the admin
+endpoint hashes in its own process). Rows without a password get an
+unusable one. Photos are stored like uploaded profile photos and embedded in batches
+through embed_images(). bulk_create skips the post_save enrollment signal,
+so the embeddings are stored directly.
+
+A bad row never aborts the import. ``import_users()`` yields events as
+plain dicts that the command prints and the admin endpoint streams as
+NDJSON:
+
+    {"type": "error", "line": 12, "username": "...", "errors": {"field": ["..."]}}
+    {"type": "warning", "line": 40, "username": "...", "detail": "..."}    user created, photo not enrolled
+    {"type": "progress", "rows": 500, "created": 498, "failed": 2}
+    {"type": "end", "rows": ..., "created": ..., "failed": ..., "enrolled": ..., "seconds": ...}
+"""
+import csv
+import io
+import json
+import logging
+import os
+import posixpath
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from .models import UserProfile
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl')
+ENROLL_CHUNK = 16  # photos per embed_images() call
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict or None if unparseable) from a binary file object."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Extra cells land under the None key; missing ones are None
+            yield reader.line_num, {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+class PhotoArchive:
+    """Zip of profile photos, looked up by member path or, when unambiguous, bare file name."""
+
+    def __init__(self, fileobj):
+        self.zip = zipfile.ZipFile(fileobj)
+        self.members = {}
+        basenames = {}
+        for info in self.zip.infolist():
+            if info.is_dir():
+                continue
+            self.members[info.filename] = info
+            basenames.setdefault(posixpath.basename(info.filename), []).append(info)
+        for name, infos in basenames.items():
+            if len(infos) == 1:
+                self.members.setdefault(name, infos[0])
+
+    def find(self, name):
+        return self.members.get(name.replace('\\', '/'))
+
+    def read(self, info):
+        return self.zip.read(info)
+
+
+def _hash_passwords(passwords):
+    from django.contrib.auth.hashers import make_password
+
+    return [make_password(password or None) for password in passwords]
+
+
+def _pool_init():
+    # Needed with the spawn/forkserver start methods; a no-op in forked children
+    import django
+    django.setup()
+
+
+class Row:
+    def __init__(self, line, username, email, password, profile, photo):
+        self.line = line
+        self.username = username
+        self.email = email
+        self.password = password
+        self.profile = profile  # UserProfile field values
+        self.photo = photo  # zipfile.ZipInfo or None
+        self.user = None
+        self.created_profile = None
+
+
+def _text(row, key, default=''):
+    value = row.get(key)
+    return default if value is None else str(value).strip()
+
+
+def clean_row(line, row, photos):
+    """Returns (Row, None) or (None, {field: [messages]})."""
+    errors = {}
+    username = _text(row, 'username')
+    email = _text(row, 'email')
+    profile = {
+        'role': _text(row, 'role') or 'student',
+        'student_type': _text(row, 'student_type') or 'internal',
+        'college_name': _text(row, 'college_name') or None,
+        'student_id': _text(row, 'student_id') or None,
+    }
+    for instance, exclude in ((User(username=username, email=email), ['password']),
+                              (UserProfile(**profile), ['user', 'photo'])):
+        try:
+            instance.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+        except ValidationError as e:
+            errors.update(e.message_dict)
+
+    photo = None
+    name = _text(row, 'photo')
+    if name:
+        max_bytes = getattr(settings, 'USER_IMPORT_MAX_PHOTO_BYTES', 10 * 1024 * 1024)
+        if photos is None:
+            errors['photo'] = ["No photo archive was uploaded."]
+        elif (photo := photos.find(name)) is None:
+            errors['photo'] = [f"{name} is not in the photo archive."]
+        elif photo.file_size > max_bytes:
+            errors['photo'] = [f"{name} is larger than {max_bytes} bytes."]
+    if errors:
+        return None, errors
+    return Row(line, username, email, _text(row, 'password'), profile, photo), None
+
+
+def _error(line, username, errors):
+    return {"type": "error", "line": line, "username": username, "errors": errors}
+
+
+class Importer:
+    def __init__(self, photos=None, batch_size=None, processes=None, enroll=True):
+        self.photos = photos
+        self.batch_size = batch_size or getattr(settings, 'USER_IMPORT_BATCH_SIZE', 500)
+        self.processes = processes or getattr(settings, 'USER_IMPORT_PROCESSES', None) or os.cpu_count() or 1
+        self.enroll = enroll
+        self.pool = None  # started on the first batch that needs it
+        self.counts = {'rows': 0, 'created': 0, 'failed': 0, 'enrolled': 0}
+
+    def hash_passwords(self, passwords):
+        if self.processes <= 1 or len(passwords) <= 1:
+            return _hash_passwords(passwords)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, initializer=_pool_init)
+        size = -(-len(passwords) // self.processes)
+        chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        return [hashed for chunk in self.pool.map(_hash_passwords, chunks) for hashed in chunk]
+
+    def run(self, rows):
+        started = time.perf_counter()
+        try:
+            seen, batch = set(), []
+            for line, row in rows:
+                self.counts['rows'] += 1
+                if row is None:
+                    self.counts['failed'] += 1
+                    yield _error(line, None, {"row": ["Not a valid row."]})
+                    continue
+                cleaned, errors = clean_row(line, row, self.photos)
+                if cleaned is not None and cleaned.username in seen:
+                    cleaned, errors = None, {"username": ["Duplicate username earlier in this file."]}
+                if cleaned is None:
+                    self.counts['failed'] += 1
+                    yield _error(line, row.get('username'), errors)
+                    continue
+                seen.add(cleaned.username)
+                batch.append(cleaned)
+                if len(batch) >= self.batch_size:
+                    yield from self.insert(batch)
+                    batch = []
+            if batch:
+                yield from self.insert(batch)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+        yield {"type": "end", **self.counts, "seconds": round(time.perf_counter() - started, 2)}
+
+    def insert(self, batch):
+        existing = set(User.objects.filter(username__in=[r.username for r in batch]).values_list('username', flat=True))
+        rows = []
+        for r in batch:
+            if r.username in existing:
+                self.counts['failed'] += 1
+                yield _error(r.line, r.username, {"username": ["A user with that username already exists."]})
+            else:
+                rows.append(r)
+
+        for r, hashed in zip(rows, self.hash_passwords([r.password for r in rows])):
+            r.user = User(username=r.username, email=r.email, password=hashed)
+        created = []
+        try:
+            self.store_photos(rows)
+            try:
+                with transaction.atomic():
+                    self.create(rows)
+                created = rows
+            except IntegrityError:
+                # A username was registered concurrently; fall back to row by row to find it
+                for r in rows:
+                    try:
+                        with transaction.atomic():
+                            self.create([r])
+                        created.append(r)
+                    except IntegrityError:
+                        self.counts['failed'] += 1
+                        yield _error(r.line, r.username, {"username": ["A user with that username already exists."]})
+        finally:
+            # Photos are stored before the insert; any row that did not make it, whatever
+            # stopped it (a database error, the client going away mid-stream), leaves one behind
+            inserted = {id(r) for r in created}
+            for r in rows:
+                if id(r) not in inserted and r.profile.get('photo'):
+                    default_storage.delete(r.profile['photo'])
+        self.counts['created'] += len(created)
+
+        if self.enroll:
+            yield from self.enroll_photos([r for r in created if r.photo is not None])
+        yield {"type": "progress", "rows": self.counts['rows'], "created": self.counts['created'],
+               "failed": self.counts['failed']}
+
+    def store_photos(self, rows):
+        photo_field = UserProfile._meta.get_field('photo')
+        for r in rows:
+            if r.photo is not None:
+                name = photo_field.generate_filename(None, posixpath.basename(r.photo.filename))
+                r.profile['photo'] = default_storage.save(name, ContentFile(self.photos.read(r.photo)))
+
+    def create(self, rows):
+        User.objects.bulk_create([r.user for r in rows])
+        # Not every backend returns primary keys from a bulk insert
+        ids = dict(User.objects.filter(username__in=[r.username for r in rows]).values_list('username', 'id'))
+        profiles = [UserProfile(user_id=ids[r.username], **r.profile) for r in rows]
+        UserProfile.objects.bulk_create(profiles)
+        ids = dict(UserProfile.objects.filter(user_id__in=ids.values()).values_list('user_id', 'id'))
+        for r, profile in zip(rows, profiles):
+            profile.id = ids[profile.user_id]
+            r.created_profile = profile
+
+    def embed(self, chunk):
+        """(row, vector or None, problem) per row; one undecodable photo must not fail the whole chunk."""
+        from .face_worker import embed_images
+
+        try:
+            results = embed_images([self.photos.read(r.photo) for r in chunk])
+        except Exception as e:
+            if len(chunk) > 1:
+                return [outcome for r in chunk for outcome in self.embed([r])]
+            logger.warning("Face enrollment of %s during user import failed: %s", chunk[0].username, e)
+            return [(chunk[0], None, f"Photo not enrolled ({e}); run 'manage.py enroll_faces' later.")]
+        return [(r, found[0], None) if len(found) else
+                (r, None, "No face detected in the photo; user created without face enrollment.")
+                for r, (found, _) in zip(chunk, results)]
+
+    def enroll_photos(self, rows):
+        from .face_index import enroll_vectors
+
+        for start in range(0, len(rows), ENROLL_CHUNK):
+            enrolled, vectors = [], []
+            for r, vector, problem in self.embed(rows[start:start + ENROLL_CHUNK]):
+                if problem:
+                    yield {"type": "warning", "line": r.line, "username": r.username, "detail": problem}
+                else:
+                    enrolled.append(r.created_profile)
+                    vectors.append(vector)
+            enroll_vectors(enrolled, vectors)
+            self.counts['enrolled'] += len(enrolled)
+
+
+def import_users(stream, fmt='csv', photos=None, **options):
+    """
+    Import users from a binary file object; ``photos`` is an optional zip
+    file object. Yields the events described in the module docstring.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}.")
+    archive = PhotoArchive(photos) if photos is not None else None
+    return Importer(archive, **options).run(read_rows(stream, fmt))
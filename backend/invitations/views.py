@@ -2,19 +2,33 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed, ParseError
 from django.contrib.auth import get_user_model
-from .models import Pass, Event, UserProfile
-from .serializers import UserSerializer, PassSerializer, EventSerializer
+from .models import Pass, PassChange, Event, UserProfile, InviteBatch, EntryLog
+from .serializers import UserSerializer, PassSerializer, EventSerializer, EntryLogSerializer
+from .pagination import IdCursorPagination, NewestFirstCursorPagination
 from django.conf import settings
-import qrcode
-import io
-from django.core.mail import EmailMultiAlternatives
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
-from deepface import DeepFace
-import tempfile
-import os
-import pandas as pd
+from asgiref.sync import sync_to_async
+from . import exports, gate_stats, invites, mail_pool, metrics, offline_sync, pass_cache, qr_images, scans, suspensions, tokens, user_import
+from .face_index import get_index
+from .face_worker import FaceWorkerError, embed_image, embed_images, get_client
+import numpy as np
+import asyncio
+import json
+import logging
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -23,15 +37,65 @@ class RegisterView(generics.CreateAPIView):
     permission_classes = (permissions.AllowAny,)
     serializer_class = UserSerializer
 
+def flag_param(value):
+    # ?suspended=true/false; None when absent or unrecognised
+    if value is None:
+        return None
+    value = value.lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    return None
+
+def id_param(params, name):
+    # ?event=<id> and the like; None when absent, ValueError when not an integer
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer.")
+
+def filter_users(users, params):
+    # Filters: ?role= &student_type= &suspended=true|false &event=<id> (holds an active pass)
+    # &search=<prefix of username or college name>
+    for field in ('role', 'student_type'):
+        if params.get(field):
+            users = users.filter(**{f"profile__{field}": params[field]})
+    suspended = flag_param(params.get('suspended'))
+    if suspended is not None:
+        users = users.filter(profile__is_suspended=True) if suspended else users.exclude(profile__is_suspended=True)
+    event_id = id_param(params, 'event')
+    if event_id is not None:
+        users = users.filter(id__in=Pass.objects.filter(event_id=event_id, is_active=True).values('user_id'))
+    if params.get('search'):
+        # Case-sensitive prefix match so it stays an index range scan
+        search = params['search']
+        users = users.filter(Q(username__startswith=search) | Q(profile__college_name__startswith=search))
+    return users
+
 class UserListView(generics.ListAPIView):
-    queryset = User.objects.all()
+    # Profile joined and passes+events prefetched: two queries however many users are listed
+    queryset = User.objects.select_related('profile').prefetch_related(
+        Prefetch('passes', queryset=Pass.objects.select_related('event').only('id', 'user_id', 'event__name'))
+    )
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        try:
+            return filter_users(super().get_queryset(), self.request.query_params)
+        except ValueError as e:
+            raise ParseError(str(e))
 
 class EventListView(generics.ListCreateAPIView):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = IdCursorPagination
 
 class UserDetailView(generics.RetrieveAPIView):
     serializer_class = UserSerializer
@@ -50,6 +114,31 @@ class MyQRCodeView(APIView):
             return Response(PassSerializer(user_passes, many=True).data)
         return Response({"detail": "No active pass found."}, status=status.HTTP_404_NOT_FOUND)
 
+class MyQRImageView(APIView):
+    # Rendered QR image for one of the user's passes (staff may fetch any pass).
+    # Images are content-addressed by payload, so clients may cache them forever.
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pass_id, fmt):
+        if fmt not in qr_images.CONTENT_TYPES:
+            return Response({"detail": "Format must be png or svg."}, status=status.HTTP_404_NOT_FOUND)
+        passes = Pass.objects.filter(id=pass_id, is_active=True)
+        if not request.user.is_staff:
+            passes = passes.filter(user=request.user)
+        qr_data = passes.values_list('qr_code_data', flat=True).first()
+        if qr_data is None:
+            return Response({"detail": "No active pass found."}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = f'"{qr_images.image_key(qr_data, fmt)}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            content, _ = qr_images.get_image(qr_data, fmt)
+            response = HttpResponse(content, content_type=qr_images.CONTENT_TYPES[fmt])
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAdminUser])
 def generate_invite(request):
@@ -68,37 +157,91 @@ def generate_invite(request):
     if Pass.objects.filter(user=user, event=event).exists():
         return Response({"detail": f"Pass already exists for {user.username} in {event.name}."}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Generate QR Data
-    qr_data = f"EVENT_{event.id}_USER_{user.id}_{user.username}"
-    
-    # Generate QR Image
-    qr = qrcode.QRCode(version=1, box_size=10, border=4)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save Pass
-    new_pass = Pass.objects.create(user=user, event=event, qr_code_data=qr_data)
-    
-    # Send Email
-    subject = f'Your Pass for {event.name}'
-    message = f'Hi {user.username}, here is your entry pass for {event.name}.'
-    email_from = settings.EMAIL_HOST_USER if hasattr(settings, 'EMAIL_HOST_USER') else 'admin@hackathon.com'
-    recipient_list = [user.email]
-    
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-
+    # Save Pass; its QR data is a signed token gates can check offline
     try:
-        email = EmailMultiAlternatives(subject, message, email_from, recipient_list)
-        email.attach(f'pass_{user.username}.png', buffer.getvalue(), 'image/png')
-        email.send()
-    except Exception as e:
-        print(f"Email failed: {e}")
+        new_pass = tokens.create_pass(user, event)
+    except IntegrityError:
+        # A concurrent request created it first (one pass per user and event)
+        return Response({"detail": f"Pass already exists for {user.username} in {event.name}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Send Email with the QR image attached, over a pooled connection (no new SMTP/TLS handshake per invite)
+    error = mail_pool.send_messages([invites.build_pass_email(new_pass)])[0]
+    if error:
+        logger.warning("Pass email for %s failed: %s", user.username, error)
     
     return Response(PassSerializer(new_pass).data, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def bulk_invite(request):
+    # Create passes for many users at once and queue their emails for 'manage.py send_invites'.
+    # Select users with "usernames": [...] and/or the filters role, student_type, college_name.
+    usernames = request.data.get('usernames')
+    filters = {f"profile__{key}": request.data[key] for key in ('role', 'student_type', 'college_name')
+               if request.data.get(key)}
+    if usernames is not None and not (isinstance(usernames, list) and all(isinstance(u, str) for u in usernames)):
+        # They are hashed into a set below; a dict or list in there would be a TypeError
+        return Response({"detail": "usernames must be a list of strings."}, status=status.HTTP_400_BAD_REQUEST)
+    if not usernames and not filters:
+        return Response({"detail": "Provide usernames or at least one of role, student_type, college_name."},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    event_name = request.data.get('event', 'Hackathon 2026')
+    event, _ = Event.objects.get_or_create(name=event_name)
+
+    users = User.objects.filter(**filters)
+    if usernames:
+        users = users.filter(username__in=usernames)
+    users = list(users.only('id'))
+    missing = []
+    if usernames:
+        found = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        missing = sorted(set(usernames) - found)
+
+    try:
+        with transaction.atomic():
+            new_passes, skipped = tokens.create_passes(users, event)
+            batch = InviteBatch.objects.create(event=event, created_by=request.user, requested=len(users), skipped=skipped)
+            invites.queue_emails(batch, new_passes)
+    except IntegrityError:
+        return Response({"detail": "Passes for some of these users were created concurrently; retry the request."},
+                        status=status.HTTP_409_CONFLICT)
+
+    body = invites.batch_progress(batch)
+    body["unknown_usernames"] = missing
+    return Response(body, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def invite_batch_progress(request, batch_id):
+    try:
+        batch = InviteBatch.objects.select_related('event').get(id=batch_id)
+    except InviteBatch.DoesNotExist:
+        return Response({"detail": "Invite batch not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(invites.batch_progress(batch))
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def import_users(request):
+    # Multipart upload: "file" (CSV or JSONL, see user_import.py), optional "photos" zip and
+    # "format". Streams NDJSON events as batches complete: per-row errors, progress, summary.
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"detail": "Upload the registrant file as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+    fmt = request.data.get('format') or user_import.guess_format(upload.name)
+    try:
+        # No process pool here: forking a threaded web worker mid-request is unsafe, and the
+        # pool would outlive an aborted stream. Large files go through 'manage.py import_users'.
+        events = user_import.import_users(upload, fmt, request.FILES.get('photos'), processes=1)
+    except ValueError as e:  # unknown format
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except zipfile.BadZipFile:
+        return Response({"detail": "photos must be a zip archive."}, status=status.HTTP_400_BAD_REQUEST)
+    lines = (json.dumps(event, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n' for event in events)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-store'
+    return response
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAdminUser])
 def revoke_invite(request):
@@ -161,125 +304,387 @@ def delete_user(request):
 @api_view(['POST'])
 # Allow Coordinators too (assumed staff or specific permission)
 @permission_classes([permissions.IsAuthenticated]) 
+@gate_stats.track('qr')
 def verify_qr(request):
     if not request.user.is_staff: # Simple coordinator check
          return Response({"detail": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
 
     qr_data = request.data.get('qr_data')
-    if not qr_data:
-        return Response({"detail": "QR Data is required."}, status=status.HTTP_400_BAD_REQUEST)
-        
+    refused = scans.check_qr(qr_data)
+    if refused:
+        return scan_response(refused)
+
     try:
-        user_pass = Pass.objects.get(qr_code_data=qr_data)
-        
-        # Check suspension
-        if hasattr(user_pass.user, 'profile') and user_pass.user.profile.is_suspended:
-             # Check if timed suspension has expired
-             if user_pass.user.profile.suspension_end_date and timezone.now() > user_pass.user.profile.suspension_end_date:
-                 # Auto-unsuspend
-                 user_pass.user.profile.is_suspended = False
-                 user_pass.user.profile.suspension_end_date = None
-                 user_pass.user.profile.save()
-                 # Allow through (fall through to success response)
-             else:
-                 return Response({"valid": False, "detail": "User is SUSPENDED."}, status=status.HTTP_403_FORBIDDEN)
-
-        serialized = PassSerializer(user_pass)
-        
-        # Get extra user details
-        profile = user_pass.user.profile if hasattr(user_pass.user, 'profile') else None
-        user_details = {
-            "name": user_pass.user.username,
-            "role": profile.role if profile else "Unknown",
-            "photo_url": profile.photo.url if profile and profile.photo else None
-        }
-
-        return Response({
-            "valid": True, 
-            "message": f"ACCESS GRANTED: {user_pass.user.username} ({user_pass.event.name})",
-            "data": serialized.data,
-            "user_details": user_details
-        }, status=status.HTTP_200_OK)
+        # Served from the verification cache; only a miss touches the database
+        entry = pass_cache.load(qr_data)
     except Pass.DoesNotExist:
-        return Response({"valid": False, "detail": "Invalid QR Code."}, status=status.HTTP_404_NOT_FOUND)
+        return scan_response(scans.INVALID_QR)
+    return scan_response(scans.admit_pass(entry, suspensions.get_blocked(), gate=request.data.get('gate'),
+                                          coordinator_id=request.user.id))
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def pass_changes(request):
+    # Revocation/suspension delta list for gate devices validating signed passes offline.
+    # Pass ?since=<cursor> from the previous response to get only newer changes.
+    try:
+        since = int(request.query_params.get('since', 0))
+    except ValueError:
+        return Response({"detail": "since must be an integer cursor."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = getattr(settings, 'PASS_CHANGES_PAGE_SIZE', 1000)
+    changes = list(PassChange.objects.filter(id__gt=since).order_by('id').values(
+        'id', 'kind', 'pass_id', 'event_id', 'user_id', 'payload_hash', 'suspension_end_date', 'created_at')[:limit + 1])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    # Held back behind changes that may still be committing (see offline_sync.py)
+    cursor = offline_sync.next_cursor(since, changes[-1]['id']) if changes else since
+    return Response({
+        "cursor": cursor,
+        # An unsettled page is fetched again on the next regular poll, not at once
+        "has_more": has_more and cursor == changes[-1]['id'],
+        "changes": changes,
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def offline_sync_view(request):
+    # Gate devices: without ?cursor= streams an NDJSON snapshot of the event's active passes;
+    # with ?cursor= returns only changes since then. See offline_sync.py.
+    try:
+        event = Event.objects.get(id=request.query_params.get('event'))
+    except (Event.DoesNotExist, ValueError, TypeError):
+        return Response({"detail": "A valid event id is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    cursor = request.query_params.get('cursor')
+    if cursor is None:
+        response = StreamingHttpResponse(offline_sync.stream_snapshot(event, request.build_absolute_uri),
+                                         content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    try:
+        since = int(cursor)
+    except ValueError:
+        return Response({"detail": "cursor must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = getattr(settings, 'PASS_CHANGES_PAGE_SIZE', 1000)
+    changes, cursor, has_more = offline_sync.changes_since(event, since, limit, request.build_absolute_uri)
+    return Response({"event": event.id, "cursor": cursor, "has_more": has_more, "changes": changes})
+
+class EntryLogListView(generics.ListAPIView):
+    # Gate entries, newest first. Filters: ?event=<id> &gate= &user=<id>
+    serializer_class = EntryLogSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = NewestFirstCursorPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        entries = EntryLog.objects.select_related('user', 'event', 'coordinator')
+        try:
+            for field in ('event', 'user'):
+                value = id_param(params, field)
+                if value is not None:
+                    entries = entries.filter(**{f"{field}_id": value})
+        except ValueError as e:
+            raise ParseError(str(e))
+        if params.get('gate'):
+            entries = entries.filter(gate=params['gate'])
+        return entries
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def upload_entries(request):
+    # Batch upload from gate devices that verified passes offline (see offline_sync.py):
+    # {"gate": "...", "entries": [{"pass_id": 1, "method": "qr", "scanned_at": "<ISO 8601>"}, ...]}
+    items = request.data.get('entries')
+    if not isinstance(items, list) or not items:
+        return Response({"detail": "entries must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+    max_items = getattr(settings, 'ENTRY_UPLOAD_MAX', 5000)
+    if len(items) > max_items:
+        return Response({"detail": f"At most {max_items} entries per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+    passes = Pass.objects.only('id', 'user_id', 'event_id').in_bulk(
+        [item.get('pass_id') for item in items if isinstance(item, dict) and isinstance(item.get('pass_id'), int)])
+    rows, rejected = [], []
+    for position, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        user_pass = passes.get(item.get('pass_id'))
+        scanned_at = parse_datetime(item.get('scanned_at') or '') if isinstance(item.get('scanned_at'), str) else None
+        method = item.get('method', 'qr')
+        if user_pass is None or scanned_at is None or method not in ('qr', 'face'):
+            rejected.append(position)
+            continue
+        if timezone.is_naive(scanned_at):
+            scanned_at = timezone.make_aware(scanned_at)
+        rows.append(EntryLog(user_id=user_pass.user_id, user_pass_id=user_pass.id, event_id=user_pass.event_id,
+                             gate=str(item.get('gate') or request.data.get('gate') or '')[:50], method=method,
+                             coordinator_id=request.user.id, created_at=scanned_at))
+    EntryLog.objects.bulk_create(rows, batch_size=500)
+    for row in rows:
+        gate_stats.entered(row.event_id, row.user_id)
+    return Response({"accepted": len(rows), "rejected": rejected}, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_data(request, dataset, fmt):
+    # Streaming downloads, e.g. /api/admin/export/passes.csv?event=3 (see exports.py). Filters:
+    # users as in /api/users/; passes ?event= &active=; complaints ?status=; entries ?event= &gate= &since= &until=
+    if dataset not in exports.COLUMNS or fmt not in exports.CONTENT_TYPES:
+        return Response({"detail": f"Unknown export; use one of {', '.join(exports.COLUMNS)} as csv or jsonl."},
+                        status=status.HTTP_404_NOT_FOUND)
+    params = request.query_params
+    try:
+        if dataset == 'users':
+            rows = filter_users(User.objects.all(), params)
+        elif dataset == 'passes':
+            rows = Pass.objects.all()
+            if params.get('event'):
+                rows = rows.filter(event_id=params['event'])
+            active = flag_param(params.get('active'))
+            if active is not None:
+                rows = rows.filter(is_active=active)
+        elif dataset == 'complaints':
+            rows = Complaint.objects.all()
+            if params.get('status'):
+                rows = rows.filter(status=params['status'])
+        else:
+            rows = EntryLog.objects.all()
+            if params.get('event'):
+                rows = rows.filter(event_id=params['event'])
+            if params.get('gate'):
+                rows = rows.filter(gate=params['gate'])
+            for param, lookup in (('since', 'created_at__gte'), ('until', 'created_at__lt')):
+                if params.get(param):
+                    moment = parse_datetime(params[param])
+                    if moment is None:
+                        raise ValueError(f"{param} must be an ISO 8601 datetime.")
+                    rows = rows.filter(**{lookup: moment})
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    response = StreamingHttpResponse(exports.stream(rows, dataset, fmt, request.build_absolute_uri, chunk_size),
+                                     content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def gate_stats_view(request):
+    return Response(gate_stats.snapshot())
+
+def gate_stats_stream(request):
+    # Server-sent events for the coordinator dashboard: the counters from /api/admin/gate-stats/,
+    # pushed whenever they change. EventSource cannot set headers, so besides the session
+    # cookie a token is accepted as ?token=. Plain Django view: DRF content negotiation
+    # would refuse Accept: text/event-stream.
+    user = request.user
+    if request.GET.get('token'):
+        try:
+            user, _ = TokenAuthentication().authenticate_credentials(request.GET['token'])
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if not (user.is_authenticated and user.is_staff):
+        return JsonResponse({"detail": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
+
+    push_seconds = getattr(settings, 'GATE_STATS_PUSH_SECONDS', 1.0)
+    keepalive_seconds = getattr(settings, 'GATE_STATS_KEEPALIVE_SECONDS', 15)
+    # Streams end after this long and EventSource reconnects, so a worker is never held forever
+    stream_seconds = getattr(settings, 'GATE_STATS_STREAM_SECONDS', 300)
+
+    def event(data):
+        return f"id: {data['version']}\nevent: stats\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+    if isinstance(request, ASGIRequest):
+        # Under ASGI the stream waits on the event loop instead of holding a thread
+        async def events():
+            stats = gate_stats.get_stats()
+            started = last_sent = time.monotonic()
+            version = None
+            yield f"retry: {int(push_seconds * 1000)}\n\n"
+            while time.monotonic() - started < stream_seconds:
+                if stats.version != version:
+                    data = await sync_to_async(gate_stats.snapshot)()
+                    version = data['version']
+                    last_sent = time.monotonic()
+                    yield event(data)
+                elif time.monotonic() - last_sent >= keepalive_seconds:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                await asyncio.sleep(push_seconds)
+    else:
+        # Under WSGI each open stream holds a worker thread; run it under ASGI (see asgi.py) for many dashboards
+        def events():
+            stats = gate_stats.get_stats()
+            started = last_sent = time.monotonic()
+            version = None
+            yield f"retry: {int(push_seconds * 1000)}\n\n"
+            while time.monotonic() - started < stream_seconds:
+                if stats.version != version:
+                    data = gate_stats.snapshot()
+                    version = data['version']
+                    last_sent = time.monotonic()
+                    yield event(data)
+                elif time.monotonic() - last_sent >= keepalive_seconds:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                stats.wait_for_change(version, min(keepalive_seconds, max(0, started + stream_seconds - time.monotonic())))
+                time.sleep(push_seconds)  # coalesce bursts of scans into one push
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx would otherwise buffer the stream
+    return response
+
+def scan_response(outcome):
+    return Response(outcome.body, status=outcome.status, headers=outcome.headers)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated]) 
+@gate_stats.track('face')
 def face_recognize(request):
     if 'image' not in request.FILES:
         return Response({"detail": "Image required."}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Save uploaded file to temp
     img_file = request.FILES['image']
-    fd, tmp_path = tempfile.mkstemp(suffix=".jpg")
-    os.close(fd) # Close the file descriptor immediately so other processes can read it
     
     try:
-        with open(tmp_path, 'wb') as f:
-            for chunk in img_file.chunks():
-                f.write(chunk)
+        index = get_index()
+        if len(index) == 0:
+             return scan_response(scans.NO_FACES_ENROLLED)
 
-        # DB Path: where user photos are
-        db_path = os.path.join(settings.MEDIA_ROOT, 'profile_photos')
-        
-        # Check if db_path exists and has images
-        if not os.path.exists(db_path) or not os.listdir(db_path):
-             return Response({"detail": "No registered users with photos found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Run Face Search
-        # silent=True suppresses some logs
         try:
-            results = DeepFace.find(img_path=tmp_path, db_path=db_path, enforce_detection=False, model_name="VGG-Face", silent=True)
+            embedding = embed_image(img_file.read())
         except ValueError:
             # DeepFace raises ValueError if no face detected even with enforce_detection=False sometimes
-             return Response({"detail": "No face detected in the image."}, status=status.HTTP_400_BAD_REQUEST)
+             return scan_response(scans.NO_FACE_DETECTED)
+        except FaceWorkerError as e:
+             return scan_response(scans.worker_error(e))
 
-        # DeepFace.find returns a list of DataFrames
-        if len(results) > 0 and not results[0].empty:
-            df = results[0]
-            # Get best match
-            matched_path = df.iloc[0]['identity']
-            
-            # Extract filename to match against DB
-            filename = os.path.basename(matched_path)
-            
-            try:
-                # Find the user profile that uses this photo
-                # Use Q objects if needed, but icontains is a good heuristic for standard file uploads
-                profile = UserProfile.objects.get(photo__icontains=filename) 
-                user = profile.user
-                
-                # Check for Pass
-                passes = Pass.objects.filter(user=user, is_active=True)
-                pass_info = [p.event.name for p in passes]
-
-                return Response({
-                    "valid": True,
-                    "message": f"IDENTIFIED: {user.username}",
-                    "user_details": {
-                        "name": user.username,
-                        "role": profile.role,
-                        "student_type": profile.student_type,
-                        "college_name": profile.college_name,
-                        "photo_url": profile.photo.url,
-                        "passes": pass_info
-                    }
-                })
-
-            except UserProfile.DoesNotExist:
-                 return Response({"detail": f"Face matched ({filename}) but User record not found."}, status=status.HTTP_404_NOT_FOUND)
-            except Exception as e:
-                 return Response({"detail": f"Error linking face to user: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                 
-        return Response({"detail": "No match found in database."}, status=status.HTTP_404_NOT_FOUND)
+        with metrics.timed('search'):
+            hit = index.match(embedding)
+        if hit is None:
+            return scan_response(scans.NO_MATCH)
+
+        profile_id, distance = hit
+        try:
+            profile = UserProfile.objects.select_related('user').get(id=profile_id)
+        except UserProfile.DoesNotExist:
+             return scan_response(scans.profile_missing(profile_id))
+
+        passes = list(Pass.objects.filter(user_id=profile.user_id, is_active=True).select_related('event'))
+        return scan_response(scans.admit_face(profile, distance, passes, suspensions.get_blocked(),
+                                              event_id=request.data.get('event') or None,
+                                              gate=request.data.get('gate'), coordinator_id=request.user.id))
 
     except Exception as e:
-        print(f"Face Recog Error: {e}")
+        logger.exception("Face recognition failed")
         return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    finally:
-        # Cleanup
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated]) 
+@gate_stats.track('face_group', outcomes=lambda response: [
+    not person["suspended"] and person["already_entered_seconds_ago"] is None for person in response.data["identified"]])
+def face_recognize_group(request):
+    # Group entry: one frame with several faces ('image') and/or several frames ('images')
+    if not request.user.is_staff:  # every identified person is logged as an entry, so coordinators only
+        return Response({"detail": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
+    frames = request.FILES.getlist('images') + request.FILES.getlist('image')
+    if not frames:
+        return Response({"detail": "At least one image is required."}, status=status.HTTP_400_BAD_REQUEST)
+    max_frames = getattr(settings, 'FACE_GROUP_MAX_FRAMES', 8)
+    if len(frames) > max_frames:
+        return Response({"detail": f"At most {max_frames} images per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+    index = get_index()
+    if len(index) == 0:
+        return scan_response(scans.NO_FACES_ENROLLED)
+
+    try:
+        # Detection runs once per frame; every detected face shares one forward pass
+        embedded = embed_images([f.read() for f in frames], all_faces=True)
+    except ValueError:
+        # An upload that is not an image
+        return Response({"detail": "Could not decode the images."}, status=status.HTTP_400_BAD_REQUEST)
+    except FaceWorkerError as e:
+        return scan_response(scans.worker_error(e))
+
+    faces = [(frame_no, area) for frame_no, (_, areas) in enumerate(embedded) for area in areas]
+    if not faces:
+        return Response({"detail": "No face detected in the images."}, status=status.HTTP_400_BAD_REQUEST)
+    vectors = np.concatenate([vectors for vectors, _ in embedded if len(vectors)])
+    with metrics.timed('search'):
+        hits = index.match_batch(vectors)
+
+    # The same person may appear in several frames; keep their closest match
+    best = {}
+    unidentified = []
+    for (frame_no, area), hit in zip(faces, hits):
+        if hit is None:
+            unidentified.append({"frame": frame_no, "facial_area": area})
+        elif hit[0] not in best or hit[1] < best[hit[0]][0]:
+            best[hit[0]] = (hit[1], frame_no, area)
+
+    profiles = UserProfile.objects.select_related('user').in_bulk(list(best))
+    passes_by_user = {}
+    for p in Pass.objects.filter(user_id__in=[p.user_id for p in profiles.values()], is_active=True).select_related('event'):
+        passes_by_user.setdefault(p.user_id, []).append(p)
+
+    event_id = request.data.get('event') or None
+    blocked = suspensions.get_blocked()
+    identified = []
+    for profile_id, (distance, frame_no, area) in sorted(best.items(), key=lambda item: item[1][0]):
+        profile = profiles.get(profile_id)
+        if profile is None:
+            # Deleted since the index was loaded
+            unidentified.append({"frame": frame_no, "facial_area": area})
+            continue
+        user_passes = passes_by_user.get(profile.user_id, [])
+        event_pass = scans.event_pass(user_passes, event_id)
+        # Everyone identified is logged unless suspended or refused by anti-passback; both are flagged per person
+        suspended, seconds = scans.admit(profile.user_id, 'face', blocked,
+                                         event_id=event_pass.event_id if event_pass else None,
+                                         pass_id=event_pass.id if event_pass else None,
+                                         gate=request.data.get('gate'), coordinator_id=request.user.id)
+        identified.append({
+            "frame": frame_no,
+            "facial_area": area,
+            "distance": distance,
+            "user_details": {
+                "name": profile.user.username,
+                "role": profile.role,
+                "student_type": profile.student_type,
+                "college_name": profile.college_name,
+                "photo_url": profile.photo.url if profile.photo else None,
+            },
+            "passes": PassSerializer(user_passes, many=True).data,
+            "suspended": suspended,
+            "already_entered_seconds_ago": int(seconds) if seconds is not None else None,
+        })
+
+    return Response({
+        "faces_detected": len(faces),
+        "identified": identified,
+        "unidentified": unidentified,
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def metrics_view(request):
+    # Prometheus text format; scrape with an admin token (authorization: {type: Token, credentials: ...})
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def face_worker_stats(request):
+    # Admission queue depth and per-batch latency, for sizing the worker at peak entry times
+    client = get_client()
+    if client is None:
+        return Response({"detail": "Face worker not configured; inference runs in-process."}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        return Response(client.stats())
+    except FaceWorkerError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
 from .models import Complaint
 from .serializers import ComplaintSerializer
@@ -288,6 +693,7 @@ class ComplaintListCreateView(generics.ListCreateAPIView):
     queryset = Complaint.objects.all().order_by('-created_at')
     serializer_class = ComplaintSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NewestFirstCursorPagination
 
     def perform_create(self, serializer):
         # Determine accused user from username provided
@@ -300,9 +706,13 @@ class ComplaintListCreateView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         # Admins see all, others only see what they filed (or nothing if we want strict privacy)
-        if self.request.user.is_staff:
-            return Complaint.objects.all().order_by('-created_at')
-        return Complaint.objects.filter(reporter=self.request.user).order_by('-created_at')
+        complaints = Complaint.objects.select_related('reporter', 'user__profile').prefetch_related(
+            Prefetch('user__passes', queryset=Pass.objects.select_related('event').only('id', 'user_id', 'event__name')))
+        if not self.request.user.is_staff:
+            complaints = complaints.filter(reporter=self.request.user)
+        if self.request.query_params.get('status'):
+            complaints = complaints.filter(status=self.request.query_params['status'])
+        return complaints
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAdminUser])
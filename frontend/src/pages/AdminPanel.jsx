@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import api from '../api';
 import { useNavigate } from 'react-router-dom';
 
@@ -14,22 +14,79 @@ function AdminPanel() {
   const [complaints, setComplaints] = useState([]);
   const [activeTab, setActiveTab] = useState('invitations'); // 'invitations' or 'complaints'
 
+  // Lists are cursor-paginated server-side; `next` is the URL of the following page (null on the last one)
+  const [usersNext, setUsersNext] = useState(null);
+  const [complaintsNext, setComplaintsNext] = useState(null);
+
+  const [roleFilter, setRoleFilter] = useState('all');
+  const [collegeFilter, setCollegeFilter] = useState('all');
+  const [search, setSearch] = useState('');
+
+  const userParams = () => {
+    const params = { page_size: 50 };
+    if (roleFilter !== 'all') params.role = roleFilter;
+    if (collegeFilter !== 'all') params.student_type = collegeFilter;
+    if (search.trim()) params.search = search.trim();
+    return params;
+  };
+
+  // Events are few; follow every page so the dropdown has all of them
+  const fetchAllPages = async (url) => {
+    let results = [];
+    let next = url;
+    while (next) {
+      const res = await api.get(next);
+      results = results.concat(res.data.results);
+      next = res.data.next;
+    }
+    return results;
+  };
+
   useEffect(() => {
     fetchData();
   }, []);
 
+  // Filters are applied by the server; refetch the first page whenever they change
+  const filtersChanged = useRef(false);
+  useEffect(() => {
+    if (!filtersChanged.current) {
+      filtersChanged.current = true; // initial page comes from fetchData
+      return;
+    }
+    const timer = setTimeout(() => fetchUsers(), 300);
+    return () => clearTimeout(timer);
+  }, [roleFilter, collegeFilter, search]);
+
+  const fetchUsers = async (nextUrl = null) => {
+    try {
+      const res = nextUrl ? await api.get(nextUrl) : await api.get('users/', { params: userParams() });
+      setUsers(prev => nextUrl ? [...prev, ...res.data.results] : res.data.results);
+      setUsersNext(res.data.next);
+    } catch (err) {
+      console.error("Failed to fetch users", err);
+    }
+  };
+
+  const fetchComplaints = async (nextUrl = null) => {
+    try {
+      const res = await api.get(nextUrl || 'complaints/');
+      setComplaints(prev => nextUrl ? [...prev, ...res.data.results] : res.data.results);
+      setComplaintsNext(res.data.next);
+    } catch (err) {
+      console.error("Failed to fetch complaints", err);
+    }
+  };
+
   const fetchData = async () => {
     try {
       setLoading(true);
-      const [usersRes, eventsRes, complaintsRes] = await Promise.all([
-          api.get('users/'),
-          api.get('events/'),
-          api.get('complaints/')
+      const [allEvents] = await Promise.all([
+          fetchAllPages('events/'),
+          fetchUsers(),
+          fetchComplaints()
       ]);
-      setUsers(usersRes.data);
-      setEvents(eventsRes.data);
-      setComplaints(complaintsRes.data);
-      if (eventsRes.data.length > 0 && !selectedEvent) setSelectedEvent(eventsRes.data[0].name);
+      setEvents(allEvents);
+      if (allEvents.length > 0 && !selectedEvent) setSelectedEvent(allEvents[0].name);
       setLoading(false);
     } catch (err) {
       console.error("Failed to fetch data", err);
@@ -78,21 +135,6 @@ function AdminPanel() {
     fetchData(); 
   };
 
-  const [roleFilter, setRoleFilter] = useState('all');
-  const [collegeFilter, setCollegeFilter] = useState('all');
-
-  const getFilteredUsers = () => {
-    return users.filter(user => {
-      if (roleFilter !== 'all' && user.role !== roleFilter) return false;
-      
-      if (collegeFilter !== 'all') {
-         const type = user.student_type || 'internal';
-         if (collegeFilter !== type) return false;
-      }
-      return true;
-    });
-  };
-
   const handleSuspend = async (username, currentStatus) => {
     const action = currentStatus ? 'unsuspend' : 'suspend';
     let duration = null;
@@ -176,6 +218,15 @@ function AdminPanel() {
                 <option value="external">Other Colleges (External)</option>
             </select>
         </div>
+        <div style={{ flex: 1, minWidth: '200px' }}>
+            <label style={{ display: 'block', marginBottom: '5px' }}>Search:</label>
+            <input 
+                value={search} 
+                onChange={(e) => setSearch(e.target.value)}
+                placeholder="Username or college starts with..."
+                style={{ width: '100%', padding: '10px', boxSizing: 'border-box' }}
+            />
+        </div>
         <button onClick={handleBulkInvite} style={{ background: '#28a745', height: '42px' }}>
             Invite Selected ({selectedUsers.length})
         </button>
@@ -222,7 +273,7 @@ function AdminPanel() {
               </tr>
             </thead>
             <tbody>
-              {getFilteredUsers().map(user => {
+              {users.map(user => {
                 const hasPass = user.pass_event_names && user.pass_event_names.includes(selectedEvent);
                 return (
                 <tr key={user.id} style={{ borderBottom: '1px solid #444', background: user.is_suspended ? 'rgba(255,0,0,0.1)' : 'transparent' }}>
@@ -308,6 +359,11 @@ function AdminPanel() {
             </tbody>
           </table>
         )}
+        {usersNext && (
+            <button onClick={() => fetchUsers(usersNext)} style={{ marginTop: '15px', background: '#444' }}>
+                Load more users
+            </button>
+        )}
       </div>
       </>
       )}
@@ -377,6 +433,11 @@ function AdminPanel() {
                  ))}
              </div>
          )}
+         {complaintsNext && (
+             <button onClick={() => fetchComplaints(complaintsNext)} style={{ marginTop: '15px', background: '#444' }}>
+                 Load more complaints
+             </button>
+         )}
       </div>
       )}
     </div>